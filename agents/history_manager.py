@@ -0,0 +1,102 @@
+import asyncio
+import json
+import logging
+import re
+from typing import Dict, List, Set
+
+from langchain.prompts import PromptTemplate
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from agents.session_registry import ChatSession
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+_HTML_TAG_PATTERN = re.compile(r"<[^>]+>")
+
+
+class HistoryManager:
+    """管理對話歷史的長度：保留最近 N 輪原文，較舊的對話壓縮成滾動摘要
+
+    - keyword_view：給關鍵字提取用的輕量版本，只含最近幾句用戶發言
+    - response_view：給回應生成用，包含摘要與最近 N 輪完整對話
+    - schedule_summary：回應送出後於背景更新摘要，不佔用本輪延遲
+    """
+
+    def __init__(self, llm, window_turns: int = 6, summarize_every: int = 4, keyword_turns: int = 3):
+        self.llm = llm
+        self.window_turns = window_turns
+        self.summarize_every = summarize_every
+        self.keyword_turns = keyword_turns
+        self.summary_prompt = PromptTemplate(
+            input_variables=["summary", "turns"],
+            template="""
+                    你是對話摘要助手。請將「既有摘要」與「新的對話」合併成一段新的摘要，供電商客服助手延續對話使用。
+
+                    既有摘要：{summary}
+                    新的對話：{turns}
+
+                    指令：
+                    - 保留用戶的商品需求、品牌、預算、數量、平台偏好與已推薦過的商品。
+                    - 省略寒暄與格式化的 HTML 內容。
+                    - 以 150 字以內的繁體中文回傳摘要，無需多餘解釋。
+                    """
+        )
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _plain(text: str) -> str:
+        return re.sub(r"\s+", " ", _HTML_TAG_PATTERN.sub(" ", text)).strip()
+
+    def keyword_view(self, chat_history: List[Dict[str, str]], summary: str = "") -> str:
+        """關鍵字提取用的歷史：摘要加上最近幾句用戶發言，不含助手的 HTML 回覆"""
+        view = {"recent_user_messages": [turn["user"] for turn in chat_history[-self.keyword_turns:]]}
+        if summary:
+            view["summary"] = summary
+        return json.dumps(view, ensure_ascii=False)
+
+    def response_view(self, chat_history: List[Dict[str, str]], summary: str = "") -> str:
+        """回應生成用的歷史：摘要加上最近 N 輪原文"""
+        view = {"recent_turns": chat_history[-self.window_turns:]}
+        if summary:
+            view["summary"] = summary
+        return json.dumps(view, ensure_ascii=False)
+
+    def needs_summary(self, session: ChatSession) -> bool:
+        return len(session.chat_history) >= self.window_turns + self.summarize_every
+
+    async def summarize(self, session: ChatSession):
+        """把超出視窗的舊對話併入摘要，並從歷史中移除"""
+        if session.summarizing or not self.needs_summary(session):
+            return
+        session.summarizing = True
+        try:
+            cut = len(session.chat_history) - self.window_turns
+            old_turns = [
+                {"user": turn["user"], "assistant": self._plain(turn["assistant"])}
+                for turn in session.chat_history[:cut]
+            ]
+            messages = [
+                SystemMessage(content=self.summary_prompt.format(
+                    summary=session.history_summary or "（無）",
+                    turns=json.dumps(old_turns, ensure_ascii=False)
+                )),
+                HumanMessage(content="請更新摘要")
+            ]
+            with span("llm_call", purpose="summary"):
+                response = await self.llm.ainvoke(messages)
+            session.history_summary = str(response.content).strip()
+            # 歷史只會在尾端新增，因此前 cut 筆仍是剛才摘要的那些對話
+            del session.chat_history[:cut]
+        except Exception as e:
+            logger.warning(f"對話摘要更新失敗：{e}")
+        finally:
+            session.summarizing = False
+
+    def schedule_summary(self, session: ChatSession):
+        """在目前事件迴圈排程背景摘要（於回應送出後執行）"""
+        if session.summarizing or not self.needs_summary(session):
+            return
+        task = asyncio.get_running_loop().create_task(self.summarize(session))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple, TypedDict
+
+logger = logging.getLogger(__name__)
+
+# 商品標題與搜尋紀錄的來源資料庫
+DEFAULT_DB_PATH = os.environ.get("PRODUCT_DB_PATH", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "products.db"
+))
+
+# 出現這些詞才會觸發爬蟲（與 check_data_needed 的判斷規則一致）
+SEARCH_CUES = ["找", "買", "搜尋", "商品", "價格", "比價", "推薦", "便宜", "划算", "優惠", "折扣", "特價"]
+
+# 表示需要參考上下文的詞，交給 LLM 結合對話歷史判斷
+CONTEXT_CUES = ["再", "也", "剛剛", "剛才", "上面", "這個", "那個", "這款", "那款", "第一個", "第二個", "其他", "別的", "一樣"]
+
+# 只描述規格或偏好的詞；有對話歷史時，單獨出現多半是在修飾上一輪的商品（「我想買無線的」）
+MODIFIER_TERMS = {
+    "無線", "有線", "藍牙", "電競", "靜音", "防水", "迷你", "攜帶", "輕量", "大容量", "小容量", "快充",
+    "大包", "小包", "大瓶", "小瓶", "大的", "小的", "便宜", "平價", "高級", "黑色", "白色", "紅色", "藍色",
+    "粉色", "灰色", "綠色", "透明", "兒童", "成人", "男用", "女用", "無香", "抗菌", "加厚", "超薄",
+}
+# 有對話歷史時，只有一個不超過這個長度的商品詞，交由 LLM 結合上下文判斷
+SHORT_TERM_LEN = 2
+# 統計中的 n-gram 與搜尋詞上限；超過時所有次數減半並移除歸零者，詞典隨之重建
+MAX_NGRAMS = int(os.environ.get("INTENT_MAX_NGRAMS", 200000))
+
+# 與商品本身無關的語句，提取關鍵字時略過
+FILLER_PHRASES = [
+    "找找看", "看看", "我想買", "我要買", "想要買", "我想找", "我要找", "幫我找", "幫我搜尋", "幫我比價", "幫我推薦", "幫忙找",
+    "有沒有", "有推薦", "推薦一下", "找一下", "搜尋一下", "比價一下", "哪裡買", "多少錢", "請問", "可以",
+    "便宜的", "划算的", "好用的", "推薦的", "特價的", "優惠的", "一些", "一個", "一下", "什麼", "哪些",
+    "一台", "一支", "一隻", "一雙", "一款", "一套", "一件", "一把", "幾款", "東西",
+    "想買", "想找", "要買", "要找", "幫我", "比價", "推薦", "價格", "商品", "搜尋", "便宜", "划算", "優惠",
+    "折扣", "特價", "我想", "我要", "想要", "需要", "給我",
+    "找", "買", "我", "想", "要", "的", "嗎", "呢", "吧", "啊", "喔", "哦", "呀", "啦", "請", "幫", "有", "些", "個",
+]
+
+# 預算敘述不屬於搜尋關鍵字（例如「預算1000元以內」「500塊左右」）
+_BUDGET_PATTERN = re.compile(r"(預算|價位|價格)?\s*(約|大約)?\s*\d+(\.\d+)?\s*(元|塊|k|K)\s*(以內|以下|以上|左右|上下)?")
+# 規格數量視為關鍵字的一部分（例如「3入」「100抽」「12包」）
+_SPEC_PATTERN = re.compile(r"\d+\s*(入|包|抽|組|個|件|罐|瓶|片|捲|卷|盒|雙|公斤|kg|ml|g|吋|寸)")
+_ASCII_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-\+\.]*")
+_CJK_RUN_PATTERN = re.compile(r"[\u4e00-\u9fff]+")
+_STOP_CHARS = set("的了是我你他她在和與及或就都也很最更嗎呢吧啊喔請買找")
+
+
+def normalize_query(query: str) -> str:
+    """正規化搜尋關鍵字以便比較：全形轉半形、忽略大小寫、空白與詞序"""
+    text = unicodedata.normalize("NFKC", query).lower()
+    return " ".join(sorted(set(text.split())))
+
+
+class IntentResult(TypedDict):
+    intent: str  # "search"：商品搜尋；"chat"：一般對話
+    query: str  # 提取出的商品關鍵字（一般對話時為空字串）
+    confidence: float  # 0~1，低於門檻時交由 LLM 判斷
+    tokens: List[str]
+
+
+class IntentClassifier:
+    """本地、可重現的意圖分類與關鍵字提取（LLM 之前的快速路徑）
+
+    以資料庫中既有的商品標題與搜尋關鍵字建立詞典 trie，
+    用正向最大匹配切分用戶輸入，判斷意圖並取出商品短語。
+    n-gram 與搜尋詞的統計以 max_ngrams 為上限，長時間執行的服務不會無限成長。
+    """
+
+    def __init__(self, db_path: str = None, min_count: int = 3, max_term_len: int = 6,
+                 max_ngrams: int = MAX_NGRAMS):
+        self.min_count = min_count
+        self.max_term_len = max_term_len
+        self.max_ngrams = max_ngrams
+        self._trie: Dict = self._new_trie()
+        self._ngram_counts: Counter = Counter()
+        self._query_terms: Counter = Counter()  # 搜尋過的關鍵字，出現一次即為商品詞
+        self._learn_lock = threading.Lock()  # learn 在背景執行緒進行，同時只有一個在更新統計
+        self._tasks: Set[asyncio.Future] = set()
+        self._load_from_db(db_path or DEFAULT_DB_PATH)
+
+    # ---------- 詞典 ----------
+
+    @staticmethod
+    def _new_trie() -> Dict:
+        trie: Dict = {}
+        for phrase in FILLER_PHRASES:
+            IntentClassifier._insert_into(trie, phrase, "filler")
+        return trie
+
+    @staticmethod
+    def _insert_into(trie: Dict, term: str, kind: str):
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        # 商品詞優先於填充詞（例如品名中剛好包含「買」）
+        if node.get("$") != "term":
+            node["$"] = kind
+
+    def _insert(self, term: str, kind: str):
+        self._insert_into(self._trie, term, kind)
+
+    def add_term(self, term: str):
+        """加入一個商品詞（例如成功搜尋過的關鍵字）"""
+        for part in term.split():
+            if _CJK_RUN_PATTERN.fullmatch(part):
+                self._query_terms[part] += 1
+                self._insert(part, "term")
+
+    def _count_ngrams(self, title: str):
+        """統計標題中的中文 n-gram，出現次數達門檻即加入詞典"""
+        seen = set()
+        for run in _CJK_RUN_PATTERN.findall(title):
+            for n in range(2, min(self.max_term_len, len(run)) + 1):
+                for i in range(len(run) - n + 1):
+                    gram = run[i:i + n]
+                    if gram[0] in _STOP_CHARS or gram[-1] in _STOP_CHARS:
+                        continue
+                    seen.add(gram)
+        for gram in seen:
+            self._ngram_counts[gram] += 1
+            if self._ngram_counts[gram] == self.min_count:
+                self._insert(gram, "term")
+
+    def _prune(self):
+        """統計超過上限時，次數反覆減半並移除歸零者，直到剩一半以下，再以剩下的詞重建詞典
+
+        新詞典建好後才替換，切詞時不會讀到建到一半的 trie。
+        """
+        if len(self._ngram_counts) + len(self._query_terms) <= self.max_ngrams:
+            return
+        while len(self._ngram_counts) + len(self._query_terms) > self.max_ngrams // 2:
+            for counts in (self._ngram_counts, self._query_terms):
+                for term, count in list(counts.items()):
+                    if count // 2:
+                        counts[term] = count // 2
+                    else:
+                        del counts[term]
+        trie = self._new_trie()
+        for gram, count in self._ngram_counts.items():
+            if count >= self.min_count:
+                self._insert_into(trie, gram, "term")
+        for term in self._query_terms:
+            self._insert_into(trie, term, "term")
+        self._trie = trie
+
+    def learn(self, titles: Iterable[str], query: str = ""):
+        """從新的爬蟲結果擴充詞典（純 CPU 計算，事件迴圈中請改用 schedule_learn）"""
+        with self._learn_lock:
+            if query:
+                self.add_term(query)
+            for title in titles:
+                self._count_ngrams(title)
+            self._prune()
+
+    def schedule_learn(self, titles: Iterable[str], query: str = ""):
+        """在背景執行緒執行 learn，不佔用事件迴圈與本輪回應的時間（須在事件迴圈中呼叫）"""
+        task = asyncio.ensure_future(asyncio.to_thread(self.learn, titles, query))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _load_from_db(self, db_path: str):
+        if not os.path.exists(db_path):
+            return
+        try:
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+            try:
+                rows = conn.execute("SELECT title, query FROM products").fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"無法從 {db_path} 載入詞典：{e}")
+            return
+        queries = set()
+        for title, query in rows:
+            self._count_ngrams(title)
+            queries.add(query)
+        for query in queries:
+            self.add_term(query)
+        self._prune()
+
+    # ---------- 切詞與分類 ----------
+
+    def tokenize(self, text: str) -> List[Tuple[str, str]]:
+        """正向最大匹配切詞，回傳 (詞, 類型) 列表；類型為 term/filler/spec/ascii/unknown"""
+        tokens = []
+        i = 0
+        while i < len(text):
+            char = text[i]
+            if not char.isalnum():
+                i += 1
+                continue
+            spec = _SPEC_PATTERN.match(text, i)
+            if spec:
+                tokens.append((spec.group(0).replace(" ", ""), "spec"))
+                i = spec.end()
+                continue
+            ascii_word = _ASCII_PATTERN.match(text, i)
+            if ascii_word:
+                tokens.append((ascii_word.group(0), "ascii"))
+                i = ascii_word.end()
+                continue
+            node, j, match_end, match_kind = self._trie, i, -1, None
+            while j < len(text) and text[j] in node:
+                node = node[text[j]]
+                j += 1
+                if "$" in node:
+                    match_end, match_kind = j, node["$"]
+            if match_end > 0:
+                tokens.append((text[i:match_end], match_kind))
+                i = match_end
+            else:
+                tokens.append((char, "unknown"))
+                i += 1
+        return tokens
+
+    def classify(self, user_input: str, chat_history: Optional[List[Dict[str, str]]] = None) -> IntentResult:
+        """分類意圖並提取關鍵字；有對話歷史時，只有修飾詞或單一短詞的關鍵字會降低信心"""
+        text = user_input.strip().lower()
+        if not any(cue in text for cue in SEARCH_CUES):
+            # 沒有搜尋意圖的詞時不會觸發爬蟲，與 LLM 的結果無關
+            return IntentResult(intent="chat", query="", confidence=1.0, tokens=[])
+
+        tokens = self.tokenize(_BUDGET_PATTERN.sub(" ", user_input.strip()))
+        product_tokens = [token for token, kind in tokens if kind in ("term", "spec", "ascii")]
+        unknown_chars = sum(len(token) for token, kind in tokens if kind == "unknown")
+        covered_chars = sum(len(token) for token in product_tokens)
+
+        if not any(kind == "term" or kind == "ascii" for _, kind in tokens):
+            # 有搜尋意圖但找不到商品詞，例如「打遊戲的東西」，需要 LLM 推斷
+            return IntentResult(intent="search", query="", confidence=0.2, tokens=product_tokens)
+
+        coverage = covered_chars / (covered_chars + unknown_chars)
+        confidence = 0.5 + 0.5 * coverage
+        phrases = self._merge_adjacent(tokens)
+        if any(cue in text for cue in CONTEXT_CUES):
+            confidence = min(confidence, 0.4)  # 需要參考對話歷史
+        elif chat_history and self._is_modifier_only(phrases):
+            confidence = min(confidence, 0.4)  # 可能是在修飾上一輪的商品
+        return IntentResult(
+            intent="search",
+            query=" ".join(phrases),
+            confidence=round(confidence, 3),
+            tokens=product_tokens
+        )
+
+    @staticmethod
+    def _is_modifier_only(phrases: List[str]) -> bool:
+        if not phrases:
+            return False
+        if len(phrases) == 1 and len(phrases[0]) <= SHORT_TERM_LEN:
+            return True
+        return all(phrase in MODIFIER_TERMS for phrase in phrases)
+
+    @staticmethod
+    def _merge_adjacent(tokens: List[Tuple[str, str]]) -> List[str]:
+        """把連續的中文商品詞合併成短語（例如「無線」「滑鼠」→「無線滑鼠」）
+
+        只由一個詞典外單字構成的短語（例如「找找看」剩下的「看」）不列入關鍵字。
+        """
+        phrases, current, current_kinds = [], "", set()
+
+        def flush():
+            if current and not (len(current) == 1 and current_kinds == {"unknown"}):
+                phrases.append(current)
+
+        for token, kind in tokens:
+            if kind == "term" or kind == "unknown":
+                current += token
+                current_kinds.add(kind)
+                continue
+            flush()
+            current, current_kinds = "", set()
+            if kind in ("spec", "ascii"):
+                phrases.append(token)
+        flush()
+        return phrases
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import re
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from langchain.prompts import PromptTemplate
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+_JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.S)
+
+
+class KeywordBatchError(Exception):
+    """批次回應中缺少某筆結果或無法解析，呼叫端應改用單筆提取"""
+
+
+class _PendingBatch:
+    def __init__(self):
+        self.items: List[Dict[str, str]] = []
+        self.futures: List[asyncio.Future] = []
+        self.first_at = time.monotonic()
+        self.wakeup = asyncio.Event()
+
+
+class KeywordBatcher:
+    """把同一時間多個 session 的關鍵字提取請求合併成一次 LLM 呼叫
+
+    - 收到請求後等待 window_ms；期間每有新請求就重新計時
+    - 累積到 max_batch 筆，或最早的請求已等待 max_wait_ms，立即送出
+    - 送出一個多筆的結構化提示詞，模型以 JSON 回傳各筆關鍵字，再分送給等待中的呼叫端
+    """
+
+    def __init__(self, invoke: Callable[[List[BaseMessage]], Awaitable], window_ms: float = 10,
+                 max_batch: int = 16, max_wait_ms: float = 50):
+        self.invoke = invoke
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._pending: Dict[asyncio.AbstractEventLoop, _PendingBatch] = {}
+        self._tasks = set()
+        self.batches = 0
+        self.items = 0
+        self.prompt = PromptTemplate(
+            input_variables=["items"],
+            template="""
+                    你是一個關鍵字提取助手。以下是多筆彼此獨立的用戶請求，每筆包含用戶輸入與該用戶的對話歷史。
+                    請分別為每一筆提取與商品或搜尋相關的核心關鍵字，用於電商爬蟲查詢。
+
+                    請求：{items}
+
+                    指令：
+                    - 每筆只參考自己的對話歷史，不要混用其他筆的內容。
+                    - 提取與商品相關的核心關鍵字（例如「滑鼠」「筆記本電腦」「無線滑鼠 鍵盤」），若有多個商品或規格，保留相關短語。
+                    - 參考對話歷史推斷上下文（例如歷史提到「滑鼠」，當前輸入「再找個鍵盤」，則提取「鍵盤 滑鼠」）。
+                    - 移除無關語句（例如「我想買」「有推薦的嗎」）。
+                    - 輸入模糊但暗示商品需求時（例如「打遊戲的東西」），推斷潛在商品類別（例如「電競滑鼠 鍵盤」）。
+                    - 輸入和歷史均不包含商品相關內容時，該筆回傳空字串。
+                    - 只回傳一個 JSON 物件，鍵為請求編號，值為關鍵字字串，例如 {{"1": "無線滑鼠", "2": ""}}，無需多餘解釋。
+                    """
+        )
+
+    async def extract(self, user_input: str, chat_history: str) -> str:
+        """排入目前的批次並等待該筆的關鍵字"""
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(loop)
+        if batch is None:
+            batch = self._pending[loop] = _PendingBatch()
+            task = loop.create_task(self._run(loop, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        future = loop.create_future()
+        batch.items.append({"user_input": user_input, "chat_history": chat_history})
+        batch.futures.append(future)
+        batch.wakeup.set()
+        if len(batch.items) >= self.max_batch:
+            self._pending.pop(loop, None)  # 已滿，之後的請求開新批次
+        return await future
+
+    async def _run(self, loop: asyncio.AbstractEventLoop, batch: _PendingBatch):
+        # 等待視窗內沒有新請求、批次已滿或達到延遲上限
+        while len(batch.items) < self.max_batch:
+            remaining = min(self.window, batch.first_at + self.max_wait - time.monotonic())
+            if remaining <= 0:
+                break
+            batch.wakeup.clear()
+            try:
+                await asyncio.wait_for(batch.wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        if self._pending.get(loop) is batch:
+            del self._pending[loop]
+        await self._dispatch(batch)
+
+    async def _dispatch(self, batch: _PendingBatch):
+        self.batches += 1
+        self.items += len(batch.items)
+        items = {str(i): item for i, item in enumerate(batch.items, 1)}
+        messages = [
+            SystemMessage(content=self.prompt.format(items=json.dumps(items, ensure_ascii=False))),
+            HumanMessage(content=f"請提取以上 {len(items)} 筆請求的關鍵字")
+        ]
+        try:
+            response = await self.invoke(messages)
+            results = self._parse(str(response.content))
+        except Exception as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for i, future in enumerate(batch.futures, 1):
+            if future.done():
+                continue  # 呼叫端已取消
+            if str(i) in results:
+                future.set_result(str(results[str(i)]).strip())
+            else:
+                future.set_exception(KeywordBatchError(f"批次回應缺少第 {i} 筆結果"))
+
+    @staticmethod
+    def _parse(content: str) -> Dict[str, str]:
+        match = _JSON_OBJECT_PATTERN.search(content)
+        if not match:
+            raise KeywordBatchError(f"無法解析批次回應：{content[:100]}")
+        try:
+            results = json.loads(match.group(0))
+        except json.JSONDecodeError as e:
+            raise KeywordBatchError(f"無法解析批次回應：{e}")
+        if not isinstance(results, dict):
+            raise KeywordBatchError("批次回應不是 JSON 物件")
+        return results
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0
+        }
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage
+
+# 預設快取檔案位置（可用環境變數 LLM_CACHE_PATH 覆寫）
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "llm_cache.db"
+)
+
+
+class LLMCache:
+    """以 SQLite 儲存的 LLM 回應快取，支援 LRU 與 TTL 淘汰。
+
+    快取鍵由模型名稱、溫度與渲染後訊息內容的雜湊組成，
+    相同的提示詞在有效期限內不會再次呼叫模型。
+
+    命中時只在記憶體記下存取時間，累積 flush_every 筆或淘汰前才批次寫回，
+    讀取路徑不會每次都寫入磁碟。非同步程式請用 aget/aset/ainvoke，SQLite 呼叫會移到執行緒。
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: int = 5000, ttl: float = 24 * 3600,
+                 flush_every: int = 64):
+        self.db_path = db_path or os.environ.get("LLM_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending_access: Dict[str, float] = {}  # 尚未寫回的最後存取時間
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            content TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, temperature: Any, messages: List[BaseMessage]) -> str:
+        """根據模型、溫度與訊息內容產生快取鍵"""
+        rendered = json.dumps(
+            [[message.type, message.content] for message in messages],
+            ensure_ascii=False
+        )
+        digest = hashlib.sha256(rendered.encode("utf-8")).hexdigest()
+        return f"{model}|{temperature}|{digest}"
+
+    def get(self, key: str) -> Optional[str]:
+        """讀取快取內容，過期或不存在時回傳 None（過期項目留待 set 時淘汰）"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._pending_access[key] = now
+            if len(self._pending_access) >= self.flush_every:
+                self._flush_access()
+                self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, content: str):
+        """寫入快取並執行淘汰"""
+        now = time.time()
+        with self._lock:
+            self._pending_access.pop(key, None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, content, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, content, now, now)
+            )
+            self._flush_access()  # 依最新的存取時間淘汰
+            self._evict(now)
+            self._conn.commit()
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get 的非同步版本（在執行緒中存取 SQLite，不阻塞事件迴圈）"""
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, content: str):
+        """set 的非同步版本"""
+        await asyncio.to_thread(self.set, key, content)
+
+    def _flush_access(self):
+        """把記憶體中的存取時間批次寫回（呼叫端持有鎖並負責 commit）"""
+        if self._pending_access:
+            self._conn.executemany(
+                "UPDATE llm_cache SET last_access = ? WHERE key = ?",
+                [(access, key) for key, access in self._pending_access.items()]
+            )
+            self._pending_access.clear()
+
+    def _evict(self, now: float):
+        """移除過期項目，並依最後存取時間淘汰超出上限的項目"""
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+        self._conn.execute('''
+        DELETE FROM llm_cache WHERE key IN (
+            SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+        )
+        ''', (self.max_entries,))
+
+    def invoke(self, llm, messages: List[BaseMessage]) -> AIMessage:
+        """先查快取，未命中時才呼叫 llm.invoke 並寫回快取"""
+        key = self.make_key(getattr(llm, "model", ""), getattr(llm, "temperature", None), messages)
+        content = self.get(key)
+        if content is not None:
+            return AIMessage(content=content)
+        response = llm.invoke(messages)
+        self.set(key, str(response.content))
+        return response
+
+    async def ainvoke(self, llm, messages: List[BaseMessage]) -> AIMessage:
+        """invoke 的非同步版本，未命中時呼叫 llm.ainvoke"""
+        key = self.make_key(getattr(llm, "model", ""), getattr(llm, "temperature", None), messages)
+        content = await self.aget(key)
+        if content is not None:
+            return AIMessage(content=content)
+        response = await llm.ainvoke(messages)
+        await self.aset(key, str(response.content))
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        """回傳命中/未命中次數與目前快取大小"""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": size
+        }
+
+    def clear(self):
+        """清空快取與計數器"""
+        with self._lock:
+            self._pending_access.clear()
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
@@ -6,33 +6,76 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 # 將專案根目錄加入到 Python 路徑
 sys.path.append(project_root)
+# tools 內的模組以頂層名稱互相匯入（例如 tracing），這裡沿用相同方式
+sys.path.append(os.path.join(project_root, "tools"))
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
 from langchain_core.messages import HumanMessage, SystemMessage
 from langgraph.graph import StateGraph, END
-from typing import TypedDict, List, Dict, Any
+from typing import TypedDict, List, Dict, Any, AsyncIterator, Iterator, Optional, Tuple
 from tools.ecommerce_tools import crawler_tool  # 假設這是你的電商爬蟲工具模組
+from agents.llm_cache import LLMCache
+from agents.prompt_packer import PromptPacker
+from agents.history_manager import HistoryManager
+from agents.keyword_batcher import KeywordBatcher, KeywordBatchError
+from agents.intent_classifier import IntentClassifier, SEARCH_CUES, normalize_query
+from agents.session_registry import ChatSession
+from agents.runtime import run_coroutine, iterate
+from tracing import metrics, span, start_trace
+from persistence import get_crawl_log
+from product_batch import ProductBatch
+import asyncio
 import json
+import time
 
 class AgentState(TypedDict):
     user_input: str
-    scraped_data: List[Dict[str, Any]]
+    query: str  # 由 check_data_needed 提取的搜尋關鍵字，供後續節點沿用
+    scraped_data: ProductBatch  # 欄式商品批次，只在輸出時轉成 dict
     response: str
     chat_history: List[Dict[str, str]]
+    history_summary: str  # 較舊對話的摘要，最近幾輪保留在 chat_history
     reasoning_steps: List[str]  # 儲存詳細的推理步驟（中文）
+    speculative_crawl: Optional[asyncio.Task]  # 與 LLM 關鍵字提取並行的預先爬取
 
 class CustomerServiceAgent:
-    def __init__(self, model_name="gemini-2.0-flash"):
-        self.llm = ChatGoogleGenerativeAI(
+    def __init__(self, model_name="gemini-2.0-flash", llm_cache: LLMCache = None,
+                 prompt_token_budget: int = None, llm=None):
+        # 可傳入其他聊天模型取代 Gemini（例如 loadtest 的 FakeChatModel）
+        self.llm = llm or ChatGoogleGenerativeAI(
             model=model_name,
             google_api_key=os.environ["GEMINI_API_KEY"],
             temperature=0.7  # 提高溫度以增強對話自然度
         )
+        self.llm_cache = llm_cache or LLMCache()  # 關鍵字提取等重複呼叫的回應快取
+        # 控制商品資料佔用的 token 數
+        self.prompt_packer = PromptPacker(
+            token_budget=prompt_token_budget or int(os.environ.get("PROMPT_TOKEN_BUDGET", 3000))
+        )
+        # 保留最近幾輪原文，較舊的對話於背景壓縮成摘要
+        self.history = HistoryManager(
+            self.llm,
+            window_turns=int(os.environ.get("HISTORY_WINDOW_TURNS", 6))
+        )
+        # 本地意圖分類與關鍵字提取，信心足夠時略過 LLM 呼叫
+        self.intent_classifier = IntentClassifier()
+        self.fast_path_threshold = float(os.environ.get("FAST_PATH_THRESHOLD", 0.85))
+        # 信心介於兩個門檻之間時，先用本地關鍵字預先爬取，同時等待 LLM 確認
+        self.speculative_threshold = float(os.environ.get("SPECULATIVE_CRAWL_THRESHOLD", 0.5))
+        # 選用：把同時到達的關鍵字提取請求合併成一次 LLM 呼叫（KEYWORD_BATCHING=1 開啟）
+        self.keyword_batcher = None
+        if os.environ.get("KEYWORD_BATCHING", "").lower() in ("1", "true", "yes"):
+            self.keyword_batcher = KeywordBatcher(
+                lambda messages: self._call_llm("keyword_batch", messages),
+                window_ms=float(os.environ.get("KEYWORD_BATCH_WINDOW_MS", 10)),
+                max_batch=int(os.environ.get("KEYWORD_BATCH_MAX_SIZE", 16)),
+                max_wait_ms=float(os.environ.get("KEYWORD_BATCH_MAX_WAIT_MS", 50))
+            )
         self.tool = crawler_tool
         self.tools = {"EcommerceScraper": self.tool}
-        self.scraped_data = []  # 持久化爬取的資料
-        self.chat_history = []  # 持久化對話歷史
+        self.crawl_log = get_crawl_log()  # 爬蟲結果的背景寫入佇列（取代 scraped_data.json）
+        self.session = ChatSession("default")  # 未指定 session 時使用的預設對話狀態
         self.prompt = PromptTemplate(
             input_variables=["user_input", "chat_history", "scraped_data"],
             template="""
@@ -48,13 +91,14 @@ class CustomerServiceAgent:
 
                     用戶請求：{user_input}
                     對話歷史：{chat_history}
-                    商品資料：{scraped_data}
+                    商品資料（表格，每列為「編號|平台|價格|數量|單價|標題」，已依單價由低到高排序）：
+                    {scraped_data}
                     
                     指令：
                     - 回應必須自然、親切，像是真人客服，積極引導對話。
                     - 如果用戶輸入模糊（例如只說「買東西」），回應：「看來你想找點好東西！😄 可以告訴我您想買什麼？比如品牌、數量或預算範圍？這樣我能幫您找得更精準！」
                     - 如果商品資料為空，回應：「目前沒有找到商品資料，換個關鍵詞試試吧！您想要什麼品牌或規格？比如單品、3入，還是高價位一點的？」
-                    - 在比對價格時：需考慮商品標示數量（例如「10包」「12包」「100抽」「150抽」等等情況），計算平均單價（總價 ÷ 數量）並優先比較單價。
+                    - 在比對價格時：數量與單價（總價 ÷ 數量）已由系統根據標題（例如「10包」「12入」「3入組」）預先計算，請直接使用表格中的數字並優先比較單價，不需自行計算。
                     
                     ```
                     推薦格式如下：
@@ -64,10 +108,11 @@ class CustomerServiceAgent:
                         <p>標題: 商品標題 </p>
                         <p>價格: 商品價格</p>
                         <p>平均單價: 若適用，顯示單價</p>
-                        <p>連結: <a href="商品連結">商品連結</a></p>
+                        <p>連結: [[商品編號]]</p>
                         <p>推薦理由：簡單說明，例如價格合理、平台可靠等</p>
                     </div>
                     ```
+                    - 連結欄位只需填入商品編號，例如 [[P3]]，系統會自動換成實際商品連結，請勿自行編造網址。
                     - 推薦後，主動問：「這幾款您覺得如何？有沒有特定的規格或品牌想再看看？😊」
                     - 如果是閒聊或非商品問題，自由回應並適時引導至商品話題（例如：「今天心情不錯吧？順便問問，有沒有想買啥好東西？😄」）。
                     - 若用戶問到你自己，說明你是電商客服小助手，樂於幫忙解答或推薦商品，並問：「有什麼我可以幫您的？想找什麼好康的？」。
@@ -93,29 +138,88 @@ class CustomerServiceAgent:
         )
         self.graph = self._build_graph()
 
+    async def _call_llm(self, purpose: str, messages: list, cached: bool = False):
+        """呼叫 LLM 並記錄延遲與 token 數"""
+        with span("llm_call", purpose=purpose) as attrs:
+            if cached:
+                response = await self.llm_cache.ainvoke(self.llm, messages)
+            else:
+                response = await self.llm.ainvoke(messages)
+            usage = getattr(response, "usage_metadata", None) or {}
+            attrs["prompt_tokens"] = usage.get("input_tokens", 0)
+            attrs["completion_tokens"] = usage.get("output_tokens", 0)
+            metrics.inc("llm_tokens_total", attrs["prompt_tokens"], purpose=purpose, kind="prompt")
+            metrics.inc("llm_tokens_total", attrs["completion_tokens"], purpose=purpose, kind="completion")
+        return response
+
+    async def _extract_keywords(self, user_input: str, chat_history: str) -> str:
+        """以 LLM 提取搜尋關鍵字；開啟批次時與其他 session 的請求合併送出"""
+        messages = [
+            SystemMessage(content=self.keyword_prompt.format(user_input=user_input, chat_history=chat_history)),
+            HumanMessage(content=user_input)
+        ]
+        if self.keyword_batcher is not None:
+            # 與單筆呼叫共用快取鍵，命中時不必排入批次
+            key = self.llm_cache.make_key(getattr(self.llm, "model", ""), getattr(self.llm, "temperature", None), messages)
+            cached = await self.llm_cache.aget(key)
+            if cached is not None:
+                return cached.strip()
+            try:
+                query = await self.keyword_batcher.extract(user_input, chat_history)
+                await self.llm_cache.aset(key, query)
+                return query
+            except KeywordBatchError:
+                pass  # 批次回應無法解析時改用單筆提取
+        response = await self._call_llm("keyword", messages, cached=True)
+        return str(response.content).strip()
+
     def _build_graph(self):
         graph = StateGraph(AgentState)
 
-        def check_data_needed(state: AgentState) -> AgentState:
+        async def check_data_needed(state: AgentState) -> AgentState:
             """檢查是否需要爬取新商品資料"""
             reasoning = f"步驟 1：分析用戶請求：'{state['user_input']}'"
             state["reasoning_steps"].append(reasoning)
 
-            # 提取關鍵字，考慮對話歷史
-            messages = [
-                SystemMessage(content=self.keyword_prompt.format(
-                    user_input=state["user_input"],
-                    chat_history=json.dumps(state["chat_history"], ensure_ascii=False)
-                )),
-                HumanMessage(content=state["user_input"])
-            ]
-            keyword_response = self.llm.invoke(messages)
-            query = str(keyword_response.content).strip()
+            # 先以本地分類器判斷意圖與關鍵字，信心不足時才呼叫 LLM
+            intent = self.intent_classifier.classify(state["user_input"], state["chat_history"])
+            if intent["confidence"] >= self.fast_path_threshold:
+                query = intent["query"]
+                state["reasoning_steps"].append(
+                    f"本地分類：{intent['intent']}（信心 {intent['confidence']}），略過 LLM 關鍵字提取"
+                )
+            else:
+                speculative_query = ""
+                if intent["intent"] == "search" and intent["query"] and intent["confidence"] >= self.speculative_threshold:
+                    # 輸入已明確提到商品時，先以本地關鍵字開始爬取，與 LLM 提取重疊進行
+                    speculative_query = intent["query"]
+                    state["speculative_crawl"] = asyncio.create_task(
+                        self.tools["EcommerceScraper"].ainvoke(speculative_query)
+                    )
+                    state["reasoning_steps"].append(f"預先爬取：'{speculative_query}'")
+                # 提取關鍵字，考慮對話歷史
+                try:
+                    query = await self._extract_keywords(
+                        state["user_input"],
+                        self.history.keyword_view(state["chat_history"], state["history_summary"])
+                    )
+                except Exception:
+                    if state["speculative_crawl"] is not None:
+                        state["speculative_crawl"].cancel()
+                    raise
+                if speculative_query:
+                    if query and normalize_query(query) == normalize_query(speculative_query):
+                        query = speculative_query  # 與預先爬取的關鍵字一致，沿用其結果
+                        state["reasoning_steps"].append("LLM 關鍵字與預先爬取一致，沿用預先爬取結果。")
+                    else:
+                        state["speculative_crawl"].cancel()
+                        state["speculative_crawl"] = None
+                        state["reasoning_steps"].append("LLM 關鍵字與預先爬取不同，取消預先爬取。")
+            state["query"] = query
             state["reasoning_steps"].append(f"提取的關鍵字：'{query}'")
 
             # 檢查是否需要爬蟲
-            search_keywords = ["找", "買", "搜尋", "商品", "價格", "比價", "推薦", "便宜", "划算", "優惠", "折扣", "特價"]
-            if any(keyword in state["user_input"].lower() for keyword in search_keywords) and query:
+            if any(keyword in state["user_input"].lower() for keyword in SEARCH_CUES) and query:
                 reasoning = "請求涉及商品搜尋且關鍵字有效，檢查現有資料。"
                 if state["scraped_data"]:
                     reasoning += "\n已有資料，但請求新搜尋，繼續爬取。"
@@ -125,10 +229,13 @@ class CustomerServiceAgent:
             else:
                 reasoning = "請求不涉及商品搜尋或無有效關鍵字，直接回應。"
                 state["response"] = "直接回應"
+                if state["speculative_crawl"] is not None:
+                    state["speculative_crawl"].cancel()
+                    state["speculative_crawl"] = None
             state["reasoning_steps"].append(reasoning)
             return state
 
-        def scrape_data(state: AgentState) -> AgentState:
+        async def scrape_data(state: AgentState) -> AgentState:
             """若需要，調用爬蟲工具"""
             if state["response"] == "直接回應":
                 state["reasoning_steps"].append("步驟 2：無需爬取，跳過此步。")
@@ -137,65 +244,81 @@ class CustomerServiceAgent:
             reasoning = "步驟 2：開始爬取資料。"
             state["reasoning_steps"].append(reasoning)
             
-            # 再次提取關鍵字以確保一致性，考慮對話歷史
-            messages = [
-                SystemMessage(content=self.keyword_prompt.format(
-                    user_input=state["user_input"],
-                    chat_history=json.dumps(state["chat_history"], ensure_ascii=False)
-                )),
-                HumanMessage(content=state["user_input"])
-            ]
-            keyword_response = self.llm.invoke(messages)
-            query = str(keyword_response.content).strip()
+            # 沿用 check_data_needed 已提取的關鍵字，避免重複呼叫 LLM
+            query = state["query"]
             state["reasoning_steps"].append(f"確認關鍵字：'{query}'")
 
             if not query:
                 state["reasoning_steps"].append("無有效關鍵字，跳過爬取。")
-                state["scraped_data"] = []
+                state["scraped_data"] = ProductBatch()
                 return state
 
             # 使用提取的關鍵字進行爬蟲
-            scraped_data = []
+            scraped_data = ProductBatch()
             tool_name = "EcommerceScraper"
             try:
                 reasoning = f"調用工具 {tool_name}，查詢：'{query}'"
                 state["reasoning_steps"].append(reasoning)
-                result = self.tools[tool_name].run(query)
+                if state["speculative_crawl"] is not None:
+                    result = await state["speculative_crawl"]  # 預先爬取已在進行中
+                    state["speculative_crawl"] = None
+                else:
+                    result = await self.tools[tool_name].ainvoke(query)
+                platform_status = getattr(result, "platform_status", {})
+                if platform_status:
+                    state["reasoning_steps"].append("平台狀態：" + "、".join(
+                        f"{platform}={info['status']}({info['products']})" for platform, info in platform_status.items()
+                    ))
+                if not isinstance(result, ProductBatch):
+                    raise RuntimeError(str(result))  # 工具回傳錯誤訊息
                 scraped_data = result
-                with open("scraped_data.json", "w", encoding="utf-8") as f:
-                    json.dump(result, f, ensure_ascii=False, indent=4)
-                result_data = json.loads(result)
-                state["reasoning_steps"].append(f"工具 {tool_name} 返回 {len(scraped_data)} 筆商品：{json.dumps(scraped_data, ensure_ascii=False)}")
+                self.intent_classifier.schedule_learn(scraped_data.titles, query)  # 背景執行緒更新詞典
+                # 交給背景寫入執行緒，本輪回應不必等待磁碟 I/O；批次不可變，直接共用，由寫入執行緒轉成 JSON
+                self.crawl_log.submit({
+                    "ts": time.time(),
+                    "query": query,
+                    "products": scraped_data
+                })
+                state["reasoning_steps"].append(f"工具 {tool_name} 返回 {len(scraped_data)} 筆商品")
             except Exception as e:
                 state["reasoning_steps"].append(f"工具 {tool_name} 錯誤：{str(e)}")
             state["scraped_data"] = scraped_data
             state["reasoning_steps"].append(f"總計爬取商品數：{len(scraped_data)}")
             return state
 
-        def respond(state: AgentState) -> AgentState:
+        async def respond(state: AgentState) -> AgentState:
             """根據請求和資料生成回應"""
             reasoning = "步驟 3：生成回應。"
             state["reasoning_steps"].append(reasoning)
 
+            packed_data, packed_count = self.prompt_packer.pack(state["scraped_data"])
+            state["reasoning_steps"].append(f"提供給模型的商品數：{packed_count}/{len(state['scraped_data'])}")
             messages = [
                 SystemMessage(content=self.prompt.format(
                     user_input=state["user_input"],
-                    chat_history=json.dumps(state["chat_history"], ensure_ascii=False),
-                    scraped_data=json.dumps(state["scraped_data"], ensure_ascii=False)
+                    chat_history=self.history.response_view(state["chat_history"], state["history_summary"]),
+                    scraped_data=packed_data
                 )),
                 HumanMessage(content=state["user_input"])
             ]
             reasoning = "調用 LLM 生成回應。"
             state["reasoning_steps"].append(reasoning)
-            response = self.llm.invoke(messages)
+            response = await self._call_llm("respond", messages)
             state["response"] = response.content
             state["chat_history"].append({"user": state["user_input"], "assistant": response.content})
             state["reasoning_steps"].append(f"LLM 生成回應：{response.content[:100]}...")
             return state
 
-        graph.add_node("check_data_needed", check_data_needed)
-        graph.add_node("scrape_data", scrape_data)
-        graph.add_node("respond", respond)
+        def traced(name, node):
+            """為每個節點記錄執行時間"""
+            async def wrapper(state: AgentState) -> AgentState:
+                with span("graph_node", node=name):
+                    return await node(state)
+            return wrapper
+
+        graph.add_node("check_data_needed", traced("check_data_needed", check_data_needed))
+        graph.add_node("scrape_data", traced("scrape_data", scrape_data))
+        graph.add_node("respond", traced("respond", respond))
 
         graph.add_conditional_edges(
             "check_data_needed",
@@ -206,21 +329,80 @@ class CustomerServiceAgent:
         graph.set_entry_point("check_data_needed")
         return graph.compile()
 
-    def run(self, user_input: str) -> dict:
-        initial_state = AgentState(
+    def _initial_state(self, user_input: str, session: ChatSession) -> AgentState:
+        return AgentState(
             user_input=user_input,
-            scraped_data=self.scraped_data,
+            query="",
+            scraped_data=session.scraped_data,
             response="",
-            chat_history=self.chat_history,  # 使用持久化的對話歷史
-            reasoning_steps=[]
+            chat_history=session.chat_history,  # 使用該 session 的對話歷史
+            history_summary=session.history_summary,
+            reasoning_steps=[],
+            speculative_crawl=None
         )
-        result = self.graph.invoke(initial_state)
-        self.scraped_data = result["scraped_data"]  # 更新持久化資料
-        self.chat_history = result["chat_history"]  # 更新對話歷史
-        return {
+
+    def run(self, user_input: str, session: ChatSession = None, trace: bool = False) -> dict:
+        """同步執行一輪對話（在共用事件迴圈上執行 arun）"""
+        return run_coroutine(self.arun(user_input, session, trace))
+
+    async def arun(self, user_input: str, session: ChatSession = None, trace: bool = False) -> dict:
+        """執行一輪對話；LLM 與 graph 由所有 session 共用，只讀寫該 session 的狀態
+
+        trace 為 True 時，回傳結果會附上本輪各節點、LLM 呼叫與平台請求的計時紀錄。
+        """
+        session = session or self.session
+        with start_trace() as turn_trace, span("turn", mode="invoke"):
+            result = await self.graph.ainvoke(self._initial_state(user_input, session))
+        session.scraped_data = result["scraped_data"]  # 更新 session 資料
+        session.chat_history = result["chat_history"]  # 更新對話歷史
+        self.history.schedule_summary(session)
+        output = {
             "response": result["response"],
-            "products": result["scraped_data"]
+            "products": result["scraped_data"].to_dicts()  # 輸出邊界才轉成 dict
         }
+        if trace:
+            output["trace"] = turn_trace.to_list()
+        return output
+
+    def stream(self, user_input: str, session: ChatSession = None, trace: bool = False) -> Iterator[Tuple[str, Any]]:
+        """astream 的同步版本"""
+        return iterate(self.astream(user_input, session, trace))
+
+    async def astream(self, user_input: str, session: ChatSession = None, trace: bool = False) -> AsyncIterator[Tuple[str, Any]]:
+        """分階段執行一輪對話，依序產生 (事件名稱, 資料)：
+
+        - ("products", 商品列表)：scrape_data 完成（或判定無需爬取）後立即送出
+        - ("token", 文字片段)：respond 節點中 LLM 串流產生的回應片段
+        - ("trace", 計時紀錄)：trace 為 True 時，在結束前送出
+        - ("done", {"response": 完整回應})：整輪對話結束
+        """
+        session = session or self.session
+        result = None
+        with start_trace() as turn_trace:
+            with span("turn", mode="stream"):
+                async for mode, payload in self.graph.astream(
+                    self._initial_state(user_input, session),
+                    stream_mode=["updates", "messages"]
+                ):
+                    if mode == "messages":
+                        chunk, metadata = payload
+                        # 只轉送回應生成節點的 token，略過關鍵字提取的輸出
+                        if metadata.get("langgraph_node") == "respond" and chunk.content:
+                            yield "token", str(chunk.content)
+                    elif mode == "updates":
+                        for node, state in payload.items():
+                            if node == "scrape_data" or (node == "check_data_needed" and state["response"] == "直接回應"):
+                                yield "products", state["scraped_data"].to_dicts()
+                            elif node == "respond":
+                                result = state
+        if result is None:
+            return
+        session.scraped_data = result["scraped_data"]
+        session.chat_history = result["chat_history"]
+        if trace:
+            yield "trace", turn_trace.to_list()
+        yield "done", {"response": result["response"]}
+        self.history.schedule_summary(session)
 
 if __name__ == "__main__":
     agent = CustomerServiceAgent()
@@ -240,7 +422,7 @@ if __name__ == "__main__":
             print(f"\n發生錯誤：{e}，請再試一次！")
     
     with open("chat_history.json", "w", encoding="utf-8") as f:
-        json.dump(agent.chat_history, f, ensure_ascii=False, indent=4)
+        json.dump(agent.session.chat_history, f, ensure_ascii=False, indent=4)
         
     # 保存對話歷史
     print("對話歷史已保存到 chat_history.json")
\ No newline at end of file
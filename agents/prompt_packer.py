@@ -0,0 +1,74 @@
+import re
+from typing import Any, Dict, List, Tuple
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗估文字的 token 數：中日韓字元約一字一 token，其餘約四個字元一 token"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    text = re.sub(r"\s+", " ", text).strip().replace("|", "/")
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+
+def _format_price(price: Any) -> str:
+    try:
+        value = float(price)
+    except (TypeError, ValueError):
+        return str(price)
+    return str(int(value)) if value.is_integer() else f"{value:.2f}"
+
+
+def _platform(product: Dict[str, Any]) -> str:
+    """近似重複商品已合併時，標示還有幾個賣場（例如「PChome等3家」）"""
+    platform = str(product.get("platform", ""))
+    offers = product.get("offers")
+    return f"{platform}等{len(offers) + 1}家" if offers else platform
+
+
+class PromptPacker:
+    """把商品列表壓縮成精簡的表格文字，並控制在指定的 token 預算內
+
+    - 以短編號取代商品網址，捨棄模型用不到的欄位（例如 image_url）
+    - 商品標題截斷至 title_chars 個字元
+    - 依傳入順序逐列加入，超過預算即停止
+    """
+
+    COLUMNS = ("id", "平台", "價格", "數量", "單價", "標題")
+
+    def __init__(self, token_budget: int = 3000, title_chars: int = 40):
+        self.token_budget = token_budget
+        self.title_chars = title_chars
+
+    def _row(self, product: Dict[str, Any]) -> str:
+        return "|".join([
+            str(product.get("id", "")),
+            _platform(product),
+            _format_price(product.get("price", "")),
+            str(product.get("quantity", 1)),
+            _format_price(product.get("unit_price", product.get("price", ""))),
+            _truncate(str(product.get("title", "")), self.title_chars),
+        ])
+
+    def pack(self, products: List[Dict[str, Any]]) -> Tuple[str, int]:
+        """回傳 (表格文字, 實際放入的商品數)"""
+        if not products:
+            return "[]", 0
+        lines = ["|".join(self.COLUMNS)]
+        used = estimate_tokens(lines[0])
+        packed = 0
+        for product in products:
+            row = self._row(product)
+            cost = estimate_tokens(row) + 1
+            if used + cost > self.token_budget:
+                break
+            lines.append(row)
+            used += cost
+            packed += 1
+        if packed < len(products):
+            lines.append(f"（另有 {len(products) - packed} 筆商品因篇幅省略）")
+        return "\n".join(lines), packed
@@ -0,0 +1,58 @@
+import asyncio
+import queue
+import threading
+from typing import Any, AsyncIterator, Coroutine, Iterator, Optional
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+_DONE = object()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """取得背景執行緒中常駐的共用事件迴圈（第一次呼叫時啟動）
+
+    同步的呼叫端（Flask 的 WSGI 執行緒、命令列）都把協程丟到這個迴圈執行，
+    因此所有對話共用同一組非同步 HTTP 連線，並在單一執行緒內交錯進行。
+    """
+    global _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="agent-event-loop", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def run_coroutine(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """在共用事件迴圈執行協程，並阻塞等待結果"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+def iterate(agen: AsyncIterator) -> Iterator:
+    """將非同步產生器轉為同步迭代器（供 Flask 串流回應使用）
+
+    消費端提前停止（例如 SSE 用戶端斷線，Flask 關閉回應產生器）時，
+    取消事件迴圈上的產生端，連帶取消進行中的 LLM 串流與爬取。
+    """
+    items: "queue.Queue" = queue.Queue()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put(item)
+        except BaseException as e:
+            items.put(e)
+        finally:
+            items.put(_DONE)
+
+    producer = asyncio.run_coroutine_threadsafe(pump(), get_loop())
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
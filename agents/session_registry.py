@@ -0,0 +1,122 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from product_batch import ProductBatch
+
+
+class ChatSession:
+    """單一使用者的對話狀態（對話歷史與最近一次的商品資料）"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.chat_history: List[Dict[str, str]] = []
+        self.scraped_data = ProductBatch()
+        self.history_summary = ""  # 較舊對話的滾動摘要（由 HistoryManager 維護）
+        self.summarizing = False
+        self.last_access = time.time()
+        self.size_bytes = 0
+        self.lock = threading.Lock()  # 同一個 session 的請求依序處理，避免互相覆寫狀態
+        self.async_lock = asyncio.Lock()  # 在 ASGI 事件迴圈中使用的對應鎖
+
+    def estimate_size(self) -> int:
+        """估算此 session 佔用的記憶體大小（對話以序列化後的位元組數近似，商品批次取其欄位大小）"""
+        self.size_bytes = len(json.dumps(
+            [self.history_summary, self.chat_history], ensure_ascii=False
+        ).encode("utf-8")) + self.scraped_data.nbytes
+        return self.size_bytes
+
+
+class SessionRegistry:
+    """以 session id 為鍵的對話狀態註冊表
+
+    所有 session 共用同一個 agent（LLM 用戶端與編譯好的 LangGraph），
+    這裡只保存每個使用者自己的狀態，並依 LRU、閒置逾時與總記憶體上限淘汰。
+    session id 一律由伺服器產生；用戶端送來不認得的 id 時建立新的 session 與新的 id。
+    _sessions 依最後使用時間排序（每次使用都移到尾端），最久未使用者在最前面。
+    """
+
+    def __init__(self, max_sessions: int = 1000, idle_ttl: float = 30 * 60,
+                 max_total_bytes: int = 200 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_total_bytes = max_total_bytes
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    def get(self, session_id: Optional[str]) -> ChatSession:
+        """取得 session；id 不存在（或已被淘汰）時建立新的 session，並配發新的 id"""
+        now = time.time()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = ChatSession(self.new_session_id())
+                self._sessions[session.session_id] = session
+                self._evict_overflow()
+            else:
+                self._sessions.move_to_end(session.session_id)
+            session.last_access = now
+            return session
+
+    def reset(self, session_id: Optional[str]) -> ChatSession:
+        """清除既有 session 並以新的 id 建立新的（例如重新整理首頁時）"""
+        self.drop(session_id)
+        return self.get(None)
+
+    def drop(self, session_id: Optional[str]):
+        with self._lock:
+            session = self._sessions.pop(session_id, None) if session_id else None
+            if session is not None:
+                self._total_bytes -= session.size_bytes
+
+    def update_size(self, session: ChatSession):
+        """每輪對話結束後更新 session 大小，並在超出總量時淘汰最久未使用者"""
+        previous = session.size_bytes
+        current = session.estimate_size()
+        with self._lock:
+            if session.session_id in self._sessions:
+                self._total_bytes += current - previous
+                # 一輪對話剛結束，視為最近使用
+                session.last_access = time.time()
+                self._sessions.move_to_end(session.session_id)
+            self._evict_overflow(keep=session.session_id)
+
+    def _evict_idle(self, now: float):
+        """從最久未使用的一端淘汰閒置逾時者，遇到第一個仍在使用中的 session 即停止"""
+        while self._sessions:
+            sid, session = next(iter(self._sessions.items()))
+            if now - session.last_access <= self.idle_ttl:
+                break
+            del self._sessions[sid]
+            self._total_bytes -= session.size_bytes
+
+    def _evict_overflow(self, keep: Optional[str] = None):
+        while self._sessions and (
+            len(self._sessions) > self.max_sessions or self._total_bytes > self.max_total_bytes
+        ):
+            sid = next(iter(self._sessions))
+            if sid == keep:
+                if len(self._sessions) == 1:
+                    break
+                self._sessions.move_to_end(sid)
+                continue
+            self._total_bytes -= self._sessions.pop(sid).size_bytes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "total_bytes": self._total_bytes,
+                "max_sessions": self.max_sessions,
+                "max_total_bytes": self.max_total_bytes
+            }
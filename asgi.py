@@ -0,0 +1,170 @@
+"""ASGI 入口：在 ASGI 伺服器的事件迴圈上直接執行非同步的對話流程
+
+啟動方式（任一 ASGI 伺服器皆可，例如）：
+    uvicorn asgi:app --workers 1
+
+與 main.py 的 Flask 應用共用同一個 agent 與 session 註冊表，
+每輪對話都是事件迴圈上的協程，不需要為每個請求占用一條執行緒。
+"""
+import asyncio
+import json
+import os
+from http.cookies import SimpleCookie
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+from main import (
+    SESSION_COOKIE, SESSION_HEADER, TRACE_HEADER, collect_metrics, get_agent, sessions, sse_event, wants_trace
+)
+from persistence import close_crawl_log
+from tracing import metrics
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "index.html")
+
+
+def _headers(scope) -> Dict[str, str]:
+    return {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+
+
+def _session_id(headers: Dict[str, str]) -> Optional[str]:
+    """從 header 或 cookie 取得 session id"""
+    if SESSION_HEADER.lower() in headers:
+        return headers[SESSION_HEADER.lower()]
+    cookie = SimpleCookie(headers.get("cookie", ""))
+    return cookie[SESSION_COOKIE].value if SESSION_COOKIE in cookie else None
+
+
+def _session_headers(session_id: str) -> list:
+    """以 cookie 與 header 回傳本輪實際使用的 session id"""
+    return [
+        (b"set-cookie", f"{SESSION_COOKIE}={session_id}; HttpOnly; Path=/; SameSite=Lax".encode("latin-1")),
+        (SESSION_HEADER.lower().encode("latin-1"), session_id.encode("latin-1")),
+    ]
+
+
+async def _read_json(receive) -> dict:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        return json.loads(body or b"{}")
+    except json.JSONDecodeError:
+        return {}
+
+
+async def _wait_disconnect(receive):
+    """請求內容讀完後，等到用戶端斷線"""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _send_json(send, status: int, data, extra_headers=()):
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json; charset=utf-8"), *extra_headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                get_agent()  # 預先建立共用 agent
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                close_crawl_log()  # 寫出尚未落盤的爬蟲紀錄
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    headers = _headers(scope)
+    path, method = scope["path"], scope["method"]
+    query = {k: v[0] for k, v in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+
+    if path == "/metrics" and method == "GET":
+        collect_metrics()
+        if query.get("format") == "json":
+            await _send_json(send, 200, metrics.snapshot())
+            return
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain; version=0.0.4; charset=utf-8")],
+        })
+        await send({"type": "http.response.body", "body": metrics.render_prometheus().encode("utf-8")})
+        return
+
+    if path == "/" and method == "GET":
+        # 每次訪問首頁時重置該使用者的對話狀態
+        session = sessions.reset(_session_id(headers))
+        with open(TEMPLATE_PATH, "rb") as f:
+            body = f.read()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/html; charset=utf-8"), *_session_headers(session.session_id)],
+        })
+        await send({"type": "http.response.body", "body": body})
+        return
+
+    if path in ("/chat", "/chat/stream") and method == "POST":
+        user_input = (await _read_json(receive)).get("message", "")
+        if not user_input:
+            await _send_json(send, 400, {"error": "請輸入訊息"})
+            return
+        session = sessions.get(_session_id(headers))
+        session_headers = _session_headers(session.session_id)
+        trace = wants_trace(query.get("trace"), headers.get(TRACE_HEADER.lower()))
+
+        if path == "/chat":
+            try:
+                async with session.async_lock:
+                    result = await get_agent().arun(user_input, session, trace)
+                sessions.update_size(session)
+                await _send_json(send, 200, result, session_headers)
+            except Exception as e:
+                await _send_json(send, 500, {"error": str(e)})
+            return
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+                *session_headers,
+            ],
+        })
+
+        async def stream():
+            async with session.async_lock:
+                async for event, data in get_agent().astream(user_input, session, trace):
+                    await send({"type": "http.response.body", "body": sse_event(event, data).encode("utf-8"), "more_body": True})
+            sessions.update_size(session)
+
+        # 用戶端斷線時取消本輪對話，不再繼續 LLM 串流與爬取
+        producer = asyncio.ensure_future(stream())
+        watcher = asyncio.ensure_future(_wait_disconnect(receive))
+        await asyncio.wait({producer, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if not producer.done():
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+            return
+        watcher.cancel()
+        try:
+            producer.result()
+        except Exception as e:
+            await send({"type": "http.response.body", "body": sse_event("error", {"error": str(e)}).encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    await _send_json(send, 404, {"error": "Not Found"})
@@ -0,0 +1,213 @@
+"""離線壓力測試：模擬多位使用者同時對 Flask 應用（main.py）對話
+
+電商平台 API 由 loadtest.mock_servers 模擬，Gemini 由 loadtest.fake_llm 取代，
+整個測試不需要網路。結束後輸出：
+
+- 用戶端量測：每個端點的吞吐量、錯誤數與 p50/p95/p99（串流另計首個商品事件與首個 token 的時間）
+- 伺服器端量測（/metrics）：每個 graph 節點、LLM 呼叫與平台請求的 p50/p95/p99
+
+範例：
+    python -m loadtest.driver --users 20 --turns 5 --endpoint both --latency-ms 80 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import aiohttp
+
+from loadtest.mock_servers import EndpointFault, MockConfig, start_per_platform
+
+# 涵蓋本地快速路徑、需要 LLM 提取關鍵字（參考上下文）與一般閒聊
+MESSAGES = [
+    "我想買衛生紙",
+    "幫我找無線滑鼠",
+    "推薦便宜的洗衣精",
+    "有沒有划算的行動電源",
+    "再找個鍵盤",
+    "那個有更便宜的嗎",
+    "打遊戲的東西推薦一下",
+    "你好",
+    "謝謝你",
+]
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+
+    return {"count": len(ordered), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+class LoadDriver:
+    def __init__(self, base_url: str, users: int, turns: int, endpoint: str, think_ms: float, seed: int):
+        self.base_url = base_url
+        self.users = users
+        self.turns = turns
+        self.endpoints = ["/chat", "/chat/stream"] if endpoint == "both" else [endpoint]
+        self.think = think_ms / 1000
+        self.random = random.Random(seed)
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def _record(self, name: str, seconds: float):
+        self.samples.setdefault(name, []).append(seconds)
+
+    async def _chat(self, http: aiohttp.ClientSession, message: str):
+        start = time.perf_counter()
+        async with http.post(self.base_url + "/chat", json={"message": message}) as response:
+            data = await response.json(content_type=None)
+        if response.status != 200 or "error" in data:
+            self.errors["/chat"] = self.errors.get("/chat", 0) + 1
+            return
+        self._record("/chat", time.perf_counter() - start)
+
+    async def _stream(self, http: aiohttp.ClientSession, message: str):
+        start = time.perf_counter()
+        seen = set()
+        failed = False
+        async with http.post(self.base_url + "/chat/stream", json={"message": message}) as response:
+            async for line in response.content:
+                if not line.startswith(b"event: "):
+                    continue
+                event = line[len(b"event: "):].strip().decode()
+                if event == "error":
+                    failed = True
+                if event in ("products", "token") and event not in seen:
+                    seen.add(event)
+                    self._record(f"/chat/stream [first {event}]", time.perf_counter() - start)
+        if failed or response.status != 200:
+            self.errors["/chat/stream"] = self.errors.get("/chat/stream", 0) + 1
+            return
+        self._record("/chat/stream", time.perf_counter() - start)
+
+    async def _user(self, index: int):
+        # 每位使用者有自己的 cookie（session）
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=120)) as http:
+            async with http.get(self.base_url + "/") as response:
+                await response.read()
+            for turn in range(self.turns):
+                message = self.random.choice(MESSAGES)
+                endpoint = self.endpoints[(index + turn) % len(self.endpoints)]
+                try:
+                    if endpoint == "/chat":
+                        await self._chat(http, message)
+                    else:
+                        await self._stream(http, message)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+                await asyncio.sleep(self.random.uniform(0, 2 * self.think))
+
+    async def run(self) -> Dict:
+        start = time.perf_counter()
+        await asyncio.gather(*(self._user(i) for i in range(self.users)))
+        elapsed = time.perf_counter() - start
+        async with aiohttp.ClientSession() as http:
+            async with http.get(self.base_url + "/metrics?format=json") as response:
+                server_metrics = await response.json()
+        completed = sum(len(v) for k, v in self.samples.items() if "[" not in k)
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "turns": completed,
+            "throughput_turns_per_s": round(completed / elapsed, 3) if elapsed else 0.0,
+            "errors": self.errors,
+            "endpoints": {name: _percentiles(samples) for name, samples in sorted(self.samples.items())},
+            "server": _server_summary(server_metrics),
+        }
+
+
+def _server_summary(snapshot: Dict) -> Dict[str, List[Dict]]:
+    """從 /metrics 的 JSON 取出節點、LLM 與平台請求的延遲"""
+    names = ["turn_seconds", "graph_node_seconds", "llm_call_seconds", "platform_fetch_seconds", "platform_page_seconds"]
+    return {name: snapshot.get("histograms", {}).get(name, []) for name in names}
+
+
+def print_report(report: Dict):
+    print(f"\n耗時 {report['elapsed_s']} 秒，完成 {report['turns']} 輪，吞吐量 {report['throughput_turns_per_s']} 輪/秒")
+    if report["errors"]:
+        print(f"錯誤：{report['errors']}")
+    print(f"\n{'端點':<32}{'筆數':>8}{'p50(s)':>10}{'p95(s)':>10}{'p99(s)':>10}")
+    for name, stats in report["endpoints"].items():
+        print(f"{name:<32}{stats['count']:>8}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}")
+    for metric, series in report["server"].items():
+        if not series:
+            continue
+        print(f"\n{metric}")
+        for item in series:
+            label = ",".join(f"{k}={v}" for k, v in item["labels"].items()) or "-"
+            print(f"  {label:<30}{item['count']:>8}{item['p50']:>10.4f}{item['p95']:>10.4f}{item['p99']:>10.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="電商客服助手的離線壓力測試")
+    parser.add_argument("--users", type=int, default=10, help="同時對話的使用者數")
+    parser.add_argument("--turns", type=int, default=3, help="每位使用者的對話輪數")
+    parser.add_argument("--endpoint", choices=["/chat", "/chat/stream", "both"], default="both")
+    parser.add_argument("--think-ms", type=float, default=200.0, help="使用者兩輪之間的平均思考時間")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="模擬平台 API 的平均延遲")
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模擬平台 API 回傳 503 的機率")
+    parser.add_argument("--total-results", type=int, default=100, help="每個關鍵字在各平台的商品數")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300.0)
+    parser.add_argument("--llm-token-ms", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="另將報告寫入此 JSON 檔")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # 略過每個請求的存取紀錄
+
+    mocks, mock_env = start_per_platform(MockConfig(
+        total_results=args.total_results,
+        default=EndpointFault(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    ))
+    # 爬蟲模組在匯入時讀取網址，必須先設定環境變數再匯入應用程式
+    os.environ.update(mock_env)
+    os.environ.setdefault("CRAWL_LOG_DIR", tempfile.mkdtemp(prefix="crawl_log_"))
+    os.environ.setdefault("SEARCH_CACHE_PATH", ":memory:")  # 每次測試從空的搜尋快取開始
+
+    from werkzeug.serving import make_server
+
+    import main as flask_main
+    from agents.llm_cache import LLMCache
+    from agents.mainAgent import CustomerServiceAgent
+    from loadtest.fake_llm import FakeChatModel
+    from tracing import metrics
+
+    llm = FakeChatModel(first_token_ms=args.llm_first_token_ms, token_ms=args.llm_token_ms)
+    flask_main.agent = CustomerServiceAgent(llm=llm, llm_cache=LLMCache(":memory:"))
+    metrics.reset()
+
+    server = make_server("127.0.0.1", 0, flask_main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="flask-under-test", daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        driver = LoadDriver(base_url, args.users, args.turns, args.endpoint, args.think_ms, args.seed)
+        report = asyncio.run(driver.run())
+        report["mock_requests"] = {k: v for mock in mocks for k, v in mock.requests.items()}
+        report["mock_errors"] = {k: v for mock in mocks for k, v in mock.errors.items()}
+        report["llm_calls"] = llm.calls
+    finally:
+        server.shutdown()
+        for mock in mocks:
+            mock.stop()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
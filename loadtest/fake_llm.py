@@ -0,0 +1,126 @@
+"""取代 ChatGoogleGenerativeAI 的假聊天模型
+
+依系統提示詞判斷是哪一種呼叫（關鍵字提取、批次關鍵字、摘要、回應生成），
+回傳格式合理的內容，並模擬首字延遲與逐 token 串流，不需要網路與 API 金鑰。
+
+    agent = CustomerServiceAgent(llm=FakeChatModel(), llm_cache=LLMCache(":memory:"))
+"""
+import asyncio
+import json
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from agents.intent_classifier import FILLER_PHRASES
+from agents.prompt_packer import estimate_tokens
+
+_FILLER_PATTERN = re.compile("|".join(sorted(map(re.escape, FILLER_PHRASES), key=len, reverse=True)))
+_PRODUCT_ID_PATTERN = re.compile(r"^(P\d+)\|", re.M)
+_BATCH_ITEMS_PATTERN = re.compile(r"請求：(\{.*?\})\n", re.S)
+
+
+def _keywords(text: str) -> str:
+    return " ".join(_FILLER_PATTERN.sub(" ", text).split())
+
+
+class FakeChatModel(BaseChatModel):
+    """可設定延遲的假模型；回應內容依提示詞種類產生"""
+
+    model: str = "fake-chat"
+    temperature: float = 0.0
+    first_token_ms: float = 300.0  # 首字延遲
+    token_ms: float = 5.0  # 之後每個片段的延遲
+    chunk_chars: int = 8
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        system = str(messages[0].content) if messages else ""
+        last = str(messages[-1].content) if messages else ""
+        if "多筆彼此獨立的用戶請求" in system:
+            match = _BATCH_ITEMS_PATTERN.search(system)
+            items = json.loads(match.group(1)) if match else {}
+            return json.dumps({k: _keywords(v["user_input"]) for k, v in items.items()}, ensure_ascii=False)
+        if "關鍵字提取助手" in system:
+            return _keywords(last)
+        if "對話摘要助手" in system:
+            return "用戶正在比較日用品與 3C 商品的價格，偏好高 CP 值。"
+        ids = _PRODUCT_ID_PATTERN.findall(system)[:3]
+        if not ids:
+            return "<p>您好！我是電商客服小助手，想找什麼好康的嗎？😊</p>"
+        cards = "".join(
+            f"<div><p>推薦 {i}</p><p>連結: [[{product_id}]]</p><p>推薦理由：單價划算</p></div>"
+            for i, product_id in enumerate(ids, 1)
+        )
+        return f"<p>幫您整理了幾款：</p>{cards}<p>這幾款您覺得如何？😊</p>"
+
+    def _message(self, messages: List[BaseMessage], content: str) -> AIMessage:
+        prompt_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        completion_tokens = estimate_tokens(content)
+        return AIMessage(content=content, usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        })
+
+    def _chunks(self, content: str) -> List[str]:
+        return [content[i:i + self.chunk_chars] for i in range(0, len(content), self.chunk_chars)] or [""]
+
+    # ---------- 同步 ----------
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        content = self._reply(messages)
+        time.sleep((self.first_token_ms + self.token_ms * len(self._chunks(content))) / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, content))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self.calls += 1
+        content = self._reply(messages)
+        time.sleep(self.first_token_ms / 1000)
+        pieces = self._chunks(content)
+        for index, piece in enumerate(pieces):
+            message = AIMessageChunk(content=piece)
+            if index == len(pieces) - 1:
+                message = AIMessageChunk(content=piece, usage_metadata=self._message(messages, content).usage_metadata)
+            chunk = ChatGenerationChunk(message=message)
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+            time.sleep(self.token_ms / 1000)
+
+    # ---------- 非同步 ----------
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        content = self._reply(messages)
+        await asyncio.sleep((self.first_token_ms + self.token_ms * len(self._chunks(content))) / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, content))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        self.calls += 1
+        content = self._reply(messages)
+        await asyncio.sleep(self.first_token_ms / 1000)
+        pieces = self._chunks(content)
+        for index, piece in enumerate(pieces):
+            message = AIMessageChunk(content=piece)
+            if index == len(pieces) - 1:
+                message = AIMessageChunk(content=piece, usage_metadata=self._message(messages, content).usage_metadata)
+            chunk = ChatGenerationChunk(message=message)
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+            await asyncio.sleep(self.token_ms / 1000)
@@ -0,0 +1,175 @@
+"""Momo 搜尋頁 HTML 解析基準測試
+
+以 loadtest/fixtures/momo/ 中存下的搜尋頁，比較各解析後端（tools/html_backend.py）：
+
+- 一致性：每個後端解析出的商品列表必須與 html.parser（原本的做法）完全相同，否則以非零狀態結束
+- 吞吐量：每秒可解析的頁數與每頁耗時
+
+範例：
+    python -m loadtest.html_bench --rounds 20
+    python -m loadtest.html_bench --regenerate   # 重新產生合成的 fixture（固定亂數種子）
+
+也可以放入自行從瀏覽器另存的 Momo 搜尋頁（*.html）一併比較。
+"""
+import argparse
+import glob
+import html
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "tools"))
+
+from html_backend import BACKENDS, HAS_LXML  # noqa: E402
+from scraper import MomoScraper  # noqa: E402
+
+FIXTURE_DIR = os.path.join(PROJECT_ROOT, "loadtest", "fixtures", "momo")
+
+BRANDS = ["舒潔", "五月花", "Logitech 羅技", "Razer 雷蛇", "ASUS 華碩", "Panasonic 國際牌", "3M", "白蘭", "小米", "SONY"]
+NOUNS = ["抽取式衛生紙", "無線滑鼠", "藍牙耳機", "行動電源", "洗衣精補充包", "機械式鍵盤", "捲筒衛生紙", "電競滑鼠墊"]
+TAGS = ["【限時下殺】", "【momo獨家】", "(買一送一)", "【超值組】", ""]
+
+
+def _product_li(rng: random.Random, index: int) -> str:
+    """仿 Momo 搜尋結果的商品卡片（含圖片、標語、促銷圖示等解析用不到的節點）"""
+    i_code = rng.randint(1000000, 13000000)
+    title = f"{rng.choice(TAGS)}{rng.choice(BRANDS)} {rng.choice(NOUNS)} {rng.choice([1, 2, 3, 6, 12])}入 x{rng.randint(1, 24)}"
+    price = f"{rng.randint(99, 12990):,}"
+    icons = "".join(f'<li><img src="//img4.momoshop.com.tw/ecm/img/icon/{rng.randint(1, 99)}.png" alt="icon"></li>'
+                    for _ in range(rng.randint(1, 4)))
+    return f"""
+<li class="listAreaLi" data-gtm-index="{index}">
+  <a class="goods-img-url" href="/goods/GoodsDetail.jsp?i_code={i_code}&amp;Area=search&amp;mdiv=403&amp;oid=1_{index}&amp;cid=index&amp;kw=%E8%A1%9B%E7%94%9F%E7%B4%99" title="{html.escape(title)}">
+    <div class="swiperArea"><div class="swiper-wrapper">
+      <div class="swiper-slide"><img class="prdImg lazy" src="//i1.momoshop.com.tw/{i_code}/goodsimg/{i_code}_R.webp" alt="{html.escape(title)}"></div>
+      <div class="swiper-slide"><img class="prdImg lazy" data-original="//i2.momoshop.com.tw/{i_code}/goodsimg/{i_code}_2.webp"></div>
+    </div></div>
+    <div class="prdInfoWrap">
+      <div class="prdNameTitle"><h3 class="prdName">{html.escape(title)}</h3></div>
+      <p class="sloganTitle">{html.escape(rng.choice(["限時優惠中", "滿千折百", "超商取貨", "24h到貨"]))}</p>
+      <div class="money"><span class="price">$<b>{price}</b></span><span class="originalPrice">${rng.randint(100, 15000):,}</span></div>
+      <div class="iconArea"><ul>{icons}</ul></div>
+      <div class="evaluation"><span class="ratingStars" data-rating="{rng.randint(30, 50) / 10}"></span><span class="totalSales">總銷量&gt;{rng.randint(1, 50)}萬</span></div>
+    </div>
+  </a>
+  <p class="trackBtn"><a href="javascript:;" onclick="addTrack('{i_code}')">加入追蹤</a></p>
+</li>"""
+
+
+def _page(rng: random.Random, body: str) -> str:
+    """頁首導覽、大型內嵌腳本與頁尾：真實頁面大部分的位元組都在這些區塊"""
+    categories = "".join(
+        f'<li class="cateItem"><a href="/category/LgrpCategory.jsp?l_code={rng.randint(1000000000, 9999999999)}">分類{i}</a>'
+        f'<ul class="subCate">{"".join(f"<li><a href=/category/{i}/{j}>子分類{i}-{j}</a></li>" for j in range(12))}</ul></li>'
+        for i in range(40)
+    )
+    state = json.dumps({"filters": [{"id": k, "name": f"篩選{k}", "count": rng.randint(1, 999)} for k in range(400)]},
+                       ensure_ascii=False)
+    footer = "".join(f'<a href="/edm/cmmedm.jsp?lpn={rng.randint(10000, 99999)}">活動{k}</a>' for k in range(150))
+    return f"""<!DOCTYPE html>
+<html lang="zh-Hant-TW"><head>
+<meta charset="utf-8"><title>momo購物網 搜尋結果</title>
+<link rel="stylesheet" href="//img1.momoshop.com.tw/ecm/css/search.css">
+<style>.listAreaLi{{width:20%;float:left}}.prdName{{font-size:14px}}.price b{{color:#c00}}</style>
+<script>window.__SEARCH_STATE__ = {state};</script>
+<script src="//img1.momoshop.com.tw/ecm/js/jquery.min.js"></script>
+</head><body>
+<div id="BodyBase"><header class="topArea"><ul class="cateMenu">{categories}</ul></header>
+<div class="searchPrdListArea bookList">{body}</div>
+<footer class="footerArea">{footer}</footer></div>
+<script>dataLayer.push({{"event": "search", "items": {rng.randint(1, 9999)}}});</script>
+</body></html>
+"""
+
+
+def write_fixtures(directory: str = FIXTURE_DIR, seed: int = 20240601):
+    """產生三種搜尋頁：有結果（兩頁）、超出最後一頁、查無結果"""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    pages = {}
+    for page in (1, 2):
+        items = "".join(_product_li(rng, i) for i in range(1, 21))
+        pages[f"search_p{page}.html"] = _page(rng, f'<div class="listArea"><ul class="clearfix">{items}</ul></div>')
+    pages["search_last.html"] = _page(rng, '<div class="adjustmentTextArea"><p>商品不足，建議調整搜尋條件</p></div>')
+    pages["search_empty.html"] = _page(rng, '<div class="noSearchResultWrapper"><p>很抱歉，找不到符合的商品</p></div>')
+    for name, content in pages.items():
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            f.write(content)
+    print(f"已寫入 {len(pages)} 個 fixture 至 {directory}")
+
+
+def load_fixtures(directory: str) -> Dict[str, str]:
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            fixtures[os.path.basename(path)] = f.read()
+    return fixtures
+
+
+def check_parity(fixtures: Dict[str, str], backends: List[str]) -> List[str]:
+    """各後端與 html.parser 的解析結果不一致之處"""
+    baseline = MomoScraper(None, "html.parser")
+    mismatches = []
+    for backend in backends:
+        scraper = MomoScraper(None, backend)
+        for name, content in fixtures.items():
+            if scraper.parse_page(content) != baseline.parse_page(content):
+                mismatches.append(f"{backend}: {name}")
+    return mismatches
+
+
+def benchmark(fixtures: Dict[str, str], backends: List[str], rounds: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    pages = list(fixtures.values())
+    for backend in backends:
+        scraper = MomoScraper(None, backend)
+        scraper.parse_page(pages[0])  # 暖身
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for content in pages:
+                scraper.parse_page(content)
+        elapsed = time.perf_counter() - start
+        count = rounds * len(pages)
+        results[backend] = {"pages_per_second": round(count / elapsed, 1), "ms_per_page": round(elapsed / count * 1000, 2)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Momo 搜尋頁 HTML 解析基準測試")
+    parser.add_argument("--fixtures", default=FIXTURE_DIR, help="存放 Momo 搜尋頁 *.html 的目錄")
+    parser.add_argument("--rounds", type=int, default=10, help="每個後端重複解析全部 fixture 的次數")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="以逗號分隔的後端名稱")
+    parser.add_argument("--regenerate", action="store_true", help="重新產生合成的 fixture 後結束")
+    args = parser.parse_args()
+
+    if args.regenerate:
+        write_fixtures(args.fixtures)
+        return
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        sys.exit(f"{args.fixtures} 中沒有 *.html（可先執行 --regenerate）")
+    backends = [b for b in args.backends.split(",") if b]
+    if "lxml" in backends and not HAS_LXML:
+        print("未安裝 lxml：lxml 後端實際使用 html.parser，strainer 以 html.parser 掃描")
+
+    size = sum(len(content.encode("utf-8")) for content in fixtures.values())
+    print(f"fixture：{len(fixtures)} 頁，共 {size / 1024:.0f} KB")
+    results = benchmark(fixtures, backends, args.rounds)
+    baseline = results.get("html.parser", {}).get("ms_per_page")
+    for backend, stats in results.items():
+        speedup = f"  ({baseline / stats['ms_per_page']:.1f}x)" if baseline else ""
+        print(f"{backend:12s} {stats['pages_per_second']:8.1f} 頁/秒  {stats['ms_per_page']:7.2f} ms/頁{speedup}")
+
+    mismatches = check_parity(fixtures, backends)
+    if mismatches:
+        print("解析結果與 html.parser 不一致：\n  " + "\n  ".join(mismatches))
+        sys.exit(1)
+    print("所有後端的解析結果與 html.parser 一致")
+
+
+if __name__ == "__main__":
+    main()
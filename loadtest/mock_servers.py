@@ -0,0 +1,254 @@
+"""PChome / Yahoo / 露天 API 的本地模擬伺服器
+
+回應格式與爬蟲實際解析的欄位一致（PChome search/v3.3、Yahoo GraphQL getUther、
+露天 core/prod 與 prod），商品內容依關鍵字決定性地產生，並可設定延遲與錯誤率。
+
+單獨啟動：
+    python -m loadtest.mock_servers --port 8900 --latency-ms 80 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import random
+import threading
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+from urllib.parse import unquote
+
+from aiohttp import web
+
+BRANDS = ["舒潔", "五月花", "Logitech", "Razer", "SONY", "Philips", "小米", "ASUS", "象印", "Panasonic"]
+SPECS = ["", "", "3入", "6入組", "12包", "24入", "x2", "100抽", "500ml", "旗艦版", "2025新款"]
+
+PCHOME_PATH = "/search/v3.3/all/results"
+YAHOO_PATH = "/graphql"
+RUTEN_SEARCH_PATH = "/api/search/v3/index.php/core/prod"
+RUTEN_DETAIL_PATH = "/api/prod/v2/index.php/prod"
+
+
+@dataclass
+class EndpointFault:
+    """單一端點的延遲與錯誤設定"""
+    latency_ms: float = 50.0
+    jitter_ms: float = 20.0
+    error_rate: float = 0.0  # 回傳 HTTP 503 的機率
+    timeout_rate: float = 0.0  # 延遲到超過用戶端逾時的機率
+    timeout_ms: float = 15000.0
+
+
+@dataclass
+class MockConfig:
+    total_results: int = 100  # 每個關鍵字在各平台的商品總數
+    default: EndpointFault = field(default_factory=EndpointFault)
+    endpoints: Dict[str, EndpointFault] = field(default_factory=dict)  # 以 pchome / yahoo / ruten_search / ruten_detail 覆寫
+
+    def fault(self, endpoint: str) -> EndpointFault:
+        return self.endpoints.get(endpoint, self.default)
+
+
+def _rng(*parts) -> random.Random:
+    return random.Random(zlib.crc32("|".join(map(str, parts)).encode("utf-8")))
+
+
+def make_title(keyword: str, platform: str, index: int) -> str:
+    rng = _rng(keyword, platform, index)
+    return " ".join(part for part in (rng.choice(BRANDS), keyword, rng.choice(SPECS), f"#{index}") if part)
+
+
+def make_price(keyword: str, platform: str, index: int) -> int:
+    # 同一商品在不同平台的價格相近，讓比價與去重有意義
+    base = _rng(keyword, index).randint(99, 2999)
+    return max(1, base + _rng(keyword, platform, index).randint(-50, 50))
+
+
+class MockPlatformServer:
+    """在背景執行緒的事件迴圈上執行 aiohttp 模擬伺服器"""
+
+    def __init__(self, config: MockConfig = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        self.host = host
+        self.port = port
+        self.requests: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- 端點 ----------
+
+    async def _inject(self, endpoint: str) -> Optional[web.Response]:
+        """套用延遲與錯誤設定；需要回傳錯誤時回傳該 Response"""
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        fault = self.config.fault(endpoint)
+        if random.random() < fault.timeout_rate:
+            await asyncio.sleep(fault.timeout_ms / 1000)
+        delay = max(0.0, random.gauss(fault.latency_ms, fault.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+        if random.random() < fault.error_rate:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            return web.json_response({"error": "injected"}, status=503)
+        return None
+
+    async def pchome(self, request: web.Request) -> web.Response:
+        error = await self._inject("pchome")
+        if error:
+            return error
+        keyword = request.query.get("q", "")
+        page = int(request.query.get("page", "1"))
+        page_size = 20
+        start = (page - 1) * page_size
+        indices = range(start, min(start + page_size, self.config.total_results))
+        prods = [
+            {
+                "Id": f"DGAA{i:04d}-{zlib.crc32(keyword.encode()) % 10000:04d}",
+                "name": make_title(keyword, "pchome", i),
+                "price": make_price(keyword, "pchome", i),
+                # 真實的圖片路徑以商品代碼為目錄，每個商品都不同
+                "picB": f"/items/DGAA{i:04d}{zlib.crc32(keyword.encode()) % 10000:04d}/000001_{i}.jpg",
+            }
+            for i in indices
+        ]
+        total_page = -(-self.config.total_results // page_size)
+        return web.json_response({"QTime": 5, "totalRows": self.config.total_results, "totalPage": total_page, "prods": prods})
+
+    async def yahoo(self, request: web.Request) -> web.Response:
+        error = await self._inject("yahoo")
+        if error:
+            return error
+        variables = (await request.json()).get("variables", {})
+        keyword = variables.get("p", "")
+        page, page_size = int(variables.get("pg", "1")), int(variables.get("psz", "60"))
+        start = (page - 1) * page_size
+        hits = [
+            {
+                "ec_title": make_title(keyword, "yahoo", i),
+                "ec_price": str(make_price(keyword, "yahoo", i)),
+                "ec_image": f"https://s.yimg.com/zp/MerchandiseImages/{zlib.crc32(f'{keyword}{i}'.encode()):08X}-{i}.jpg",
+                "ec_item_url": f"https://tw.buy.yahoo.com/gdsale/mock-{i}.html",
+            }
+            for i in range(start, min(start + page_size, self.config.total_results))
+        ]
+        return web.json_response({"data": {"getUther": {"hits": hits, "total": self.config.total_results}}})
+
+    async def ruten_search(self, request: web.Request) -> web.Response:
+        error = await self._inject("ruten_search")
+        if error:
+            return error
+        keyword = request.query.get("q", "")
+        offset, limit = int(request.query.get("offset", "1")), int(request.query.get("limit", "60"))
+        rows = [
+            {"Id": f"{zlib.crc32(keyword.encode()) % 100000:05d}{i:06d}"}
+            for i in range(offset - 1, min(offset - 1 + limit, self.config.total_results))
+        ]
+        return web.json_response({"TotalRows": self.config.total_results, "Rows": rows})
+
+    async def ruten_detail(self, request: web.Request) -> web.Response:
+        error = await self._inject("ruten_detail")
+        if error:
+            return error
+        keyword = unquote(request.headers.get("referer", "").partition("q=")[2])
+        details = []
+        for prod_id in filter(None, request.query.get("id", "").split(",")):
+            index = int(prod_id[-6:])
+            price = make_price(keyword, "ruten", index)
+            details.append({
+                "ProdId": prod_id,
+                "ProdName": make_title(keyword, "ruten", index),
+                "PriceRange": [price, price],
+                "Image": f"/s1/{zlib.crc32(prod_id.encode()) % 256:02x}/{zlib.crc32(prod_id.encode()) % 65536:04x}/{prod_id}.jpg",
+            })
+        return web.json_response(details)
+
+    # ---------- 啟動與關閉 ----------
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(PCHOME_PATH, self.pchome)
+        app.router.add_post(YAHOO_PATH, self.yahoo)
+        app.router.add_get(RUTEN_SEARCH_PATH, self.ruten_search)
+        app.router.add_get(RUTEN_DETAIL_PATH, self.ruten_detail)
+        return app
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def env(self) -> Dict[str, str]:
+        """讓爬蟲改連到這個伺服器的環境變數（需在匯入爬蟲模組前設定）"""
+        return {
+            "PCHOME_SEARCH_URL": self.base_url + PCHOME_PATH,
+            "YAHOO_GRAPHQL_URL": self.base_url + YAHOO_PATH,
+            "RUTEN_SEARCH_URL": self.base_url + RUTEN_SEARCH_PATH,
+            "RUTEN_DETAIL_URL": self.base_url + RUTEN_DETAIL_PATH,
+        }
+
+    async def _serve(self):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        self._ready.set()
+
+    def start(self) -> "MockPlatformServer":
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._serve())
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="mock-platforms", daemon=True)
+        self._thread.start()
+        self._ready.wait(10)
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(10)
+
+
+def start_per_platform(config: MockConfig = None, host: str = "127.0.0.1"):
+    """每個平台各啟動一個伺服器（不同連接埠），與真實環境一樣各自有獨立的連線池與速率限制
+
+    回傳 (伺服器列表, 環境變數)。
+    """
+    servers = {name: MockPlatformServer(config, host).start() for name in ("pchome", "yahoo", "ruten")}
+    env = {
+        "PCHOME_SEARCH_URL": servers["pchome"].env()["PCHOME_SEARCH_URL"],
+        "YAHOO_GRAPHQL_URL": servers["yahoo"].env()["YAHOO_GRAPHQL_URL"],
+        "RUTEN_SEARCH_URL": servers["ruten"].env()["RUTEN_SEARCH_URL"],
+        "RUTEN_DETAIL_URL": servers["ruten"].env()["RUTEN_DETAIL_URL"],
+    }
+    return list(servers.values()), env
+
+
+def main():
+    parser = argparse.ArgumentParser(description="啟動電商平台 API 模擬伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--total-results", type=int, default=100)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        total_results=args.total_results,
+        default=EndpointFault(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    )
+    server = MockPlatformServer(config, args.host, args.port).start()
+    print("模擬伺服器已啟動，設定以下環境變數讓爬蟲改連到本機：")
+    for key, value in server.env().items():
+        print(f"  {key}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
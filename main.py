@@ -1,39 +1,134 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from agents.mainAgent import CustomerServiceAgent
+from agents.session_registry import SessionRegistry
+from tracing import metrics  # tools 目錄已由 agents.mainAgent 加入路徑
+from http_client import pool_stats
+from platform_health import health_stats
 import os
+import json
+import threading
 from dotenv import load_dotenv
 
 # 載入環境變數
 load_dotenv()
 
 app = Flask(__name__)
-agent = None  # 將 agent 設為全域變數
+agent = None  # 所有 session 共用同一個 agent（LLM 用戶端與編譯好的 graph）
+_agent_lock = threading.Lock()
+sessions = SessionRegistry(
+    max_sessions=int(os.environ.get("MAX_SESSIONS", 1000)),
+    idle_ttl=float(os.environ.get("SESSION_IDLE_TTL", 30 * 60)),
+    max_total_bytes=int(os.environ.get("SESSION_MAX_BYTES", 200 * 1024 * 1024))
+)
 
-def create_agent():
+SESSION_COOKIE = "session_id"
+SESSION_HEADER = "X-Session-ID"
+TRACE_HEADER = "X-Trace"
+
+def get_agent() -> CustomerServiceAgent:
+    """取得共用的 agent；同時到達的第一批請求也只會建立一個"""
     global agent
-    agent = CustomerServiceAgent()
+    if agent is None:
+        with _agent_lock:
+            if agent is None:
+                agent = CustomerServiceAgent()
+    return agent
+
+def get_session_id():
+    """從 header 或 cookie 取得 session id（伺服器配發的；不認得的 id 會換成新的）"""
+    return request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+
+def attach_session(response, session):
+    """以 cookie 與 header 回傳本輪實際使用的 session id"""
+    response.set_cookie(SESSION_COOKIE, session.session_id, httponly=True, samesite="Lax")
+    response.headers[SESSION_HEADER] = session.session_id
+    return response
+
+def wants_trace(query_value, header_value) -> bool:
+    """?trace=1 或 X-Trace: 1 時，在回應中附上本輪的計時紀錄"""
+    return (query_value or header_value or "").lower() in ("1", "true", "yes")
+
+def collect_metrics():
+    """把 session 與 LLM 快取的狀態更新為量測值"""
+    stats = sessions.stats()
+    metrics.set_gauge("sessions_active", stats["sessions"])
+    metrics.set_gauge("sessions_bytes", stats["total_bytes"])
+    if agent is not None and agent.llm_cache is not None:
+        cache_stats = agent.llm_cache.stats()
+        metrics.set_gauge("llm_cache_hits", cache_stats["hits"])
+        metrics.set_gauge("llm_cache_misses", cache_stats["misses"])
+        metrics.set_gauge("llm_cache_entries", cache_stats["size"])
+    for client, platforms in pool_stats().items():
+        for platform, counts in platforms.items():
+            for name, value in counts.items():
+                metrics.set_gauge(f"http_pool_{name}", value, client=client, platform=platform)
+    if agent is not None and agent.keyword_batcher is not None:
+        batch_stats = agent.keyword_batcher.stats()
+        metrics.set_gauge("keyword_batches", batch_stats["batches"])
+        metrics.set_gauge("keyword_batch_items", batch_stats["items"])
+    for platform, health in health_stats().items():
+        metrics.set_gauge("platform_circuit_state", {"closed": 0, "half_open": 1, "open": 2}[health["state"]], platform=platform)
+        metrics.set_gauge("platform_error_rate", health["error_rate"], platform=platform)
+        metrics.set_gauge("platform_p90_latency_seconds", health["p90_latency"], platform=platform)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """預設輸出 Prometheus 文字格式；?format=json 時輸出含 p50/p95/p99 的 JSON"""
+    collect_metrics()
+    if request.args.get("format") == "json":
+        return jsonify(metrics.snapshot())
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
 
 @app.route('/')
 def home():
-    create_agent()  # 每次訪問首頁時重置 agent
-    return render_template('index.html')
+    # 每次訪問首頁時重置該使用者的對話狀態
+    session = sessions.reset(get_session_id())
+    return attach_session(app.make_response(render_template('index.html')), session)
 
 @app.route('/chat', methods=['POST'])
 def chat():
-    global agent
-    if agent is None:  # 如果 agent 不存在，創建一個新的
-        create_agent()
-        
     user_input = request.json.get('message', '')
     if not user_input:
         return jsonify({'error': '請輸入訊息'}), 400
-    
+
+    session = sessions.get(get_session_id())
+    trace = wants_trace(request.args.get("trace"), request.headers.get(TRACE_HEADER))
     try:
-        result = agent.run(user_input)
-        return jsonify(result)
+        with session.lock:
+            result = get_agent().run(user_input, session, trace)
+        sessions.update_size(session)
+        return attach_session(jsonify(result), session)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def sse_event(event: str, data) -> str:
+    """格式化一筆 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """以 SSE 分階段回傳：先送商品列表，再逐字串流回應"""
+    user_input = request.json.get('message', '')
+    if not user_input:
+        return jsonify({'error': '請輸入訊息'}), 400
+
+    session = sessions.get(get_session_id())
+    trace = wants_trace(request.args.get("trace"), request.headers.get(TRACE_HEADER))
+
+    def generate():
+        try:
+            with session.lock:
+                for event, data in get_agent().stream(user_input, session, trace):
+                    yield sse_event(event, data)
+            sessions.update_size(session)
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # 避免反向代理緩衝整個回應
+    return attach_session(response, session)
+
 if __name__ == '__main__':
-    create_agent()  # 初始化 agent
-    app.run(debug=True) 
\ No newline at end of file
+    get_agent()  # 初始化 agent
+    app.run(debug=True, threaded=True)
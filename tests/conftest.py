@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 與 agents/mainAgent.py 相同：tools 模組以頂層名稱互相匯入
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "tools"))
@@ -0,0 +1,27 @@
+from dedup import cluster_batch, normalize_title
+from product_batch import ProductBatch
+
+
+def test_marketing_noise_is_stripped():
+    assert normalize_title("【免運】舒潔 衛生紙 100抽x10包 現貨") == normalize_title("舒潔衛生紙100抽x10包")
+
+
+def test_near_duplicates_collapse_to_the_lowest_price():
+    products = [
+        {"title": "【免運】舒潔 抽取式衛生紙 100抽x10包", "price": 299, "platform": "yahoo", "url": "https://tw.buy.yahoo.com/gdsale/A"},
+        {"title": "羅技 無線滑鼠 M331", "price": 450, "platform": "pchome", "url": "https://24h.pchome.com.tw/prod/B"},
+        {"title": "舒潔 抽取式衛生紙 100抽x10包 現貨", "price": 259, "platform": "ruten", "url": "https://www.ruten.com.tw/item/C"},
+        {"title": "舒潔 抽取式衛生紙 100抽x10包", "price": 279, "platform": "pchome", "url": "https://24h.pchome.com.tw/prod/D"},
+        # 標題相同但數量不同，不可合併
+        {"title": "舒潔 抽取式衛生紙 100抽x5包", "price": 150, "platform": "pchome", "url": "https://24h.pchome.com.tw/prod/E"},
+    ]
+    deduped = cluster_batch(ProductBatch.from_dicts(products).rank_by_unit_price()).to_dicts()
+    assert [p["title"] for p in deduped] == [
+        "舒潔 抽取式衛生紙 100抽x10包 現貨",
+        "舒潔 抽取式衛生紙 100抽x5包",
+        "羅技 無線滑鼠 M331",
+    ]
+    tissue = deduped[0]
+    assert tissue["price"] == 259
+    assert [(o["platform"], o["price"]) for o in tissue["offers"]] == [("pchome", 279), ("yahoo", 299)]
+    assert "offers" not in deduped[1]
@@ -0,0 +1,74 @@
+import pytest
+
+import ecommerce_tools
+import pchome_crawler
+import platform_health
+import rate_limiter
+import routn_crawler
+import yahoo_crawler
+from http_client import run_standalone
+from loadtest.mock_servers import EndpointFault, MockConfig, MockPlatformServer
+from search_cache import SearchCache
+
+PLATFORMS = ("pchome", "yahoo", "ruten")
+
+
+def start_platforms(monkeypatch, tmp_path, error_rate: float) -> MockPlatformServer:
+    """啟動模擬平台（等同 mock_servers --error-rate），並讓爬蟲、斷路器與快取都是全新的"""
+    server = MockPlatformServer(MockConfig(default=EndpointFault(latency_ms=5, jitter_ms=0, error_rate=error_rate))).start()
+    env = server.env()
+    monkeypatch.setattr(pchome_crawler, "BASE_URL", env["PCHOME_SEARCH_URL"])
+    monkeypatch.setattr(yahoo_crawler, "GRAPHQL_URL", env["YAHOO_GRAPHQL_URL"])
+    monkeypatch.setattr(routn_crawler, "SEARCH_URL", env["RUTEN_SEARCH_URL"])
+    monkeypatch.setattr(routn_crawler, "DETAIL_URL", env["RUTEN_DETAIL_URL"])
+    monkeypatch.setattr(platform_health, "_platforms", {})
+    monkeypatch.setattr(platform_health, "BACKOFF_BASE", 0.01)
+    # 三個平台都在同一個主機上，放寬速率限制以免互相排隊
+    monkeypatch.setattr(rate_limiter, "_buckets", {})
+    monkeypatch.setattr(rate_limiter, "DEFAULT_RATE", 1000.0)
+    monkeypatch.setattr(ecommerce_tools, "_search_cache", SearchCache(db_path=str(tmp_path / "search_cache.db")))
+    return server
+
+
+@pytest.fixture
+def outage(monkeypatch, tmp_path):
+    server = start_platforms(monkeypatch, tmp_path, error_rate=1.0)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def healthy(monkeypatch, tmp_path):
+    server = start_platforms(monkeypatch, tmp_path, error_rate=0.0)
+    yield server
+    server.stop()
+
+
+def search(keyword: str):
+    return run_standalone(ecommerce_tools.crawler_tool._afetch_all_platforms(keyword))
+
+
+def test_healthy_platforms_are_ok(healthy):
+    results = search("衛生紙")
+    assert {p: info["status"] for p, info in results.platform_status.items()} == dict.fromkeys(PLATFORMS, "ok")
+    assert len(results) > 0
+
+
+def test_outage_is_reported_as_error_not_empty(outage):
+    results = search("衛生紙")
+    for platform in PLATFORMS:
+        assert results.platform_status[platform]["status"] in ("error", "circuit_open")
+        assert results.platform_status[platform]["products"] == 0
+    # 第一頁失敗會交給重試與退避，而不是當成沒有商品
+    assert outage.requests["yahoo"] >= 2
+    assert outage.requests["ruten_search"] >= 2
+    assert len(results) == 0
+
+
+def test_repeated_outage_opens_the_circuit(outage):
+    for _ in range(4):
+        results = search("衛生紙")
+    sent = dict(outage.requests)
+    results = search("衛生紙")
+    assert {p: info["status"] for p, info in results.platform_status.items()} == dict.fromkeys(PLATFORMS, "circuit_open")
+    assert outage.requests == sent  # 斷路中不再送出請求
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from agents.intent_classifier import IntentClassifier
+
+TITLES = [
+    "舒潔 抽取式衛生紙 100抽x10包",
+    "五月花 衛生紙 110抽x12包",
+    "春風 衛生紙 超韌 100抽",
+    "羅技 無線滑鼠 M331",
+    "雷蛇 無線滑鼠 電競",
+    "微軟 無線滑鼠 藍牙",
+    "羅技 有線滑鼠",
+]
+HISTORY = [{"user": "幫我找無線滑鼠", "assistant": "以下是無線滑鼠的比價結果"}]
+
+
+@pytest.fixture(scope="module")
+def classifier(tmp_path_factory):
+    # 不讀 data/products.db，詞典只來自上面的標題
+    classifier = IntentClassifier(db_path=str(tmp_path_factory.mktemp("db") / "missing.db"))
+    classifier.learn(TITLES)
+    return classifier
+
+
+def test_chat_without_search_cue(classifier):
+    result = classifier.classify("你好")
+    assert result["intent"] == "chat"
+    assert result["confidence"] == 1.0
+
+
+def test_product_phrase_is_extracted(classifier):
+    result = classifier.classify("我想買無線滑鼠")
+    assert result["intent"] == "search"
+    assert result["query"] == "無線滑鼠"
+    assert result["confidence"] >= 0.85
+
+
+def test_budget_and_stray_characters_are_dropped(classifier):
+    assert classifier.classify("找找看有沒有衛生紙預算500元以內")["query"] == "衛生紙"
+    # 兩個填充詞之間的詞典外單字不列入關鍵字
+    assert classifier.classify("幫我找嘿的衛生紙")["query"] == "衛生紙"
+
+
+def test_modifier_follow_up_defers_to_llm(classifier):
+    without_history = classifier.classify("我想買無線的")
+    with_history = classifier.classify("我想買無線的", HISTORY)
+    assert without_history["query"] == with_history["query"] == "無線"
+    assert with_history["confidence"] < 0.5  # 低於預先爬取門檻，交給 LLM 參考上下文
+    # 完整的商品詞不受對話歷史影響
+    assert classifier.classify("我想買衛生紙", HISTORY)["confidence"] >= 0.85
+
+
+def test_search_cue_without_product_term(classifier):
+    result = classifier.classify("推薦一下打遊戲的東西")
+    assert result["intent"] == "search"
+    assert result["confidence"] < 0.5
+
+
+def test_statistics_stay_bounded(tmp_path):
+    classifier = IntentClassifier(db_path=str(tmp_path / "missing.db"), max_ngrams=200)
+    for i in range(300):
+        # 每個標題都帶一段不重複的文字，外加一再出現的「無線滑鼠」
+        rare = "".join(chr(0x4e00 + (i * 7 + k) % 20000) for k in range(4))
+        classifier.learn([f"{rare} 無線滑鼠"], query=f"{rare}")
+        assert len(classifier._ngram_counts) + len(classifier._query_terms) <= 200
+    assert classifier.classify("我想買無線滑鼠")["query"] == "無線滑鼠"
+    # 只出現過一次的詞在減半時被移除，也不再留在詞典中
+    assert classifier.tokenize("丁丂七丄")[0][1] == "unknown"
+
+
+def test_schedule_learn_updates_lexicon_in_background(tmp_path):
+    classifier = IntentClassifier(db_path=str(tmp_path / "missing.db"))
+
+    async def main():
+        classifier.schedule_learn(["藍芽喇叭 防水"] * 3, "藍芽喇叭")
+        await asyncio.gather(*classifier._tasks)
+
+    asyncio.run(main())
+    assert classifier.classify("幫我找藍芽喇叭")["query"] == "藍芽喇叭"
+    assert not classifier._tasks
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agents import llm_cache
+from agents.llm_cache import LLMCache
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+class FakeLLM:
+    model = "fake"
+    temperature = 0
+
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        return AIMessage(content=f"回覆 {self.calls}")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache, "time", clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = LLMCache(db_path=":memory:", ttl=60)
+    cache.set("a", "內容")
+    clock.now += 59
+    assert cache.get("a") == "內容"
+    clock.now += 2
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = LLMCache(db_path=":memory:", max_entries=2)
+    cache.set("a", "A")
+    clock.now += 1
+    cache.set("b", "B")
+    clock.now += 1
+    assert cache.get("a") == "A"  # 存取時間只記在記憶體，淘汰前才寫回
+    clock.now += 1
+    cache.set("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.stats()["size"] == 2
+
+
+def test_ainvoke_calls_the_model_once_per_prompt(clock):
+    cache = LLMCache(db_path=":memory:")
+    llm = FakeLLM()
+    messages = [HumanMessage(content="幫我找衛生紙")]
+
+    async def main():
+        first = await cache.ainvoke(llm, messages)
+        second = await cache.ainvoke(llm, messages)
+        return first.content, second.content
+
+    assert asyncio.run(main()) == ("回覆 1", "回覆 1")
+    assert llm.calls == 1
@@ -0,0 +1,97 @@
+import asyncio
+import gzip
+import json
+import sqlite3
+import threading
+import time
+
+from persistence import CrawlLogSink, ProductDbSink, WriteBehindQueue
+
+
+class ListSink:
+    """記錄每次寫入的批次；gate 未開啟前寫入會卡住，用來把佇列塞滿"""
+
+    def __init__(self, fail_first: bool = False):
+        self.batches = []
+        self.closed = False
+        self.gate = threading.Event()
+        self.gate.set()
+        self.fail_first = fail_first
+
+    def write_batch(self, records):
+        self.gate.wait()
+        if self.fail_first:
+            self.fail_first = False
+            raise OSError("磁碟已滿")
+        self.batches.append(list(records))
+
+    def close(self):
+        self.closed = True
+
+
+def test_records_are_written_in_batches():
+    sink = ListSink()
+    sink.gate.clear()
+    writer = WriteBehindQueue(sink, name="test", batch_size=3, flush_interval=1.0)
+    for n in range(6):
+        writer.submit({"n": n})
+    sink.gate.set()
+    writer.flush()
+    assert [len(batch) for batch in sink.batches] == [3, 3]
+    assert [record["n"] for batch in sink.batches for record in batch] == list(range(6))
+    writer.close()
+
+
+def test_full_queue_drops_instead_of_blocking_the_loop():
+    sink = ListSink()
+    sink.gate.clear()
+    writer = WriteBehindQueue(sink, name="test", max_queue=2, batch_size=1, flush_interval=0.05)
+    writer.submit({"n": 0})
+    while writer._queue.qsize():  # 等寫入執行緒取走第一筆並卡在 sink
+        time.sleep(0.01)
+
+    async def submit_all():
+        return [writer.submit({"n": n}) for n in range(1, 5)]
+
+    assert asyncio.run(submit_all()) == [True, True, False, False]
+    sink.gate.set()
+    writer.close()
+    assert [record["n"] for batch in sink.batches for record in batch] == [0, 1, 2]
+    assert sink.closed
+
+
+def test_sink_errors_do_not_stop_the_writer():
+    sink = ListSink(fail_first=True)
+    writer = WriteBehindQueue(sink, name="test", flush_interval=0.05)
+    writer.submit({"n": 0})
+    writer.flush()
+    writer.submit({"n": 1})
+    writer.close()
+    assert sink.batches == [[{"n": 1}]]
+    assert not writer.submit({"n": 2})  # 關閉後不再接受
+
+
+def test_crawl_log_round_trips_and_rotates(tmp_path):
+    sink = CrawlLogSink(log_dir=str(tmp_path), max_bytes=1, backup_count=2)  # 每批寫完都輪替
+    for n in range(5):
+        sink.write_batch([{"query": "衛生紙" * 20, "n": n}])
+    backups = sorted(tmp_path.glob("crawl-*.jsonl.gz"))
+    assert len(backups) == 2  # 超過 backup_count 的舊檔已刪除
+    with gzip.open(backups[-1], "rt", encoding="utf-8") as f:
+        assert json.loads(f.readline())["n"] == 4
+
+
+def test_product_db_sink_writes_through_the_queue(tmp_path):
+    db_path = str(tmp_path / "products.db")
+    writer = WriteBehindQueue(ProductDbSink(db_path), name="test", flush_interval=0.05)
+    for platform in ("pchome", "yahoo"):
+        writer.submit({"query": "衛生紙", "products": [
+            {"platform": platform, "title": f"{platform} 衛生紙", "price": "199", "link": f"https://example.com/{platform}"},
+        ]})
+    writer.close()
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT platform, title, query FROM products ORDER BY id").fetchall()
+    assert rows == [("pchome", "pchome 衛生紙", "衛生紙"), ("yahoo", "yahoo 衛生紙", "衛生紙")]
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(products)")}
+    assert {"idx_products_query_created", "idx_products_platform_link"} <= indexes
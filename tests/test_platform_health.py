@@ -0,0 +1,105 @@
+import pytest
+
+import platform_health
+from platform_health import CLOSED, HALF_OPEN, OPEN, CircuitOpenError, PlatformHealth, guard
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(platform_health, "time", clock)
+    monkeypatch.setattr(platform_health, "MIN_REQUESTS", 4)
+    monkeypatch.setattr(platform_health, "ERROR_THRESHOLD", 0.5)
+    monkeypatch.setattr(platform_health, "COOLDOWN_SECONDS", 10)
+    monkeypatch.setattr(platform_health, "_platforms", {})
+    return clock
+
+
+def trip(health: PlatformHealth):
+    for ok in (True, True, False, False):
+        assert health.allow()
+        health.record(ok, 0.1)
+
+
+def test_stays_closed_below_min_requests(clock):
+    health = PlatformHealth("pchome")
+    for _ in range(3):
+        health.record(False, 0.1)
+    assert health.state == CLOSED
+
+
+def test_opens_at_error_threshold_and_rejects(clock):
+    health = PlatformHealth("pchome")
+    trip(health)
+    assert health.state == OPEN
+    assert not health.allow()
+    assert not health.available()
+
+
+def test_failures_outside_window_are_forgotten(clock):
+    health = PlatformHealth("pchome")
+    health.record(False, 0.1)
+    health.record(False, 0.1)
+    clock.now += platform_health.WINDOW_SECONDS + 1
+    health.record(True, 0.1)
+    health.record(True, 0.1)
+    assert health.state == CLOSED
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success(clock):
+    health = PlatformHealth("pchome")
+    trip(health)
+    clock.now += 10 * 1.2 + 0.1  # 冷卻時間含 ±20% 抖動
+    assert health.available()
+    assert health.allow()
+    assert health.state == HALF_OPEN
+    assert not health.allow()  # 探測進行中，其他請求仍被拒絕
+    health.record(True, 0.1)
+    assert health.state == CLOSED
+    assert health.allow()
+
+
+def test_failed_probe_reopens_with_longer_cooldown(clock):
+    health = PlatformHealth("pchome")
+    trip(health)
+    clock.now += 10 * 1.2 + 0.1
+    assert health.allow()
+    health.record(False, 0.1)
+    assert health.state == OPEN
+    clock.now += 10 * 1.2 + 0.1  # 第一次的冷卻時間已不夠
+    assert not health.allow()
+    clock.now += 20 * 1.2
+    assert health.allow()
+    assert health.state == HALF_OPEN
+
+
+def test_cancelled_probe_releases_the_slot(clock):
+    health = platform_health.get_health("pchome")
+    trip(health)
+    clock.now += 10 * 1.2 + 0.1
+    with pytest.raises(KeyboardInterrupt):
+        with guard("pchome"):  # 探測請求被取消（例如用戶端斷線），沒有成敗結果
+            raise KeyboardInterrupt
+    assert health.state == HALF_OPEN
+    assert health.allow()
+
+
+def test_guard_raises_circuit_open_without_running(clock):
+    for _ in range(4):
+        with pytest.raises(ValueError):
+            with guard("yahoo"):
+                raise ValueError("HTTP 500")
+    with pytest.raises(CircuitOpenError):
+        with guard("yahoo"):
+            pytest.fail("斷路中不應送出請求")
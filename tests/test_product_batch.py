@@ -0,0 +1,26 @@
+from product_batch import ProductBatch
+
+PRODUCTS = [
+    {"title": "舒潔 衛生紙 100抽x10包", "price": 250, "platform": "pchome", "url": "https://24h.pchome.com.tw/prod/A"},
+    {"title": "五月花 衛生紙 110抽x12包", "price": 240, "platform": "yahoo", "url": "https://tw.buy.yahoo.com/gdsale/B"},
+    {"title": "春風 衛生紙 100抽", "price": 30, "platform": "ruten", "url": "https://www.ruten.com.tw/item/C"},
+    {"title": "舒潔 衛生紙 10包", "price": 0, "platform": "ruten", "url": "https://www.ruten.com.tw/item/D"},
+    {"title": "舒潔 衛生紙 20包", "price": 500, "platform": "yahoo", "url": "https://tw.buy.yahoo.com/gdsale/E"},
+]
+
+
+def test_rank_by_unit_price_orders_by_unit_then_total_price():
+    ranked = ProductBatch.from_dicts(PRODUCTS).rank_by_unit_price()
+    # 價格為 0 的商品被移除；單價相同（25 元）時總價低者在前
+    assert [(p["title"], p["unit_price"]) for p in ranked] == [
+        ("五月花 衛生紙 110抽x12包", 20.0),
+        ("舒潔 衛生紙 100抽x10包", 25.0),
+        ("舒潔 衛生紙 20包", 25.0),
+        ("春風 衛生紙 100抽", 30.0),
+    ]
+    assert [p["id"] for p in ranked] == ["P1", "P2", "P3", "P4"]
+
+
+def test_rank_by_unit_price_drops_rows_over_the_cap():
+    ranked = ProductBatch.from_dicts(PRODUCTS).rank_by_unit_price(max_unit_price=25)
+    assert [p["unit_price"] for p in ranked] == [20.0, 25.0, 25.0]
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import time
+
+import asgi
+from agents.runtime import iterate
+
+
+class SlowAgent:
+    """先送出商品，之後一直等待（模擬還在串流的 LLM），記錄是否被取消"""
+
+    def __init__(self):
+        self.cancelled = asyncio.Event()
+
+    async def astream(self, user_input, session, trace):
+        try:
+            yield "products", []
+            await asyncio.sleep(60)
+            yield "done", {"response": "不應送出"}
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            raise
+
+
+def test_iterate_cancels_producer_when_consumer_stops():
+    state = {}
+
+    async def numbers():
+        try:
+            for i in range(100):
+                yield i
+                await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    items = iterate(numbers())
+    assert [next(items), next(items)] == [0, 1]
+    items.close()  # 例如 Flask 在用戶端斷線時關閉回應產生器
+    deadline = time.monotonic() + 2
+    while "cancelled" not in state and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert state.get("cancelled")
+
+
+def test_asgi_stream_is_cancelled_on_disconnect(monkeypatch):
+    agent = SlowAgent()
+    monkeypatch.setattr(asgi, "get_agent", lambda: agent)
+    sent = []
+
+    async def main():
+        disconnected = asyncio.Event()
+        messages = [{"type": "http.request", "body": json.dumps({"message": "幫我找衛生紙"}).encode(), "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if message.get("body", b"").startswith(b"event: products"):
+                disconnected.set()
+
+        scope = {"type": "http", "path": "/chat/stream", "method": "POST", "headers": [], "query_string": b""}
+        await asyncio.wait_for(asgi.app(scope, receive, send), timeout=5)
+
+    asyncio.run(main())
+    assert agent.cancelled.is_set()
+    assert not any(b"done" in message.get("body", b"") for message in sent)
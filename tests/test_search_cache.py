@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+import search_cache
+from search_cache import FRESH, MISS, STALE, SearchCache
+
+PRODUCTS = [{"title": "舒潔 衛生紙 100抽x10包", "price": 199.0}]
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(search_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SearchCache(db_path=str(tmp_path / "search_cache.db"), ttls={"pchome": (10, 60)})
+
+
+def test_fresh_stale_and_expired(cache, clock):
+    assert cache.get("pchome", "衛生紙") == ([], MISS)
+    cache.set("pchome", "衛生紙", PRODUCTS)
+    assert cache.get("pchome", "衛生紙") == (PRODUCTS, FRESH)
+    clock.now += 30
+    assert cache.get("pchome", "衛生紙") == (PRODUCTS, STALE)
+    clock.now += 31
+    assert cache.get("pchome", "衛生紙") == ([], MISS)
+
+
+def test_keyword_is_normalized_and_copies_are_returned(cache, clock):
+    cache.set("pchome", "ＡＢＣ  衛生紙", PRODUCTS)
+    products, state = cache.get("pchome", "abc 衛生紙")
+    assert state == FRESH
+    products[0]["price"] = 1
+    assert cache.get("pchome", "abc 衛生紙")[0] == PRODUCTS
+
+
+def test_memory_eviction_falls_back_to_sqlite(tmp_path, clock):
+    cache = SearchCache(db_path=str(tmp_path / "search_cache.db"), max_memory_entries=1)
+    cache.set("pchome", "衛生紙", PRODUCTS)
+    cache.set("pchome", "滑鼠", PRODUCTS)
+    assert list(cache._memory) == [("pchome", "滑鼠")]
+    assert cache.get("pchome", "衛生紙") == (PRODUCTS, FRESH)
+    # 重新開啟後仍可從 SQLite 讀到
+    reopened = SearchCache(db_path=cache.db_path)
+    assert reopened.get("pchome", "滑鼠") == (PRODUCTS, FRESH)
+
+
+def test_rows_past_hard_ttl_are_pruned_on_write(cache, clock):
+    cache.set("pchome", "衛生紙", PRODUCTS)
+    clock.now += 61
+    cache.set("pchome", "滑鼠", PRODUCTS)
+    keywords = [row[0] for row in cache._conn.execute("SELECT keyword FROM search_cache")]
+    assert keywords == ["滑鼠"]
+
+
+def test_refresh_runs_once_per_key(cache):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        await cache.aset("pchome", "衛生紙", PRODUCTS)
+
+    async def main():
+        cache.arefresh("pchome", "衛生紙", fetch)
+        cache.arefresh("pchome", "衛生紙", fetch)  # 前一個尚未完成，不再重複抓取
+        await asyncio.gather(*cache._tasks)
+        return await cache.aget("pchome", "衛生紙")
+
+    assert asyncio.run(main()) == (PRODUCTS, FRESH)
+    assert len(calls) == 1
+    assert not cache._refreshing
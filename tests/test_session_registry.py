@@ -0,0 +1,75 @@
+import pytest
+
+from agents import session_registry
+from agents.session_registry import SessionRegistry
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(session_registry, "time", clock)
+    return clock
+
+
+def test_unknown_ids_get_a_server_generated_id(clock):
+    registry = SessionRegistry()
+    session = registry.get("chosen-by-client")
+    assert session.session_id != "chosen-by-client"
+    assert registry.get(session.session_id) is session
+    assert registry.get(None) is not session
+
+
+def test_reset_issues_a_new_id(clock):
+    registry = SessionRegistry()
+    session = registry.get(None)
+    fresh = registry.reset(session.session_id)
+    assert fresh.session_id != session.session_id
+    assert registry.stats()["sessions"] == 1
+
+
+def test_idle_sessions_expire(clock):
+    registry = SessionRegistry(idle_ttl=60)
+    old = registry.get(None)
+    clock.now += 30
+    recent = registry.get(None)
+    clock.now += 31
+    registry.get(recent.session_id)  # 每次取得都會先淘汰閒置逾時者
+    assert registry.stats()["sessions"] == 1
+    assert registry.get(old.session_id).session_id != old.session_id
+
+
+def test_idle_scan_stops_at_first_live_session(clock):
+    registry = SessionRegistry(idle_ttl=60)
+    first, second = registry.get(None), registry.get(None)
+    clock.now += 50
+    registry.get(first.session_id)  # first 移到最近使用的一端
+    clock.now += 20  # second 逾時，first 仍在使用中
+    registry.get(first.session_id)
+    assert list(registry._sessions) == [first.session_id]
+
+
+def test_least_recently_used_is_evicted_over_max_sessions(clock):
+    registry = SessionRegistry(max_sessions=2)
+    a, b = registry.get(None), registry.get(None)
+    registry.get(a.session_id)
+    registry.get(None)
+    assert list(registry._sessions)[0] == a.session_id
+    assert b.session_id not in registry._sessions
+
+
+def test_memory_cap_keeps_the_active_session(clock):
+    registry = SessionRegistry(max_total_bytes=300)
+    idle, active = registry.get(None), registry.get(None)
+    active.chat_history = [{"user": "衛生紙" * 30, "assistant": "好的"}]
+    registry.update_size(active)
+    assert list(registry._sessions) == [active.session_id]
+    assert idle.session_id not in registry._sessions
+    assert registry.stats()["total_bytes"] == active.size_bytes
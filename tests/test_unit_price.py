@@ -0,0 +1,29 @@
+import pytest
+
+from unit_price import parse_quantity
+
+
+@pytest.mark.parametrize("title, quantity", [
+    # 單一包裝數量
+    ("可口可樂 330ml 24罐", 24),
+    ("五月花 三入組", 3),
+    ("無線滑鼠", 1),
+    # 同一數量重複出現只算一次
+    ("好神拖 6入組 (6入)", 6),
+    ("12入 12入", 12),
+    ("舒潔 衛生紙 100抽x10包 (10包/串)", 10),
+    # 不同單位的巢狀包裝相乘
+    ("12包x6串", 72),
+    ("舒潔 抽取式衛生紙 110抽x12包x6串", 72),
+    # 標示總數
+    ("益生菌 2盒 共60包", 60),
+    # 緊接在包裝數或空白後的乘數
+    ("6入x3", 18),
+    ("衛生紙 100抽 x 3", 3),
+    ("洗衣精 2000ml x4瓶", 4),
+    # 型號與尺寸不是乘數
+    ("螺絲 M3x10 100入", 100),
+    ("枕頭套 30x40cm 2入", 2),
+])
+def test_parse_quantity(title, quantity):
+    assert parse_quantity(title) == quantity
@@ -0,0 +1,193 @@
+import asyncio
+import atexit
+import logging
+import os
+import re
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Coroutine, List, Optional
+
+from playwright.async_api import Browser, BrowserContext, Page, Playwright, Route, async_playwright
+
+from http_client import close_async_session
+from tracing import metrics, span
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# 瀏覽器池設定（可用環境變數調整）
+POOL_CONTEXTS = int(os.environ.get("BROWSER_POOL_CONTEXTS", 2))  # 常駐的 BrowserContext 數
+MAX_PAGES_PER_CONTEXT = int(os.environ.get("BROWSER_MAX_PAGES_PER_CONTEXT", 50))  # 載入這麼多頁後汰換 context
+MAX_CONCURRENT_PAGES = int(os.environ.get("BROWSER_MAX_CONCURRENT_PAGES", 4))  # 同時開啟的分頁上限
+
+# 解析商品列表用不到的資源一律攔截：圖片、字型、影音與追蹤/廣告腳本
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+BLOCKED_HOSTS = re.compile(
+    r"google-analytics\.com|googletagmanager\.com|doubleclick\.net|googlesyndication\.com|adservice\.google"
+    r"|facebook\.(com|net)|connect\.facebook|criteo\.(com|net)|scorecardresearch\.com|hotjar\.com|clarity\.ms"
+)
+
+
+async def _block_heavy_resources(route: Route):
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or BLOCKED_HOSTS.search(request.url):
+        metrics.inc("browser_blocked_requests_total", type=request.resource_type)
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+class _PooledContext:
+    """一個 BrowserContext 與其閒置分頁"""
+
+    def __init__(self, context: BrowserContext):
+        self.context = context
+        self.idle: List[Page] = []
+        self.in_use = 0
+        self.served = 0  # 已借出的分頁次數
+        self.retired = False  # 達到上限後不再借出，歸還完畢即關閉
+
+
+class BrowserPool:
+    """常駐的 Playwright 瀏覽器池
+
+    瀏覽器與 context 在第一次使用時啟動，之後跨查詢重複使用；分頁用完放回池中，
+    每個 context 借出 max_pages_per_context 次後汰換，避免記憶體與 cookie 持續累積。
+    Playwright 物件只能在建立它的事件迴圈使用，因此池子有自己的背景事件迴圈，
+    呼叫端以 run()（同步）或 arun()（非同步）把協程交給它執行。
+    """
+
+    def __init__(self, headless: bool = True, contexts: int = POOL_CONTEXTS,
+                 max_pages_per_context: int = MAX_PAGES_PER_CONTEXT,
+                 max_concurrent_pages: int = MAX_CONCURRENT_PAGES):
+        self.headless = headless
+        self.contexts = contexts
+        self.max_pages_per_context = max_pages_per_context
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        self._playwright: Optional[Playwright] = None
+        self._browser: Optional[Browser] = None
+        self._contexts: List[_PooledContext] = []
+        self._launch_lock = asyncio.Lock()
+        self._context_lock = asyncio.Lock()  # 建立 context 時持有，同時湧入的請求不會超建
+        self._semaphore = asyncio.Semaphore(max_concurrent_pages)
+
+    # ---------- 事件迴圈 ----------
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="browser-pool", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """在瀏覽器池的事件迴圈執行協程，並阻塞等待結果"""
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result(timeout)
+
+    async def arun(self, coro: Coroutine) -> Any:
+        """從其他事件迴圈等待瀏覽器池執行協程"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._get_loop()))
+
+    # ---------- 瀏覽器與 context ----------
+
+    async def _ensure_browser(self):
+        if self._browser is not None and self._browser.is_connected():
+            return
+        async with self._launch_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            with span("browser_launch"):
+                self._browser = await self._playwright.chromium.launch(headless=self.headless)
+            self._contexts = []  # 瀏覽器重新啟動後，舊的 context 已失效
+
+    async def _new_context(self) -> _PooledContext:
+        context = await self._browser.new_context(user_agent=USER_AGENT)
+        await context.route("**/*", _block_heavy_resources)
+        return _PooledContext(context)
+
+    async def _pick_context(self) -> _PooledContext:
+        live = [pooled for pooled in self._contexts if not pooled.retired]
+        if len(live) < self.contexts:
+            async with self._context_lock:
+                # 等待鎖的期間可能已由其他請求補足，重新計算
+                live = [pooled for pooled in self._contexts if not pooled.retired]
+                while len(live) < self.contexts:
+                    pooled = await self._new_context()
+                    self._contexts.append(pooled)
+                    live.append(pooled)
+        return min(live, key=lambda pooled: pooled.in_use)
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Page]:
+        """借出一個分頁；正常歸還的分頁會留給下一次使用，發生錯誤的分頁直接關閉"""
+        async with self._semaphore:
+            await self._ensure_browser()
+            pooled = await self._pick_context()
+            reused = bool(pooled.idle)
+            page = pooled.idle.pop() if reused else await pooled.context.new_page()
+            pooled.in_use += 1
+            pooled.served += 1
+            if pooled.served >= self.max_pages_per_context:
+                pooled.retired = True
+            metrics.inc("browser_pages_total", reused=str(reused).lower())
+            healthy = False
+            try:
+                yield page
+                healthy = True
+            finally:
+                pooled.in_use -= 1
+                await self._release(pooled, page, healthy)
+
+    async def _release(self, pooled: _PooledContext, page: Page, healthy: bool):
+        if healthy and not pooled.retired and not page.is_closed():
+            pooled.idle.append(page)
+        elif not page.is_closed():
+            try:
+                await page.close()
+            except Exception as e:
+                logger.warning(f"關閉分頁失敗：{e}")
+        if pooled.retired and pooled.in_use == 0 and pooled in self._contexts:
+            self._contexts.remove(pooled)
+            metrics.inc("browser_contexts_recycled_total")
+            try:
+                await pooled.context.close()
+            except Exception as e:
+                logger.warning(f"關閉 BrowserContext 失敗：{e}")
+
+    async def close(self):
+        """關閉所有 context、瀏覽器與 Playwright，以及在池的事件迴圈上建立的 aiohttp session"""
+        await close_async_session()
+        for pooled in self._contexts:
+            try:
+                await pooled.context.close()
+            except Exception:
+                pass
+        self._contexts = []
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def shutdown(self, timeout: float = 10):
+        """同步關閉（行程結束時呼叫）"""
+        if self._loop is None:
+            return
+        try:
+            self.run(self.close(), timeout)
+        except Exception as e:
+            logger.warning(f"關閉瀏覽器池失敗：{e}")
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+
+# 行程內共用的瀏覽器池；第一次有 Momo 查詢時才啟動瀏覽器
+browser_pool = BrowserPool()
+atexit.register(browser_pool.shutdown)
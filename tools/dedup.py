@@ -0,0 +1,93 @@
+import os
+import re
+import unicodedata
+import zlib
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+# MinHash 簽章長度與分段（LSH banding）：32 個雜湊切成 8 段，每段 4 個；
+# 相似度約 0.6 以上的標題幾乎一定落入同一個桶
+NUM_PERM = 32
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+SHINGLE = 3  # 以 3 個字元為一片（中文標題沒有空白斷詞）
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", 0.6))  # 估計的 Jaccard 相似度達此值才合併
+
+_MERSENNE = (1 << 31) - 1
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, _MERSENNE, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _MERSENNE, size=NUM_PERM, dtype=np.uint64)
+
+# 賣場常見的宣傳字樣與括號標籤，不影響是否為同一商品
+_TAG_PATTERN = re.compile(r"[【\[〔（(「『][^】\]〕）)」』]{0,12}[】\]〕）)」』]")
+_NOISE_PATTERN = re.compile(r"免運費?|現貨|快速出貨|台灣出貨|24h|當天出貨|限時|特價|熱銷|正品|公司貨")
+_SYMBOL_PATTERN = re.compile(r"[\W_]+")
+
+
+def normalize_title(title: str) -> str:
+    """全形轉半形、轉小寫，去除括號標籤、宣傳字樣、符號與空白"""
+    text = unicodedata.normalize("NFKC", title).lower()
+    text = _TAG_PATTERN.sub("", text)
+    text = _NOISE_PATTERN.sub("", text)
+    return _SYMBOL_PATTERN.sub("", text)
+
+
+def minhash(title: str) -> np.ndarray:
+    """標題的 MinHash 簽章（長度 NUM_PERM）"""
+    text = normalize_title(title)
+    if len(text) <= SHINGLE:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + SHINGLE] for i in range(len(text) - SHINGLE + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _MERSENNE).min(axis=1)
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def cluster_indices(titles: Sequence[str], quantities: Sequence[int], threshold: float = DEDUP_THRESHOLD) -> List[List[int]]:
+    """依標題相似度分群，回傳各群的索引（群內與群間皆維持傳入順序，首個為代表）
+
+    包裝數量不同者不合併。每個項目只與所在桶的第一個項目比對，整體為線性時間。
+    """
+    if len(titles) < 2:
+        return [[i] for i in range(len(titles))]
+    signatures = np.stack([minhash(title) for title in titles])
+    parent = list(range(len(titles)))
+    for band in range(BANDS):
+        anchors: Dict[tuple, int] = {}
+        keys = signatures[:, band * ROWS:(band + 1) * ROWS]
+        for i, key in enumerate(map(tuple, keys.tolist())):
+            anchor = anchors.setdefault((quantities[i], key), i)
+            if anchor == i:
+                continue
+            root_i, root_anchor = _find(parent, i), _find(parent, anchor)
+            if root_i == root_anchor:
+                continue
+            if np.mean(signatures[i] == signatures[anchor]) >= threshold:
+                # 以順序較前者為根，代表即為群內最前面的一筆
+                parent[max(root_i, root_anchor)] = min(root_i, root_anchor)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(titles)):
+        groups.setdefault(_find(parent, i), []).append(i)
+    return list(groups.values())
+
+
+def cluster_batch(batch, threshold: float = DEDUP_THRESHOLD):
+    """把不同平台、不同賣家的近似重複商品合併為一筆
+
+    每群保留批次中最前面的一筆（已依單價排序時即最低價）作為代表，以 take() 取出；
+    其餘以 offers（平台、價格、網址）附在代表商品上。
+    """
+    groups = cluster_indices(batch.titles, batch.quantity.tolist(), threshold)
+    if len(groups) == len(batch):
+        return batch
+    offers = {new: [batch.offer(i) for i in group[1:]] for new, group in enumerate(groups) if len(group) > 1}
+    return batch.take([group[0] for group in groups]).with_offers(offers)
@@ -3,14 +3,90 @@ from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
 import asyncio
 import json
-from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
 import sys
 import os
 sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.runtime import run_coroutine
+from pchome_crawler import fetch_products_async as fetch_pchome_async
+from yahoo_crawler import fetch_products_async as fetch_yahoo_async
+from routn_crawler import fetch_products_async as fetch_ruten_async
+from product_batch import ProductBatch
+from dedup import cluster_batch
+from tracing import metrics, span
+from search_cache import FRESH, STALE, SearchCache
+from platform_health import OPEN, get_health
+
+logger = logging.getLogger(__name__)
+
+# 關鍵字層級的搜尋結果快取，行程內所有工具實例共用（第一次搜尋時才開啟資料庫）
+_search_cache: Optional[SearchCache] = None
+_search_cache_lock = threading.Lock()
+
+# 一輪搜尋的總延遲預算（秒）；時間到時直接回傳已完成平台的結果
+PLATFORM_BUDGET_SECONDS = float(os.environ.get("PLATFORM_BUDGET_SECONDS", 8))
+# 選用：某平台耗時超過其歷史 p90 時，再送出一個相同的請求，取先完成者（PLATFORM_HEDGE=1 開啟）
+HEDGE_ENABLED = os.environ.get("PLATFORM_HEDGE", "").lower() in ("1", "true", "yes")
+HEDGE_QUANTILE = float(os.environ.get("PLATFORM_HEDGE_QUANTILE", 0.9))
+HEDGE_MIN_SAMPLES = int(os.environ.get("PLATFORM_HEDGE_MIN_SAMPLES", 20))
+# 合併跨平台、跨賣家的近似重複商品（PRODUCT_DEDUP=0 關閉）
+DEDUP_ENABLED = os.environ.get("PRODUCT_DEDUP", "1").lower() not in ("0", "false", "no")
+
+# 超過預算仍在進行的非同步抓取，完成後結果會寫入快取
+_background_tasks = set()
+
+
+def get_search_cache() -> SearchCache:
+    """取得共用的搜尋結果快取"""
+    global _search_cache
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                _search_cache = SearchCache()
+    return _search_cache
+
+
+def _hedge_delay(platform: str) -> Optional[float]:
+    """送出備援請求前要等待的秒數；未開啟或樣本不足時回傳 None"""
+    if not HEDGE_ENABLED:
+        return None
+    return metrics.percentile("platform_fetch_seconds", HEDGE_QUANTILE, min_count=HEDGE_MIN_SAMPLES, platform=platform)
+
+
+class SearchResults(ProductBatch):
+    """依單價排序的商品批次，另以 platform_status 記錄各平台本輪的抓取狀態
+
+    狀態：ok、empty、error、timeout（超過預算）、circuit_open（平台斷路中）、fresh / stale（來自快取）。
+    """
+
+    def __init__(self, batch: ProductBatch, platform_status: Optional[Dict[str, Dict]] = None):
+        super().__init__(batch.price, batch.quantity, batch.unit_price, batch.platform,
+                         batch.title, batch.url, batch.image_url, batch.offers)
+        self.platform_status = platform_status or {}
+
+
+def _finish(all_products: List[Dict], platform_status: Dict[str, Dict]) -> SearchResults:
+    for platform, info in platform_status.items():
+        metrics.inc("platform_status_total", platform=platform, status=info["status"])
+    successful_platforms = [p for p, info in platform_status.items() if info["products"]]
+    if not successful_platforms:
+        logger.warning(f"警告：所有平台搜尋都失敗了")
+    else:
+        logger.info(f"成功從以下平台獲取資料：{', '.join(successful_platforms)}")
+    timed_out = [p for p, info in platform_status.items() if info["status"] == "timeout"]
+    if timed_out:
+        logger.warning(f"警告：{', '.join(timed_out)} 平台超過延遲預算，先回傳其他平台的結果")
+    # 轉成欄式批次後計算單價，移除價格為 0 或異常的商品，並按單價排序
+    ranked = ProductBatch.from_dicts(all_products).rank_by_unit_price()
+    if DEDUP_ENABLED:
+        # 近似重複的商品只保留最低價的一筆，其他賣場列在 offers
+        ranked = cluster_batch(ranked)
+    return SearchResults(ranked, platform_status)
 
-from pchome_crawler import fetch_products as fetch_pchome
-from yahoo_crawler import fetch_products as fetch_yahoo
-from routn_crawler import fetch_products as fetch_ruten
 
 class SearchInput(BaseModel):
     """搜尋輸入參數"""
@@ -25,72 +101,131 @@ class EcommerceTool(BaseTool):
     """
     args_schema: Any = SearchInput
 
-    def _fetch_all_platforms(self, keyword: str) -> List[Dict]:
-        """從所有平台抓取商品資訊"""
+    async def _afetch_all_platforms(self, keyword: str, budget: Optional[float] = None) -> SearchResults:
+        """從所有平台抓取商品資訊，最多等待 budget 秒（預設 PLATFORM_BUDGET_SECONDS）
+
+        各平台在同一個事件迴圈中並行抓取，同步呼叫（_run）也經由共用事件迴圈執行這裡。
+        """
         all_products = []
         max_products = 50  # 每個平台抓取的商品數量
         max_retries = 3   # 最大重試次數
-        
-        # 建立平台對應的函數字典
+        start = time.monotonic()
+        deadline = start + (PLATFORM_BUDGET_SECONDS if budget is None else budget)
+        search_cache = get_search_cache()
+
         platform_functions = {
-            "pchome": fetch_pchome,
-            "yahoo": fetch_yahoo,
-            "ruten": fetch_ruten
+            "pchome": fetch_pchome_async,
+            "yahoo": fetch_yahoo_async,
+            "ruten": fetch_ruten_async
         }
-        
-        def fetch_with_retry(func, platform_name, keyword, max_products):
-            """帶有重試機制的爬蟲函數"""
-            for attempt in range(max_retries):
-                try:
-                    return func(keyword, max_products)
-                except Exception as e:
-                    if attempt == max_retries - 1:  # 最後一次嘗試
-                        print(f"警告：{platform_name} 平台搜尋失敗（重試 {attempt + 1}/{max_retries}）")
-                        print(f"錯誤訊息：{str(e)}")
-                        return []
-                    print(f"警告：{platform_name} 平台搜尋失敗，正在重試（{attempt + 1}/{max_retries}）")
-                    import time
-                    time.sleep(1)  # 重試前等待 1 秒
-            return []
-        
-        # 使用 ThreadPoolExecutor 平行處理各平台的請求
-        with ThreadPoolExecutor(max_workers=len(platform_functions)) as executor:
-            # 建立任務列表
-            future_to_platform = {
-                executor.submit(
-                    fetch_with_retry,
-                    platform_functions[platform],
-                    platform,
-                    keyword,
-                    max_products
-                ): platform 
-                for platform in platform_functions
-            }
-            
-            # 收集結果
-            successful_platforms = []
-            for future in future_to_platform:
-                platform = future_to_platform[future]
-                try:
-                    products = future.result()
-                    if products:
-                        all_products.extend(products)
-                        successful_platforms.append(platform)
-                except Exception as e:
-                    print(f"錯誤：{platform} 平台發生未預期的錯誤: {str(e)}")
-        
-        if not successful_platforms:
-            print(f"警告：所有平台搜尋都失敗了")
-        else:
-            print(f"成功從以下平台獲取資料：{', '.join(successful_platforms)}")
-        
-        # 按價格排序
-        all_products.sort(key=lambda x: x["price"])
-        
-        # 移除價格為 0 或異常的商品
-        all_products = [p for p in all_products if p["price"] > 0]
-        
-        return all_products
+
+        async def fetch_with_retry(func, platform_name, keyword, max_products):
+            """帶有重試機制的非同步爬蟲函數；全部失敗時回傳 None"""
+            health = get_health(platform_name)
+            with span("platform_fetch", platform=platform_name) as attrs:
+                for attempt in range(max_retries):
+                    attrs["retries"] = attempt
+                    try:
+                        products = await func(keyword, max_products)
+                        attrs["products"] = len(products)
+                        return products
+                    except Exception as e:
+                        delay = health.backoff(attempt)
+                        if attempt == max_retries - 1 or time.monotonic() + delay >= deadline or not health.available():
+                            logger.warning(f"警告：{platform_name} 平台搜尋失敗（重試 {attempt + 1}/{max_retries}）")
+                            logger.warning(f"錯誤訊息：{str(e)}")
+                            return None
+                        logger.warning(f"警告：{platform_name} 平台搜尋失敗，正在重試（{attempt + 1}/{max_retries}）")
+                        metrics.inc("platform_retries_total", platform=platform_name)
+                        await asyncio.sleep(delay)  # 指數退避（含抖動）後重試
+                return None
+
+        async def fetch_and_store(platform_name):
+            health = get_health(platform_name)
+            if not health.available():
+                return None, "circuit_open"  # 平台斷路中，不送出請求
+            products = await fetch_with_retry(platform_functions[platform_name], platform_name, keyword, max_products)
+            if products:
+                await search_cache.aset(platform_name, keyword, products)
+                return products, "ok"
+            if health.state == OPEN:
+                return products, "circuit_open"
+            return products, ("error" if products is None else "empty")
+
+        async def fetch_cached(platform_name):
+            """先查快取；過期但仍可用的結果直接回傳，並在背景重新抓取"""
+            cached, state = await search_cache.aget(platform_name, keyword)
+            if state == FRESH:
+                return cached, state
+            if state == STALE:
+                search_cache.arefresh(platform_name, keyword, lambda: fetch_and_store(platform_name))
+                return cached, state
+            return await fetch_and_store(platform_name)
+
+        pending = {asyncio.create_task(fetch_cached(platform)): platform for platform in platform_functions}
+        hedge_at = {}
+        for platform in platform_functions:
+            delay = _hedge_delay(platform)
+            if delay is not None:
+                hedge_at[platform] = start + delay
+        hedged = set()
+        platform_status = {}
+        try:
+            while len(platform_status) < len(platform_functions):
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                wake = min([deadline] + [t for p, t in hedge_at.items() if p not in hedged and p not in platform_status])
+                done, _ = await asyncio.wait(list(pending), timeout=max(0.0, wake - now), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    platform = pending.pop(task)
+                    if platform in platform_status:
+                        continue
+                    try:
+                        products, status = task.result()
+                    except Exception as e:
+                        logger.error(f"錯誤：{platform} 平台發生未預期的錯誤: {str(e)}")
+                        products, status = [], "error"
+                    if status == "error" and platform in pending.values():
+                        continue  # 另一個備援請求仍在進行，等它的結果
+                    products = products or []
+                    all_products.extend(products)
+                    platform_status[platform] = {
+                        "status": status,
+                        "products": len(products),
+                        "seconds": round(time.monotonic() - start, 3),
+                        "hedged": platform in hedged,
+                    }
+                    # 備援請求中較慢的一方直接取消
+                    for other, other_platform in list(pending.items()):
+                        if other_platform == platform:
+                            other.cancel()
+                            del pending[other]
+                now = time.monotonic()
+                for platform, at in hedge_at.items():
+                    if platform not in hedged and platform not in platform_status and now >= at:
+                        hedged.add(platform)
+                        metrics.inc("platform_hedges_total", platform=platform)
+                        pending[asyncio.create_task(fetch_and_store(platform))] = platform
+        except asyncio.CancelledError:
+            # 整輪被取消（例如預先爬取作廢）時一併取消各平台的抓取
+            for task in pending:
+                task.cancel()
+            raise
+
+        # 超過預算的抓取留在背景完成，結果寫入快取供下一輪使用
+        for task in pending:
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        for platform in platform_functions:
+            if platform not in platform_status:
+                platform_status[platform] = {
+                    "status": "timeout",
+                    "products": 0,
+                    "seconds": round(time.monotonic() - start, 3),
+                    "hedged": platform in hedged,
+                }
+        return _finish(all_products, platform_status)
 
     def _format_products(self, products: List[Dict], keyword: str) -> str:
         """格式化商品資訊"""
@@ -146,18 +281,17 @@ class EcommerceTool(BaseTool):
     def _run(self, keyword: str) -> str:
         """執行工具"""
         try:
-            # 抓取所有平台的商品
-            all_products = self._fetch_all_platforms(keyword)
-            
-            # 格式化輸出
-            return all_products
-            
+            # 與 _arun 共用同一份流程，在共用的事件迴圈上執行
+            return run_coroutine(self._afetch_all_platforms(keyword))
         except Exception as e:
             return f"搜尋過程發生錯誤: {str(e)}"
 
     async def _arun(self, keyword: str) -> str:
-        """異步執行工具"""
-        return self._run(keyword)
+        """異步執行工具，直接使用非同步爬蟲，不佔用執行緒"""
+        try:
+            return await self._afetch_all_platforms(keyword)
+        except Exception as e:
+            return f"搜尋過程發生錯誤: {str(e)}"
 
 def get_ecommerce_tool() -> EcommerceTool:
     """獲取電商搜尋工具實例"""
@@ -169,5 +303,5 @@ if __name__ == "__main__":
     tool = get_ecommerce_tool()
     result = tool.run("羽毛球拍")
     with open("test_result.json", "w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=4)
+        json.dump(result.to_dicts() if isinstance(result, ProductBatch) else result, f, ensure_ascii=False, indent=4)
     # print(result) 
\ No newline at end of file
@@ -0,0 +1,43 @@
+import logging
+import os
+from typing import Sequence
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+logger = logging.getLogger(__name__)
+
+try:
+    import lxml  # noqa: F401  選用的 C 解析器
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+# 可用的解析後端：
+# - html.parser：純 Python 解析器建立完整 DOM（原本的做法）
+# - lxml：以 C 實作的 lxml 建立完整 DOM（需安裝 lxml）
+# - strainer：只建立指定 class 的節點與其子孫（SoupStrainer），有 lxml 時以 lxml 掃描
+BACKENDS = ("html.parser", "lxml", "strainer")
+DEFAULT_BACKEND = os.environ.get("SCRAPER_HTML_BACKEND", "strainer")
+
+
+def resolve_backend(backend: str = None) -> str:
+    """檢查後端名稱；未安裝 lxml 時，lxml 後端退回 html.parser"""
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"不支援的 HTML 解析後端: {backend}（可用：{', '.join(BACKENDS)}）")
+    if backend == "lxml" and not HAS_LXML:
+        logger.warning("未安裝 lxml，改用 html.parser")
+        return "html.parser"
+    return backend
+
+
+def make_soup(html: str, backend: str, only_classes: Sequence[str] = ()) -> BeautifulSoup:
+    """依後端（已由 resolve_backend 檢查）解析 HTML
+
+    only_classes 為頁面中實際會用到的最外層節點 class（例如商品卡片與結果狀態標記），
+    strainer 後端只保留這些節點，之後的 CSS 選擇器結果與完整 DOM 相同。
+    """
+    if backend == "strainer" and only_classes:
+        parser = "lxml" if HAS_LXML else "html.parser"
+        return BeautifulSoup(html, parser, parse_only=SoupStrainer(class_=list(only_classes)))
+    return BeautifulSoup(html, "html.parser" if backend == "strainer" else backend)
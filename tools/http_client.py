@@ -0,0 +1,97 @@
+import asyncio
+import os
+import threading
+from typing import Any, Coroutine, Dict, Tuple
+
+import aiohttp
+
+# 請求的預設總逾時（秒）
+DEFAULT_TIMEOUT = 10
+
+# 連線池設定（可用環境變數調整）
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 20))  # 每個主機保留的 keep-alive 連線數
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", 30))
+
+_lock = threading.Lock()
+
+# ---------- 非同步（aiohttp） ----------
+
+# aiohttp 的 session 不能跨事件迴圈使用，因此以 (事件迴圈, 平台) 為鍵
+_sessions: Dict[Tuple[asyncio.AbstractEventLoop, str], aiohttp.ClientSession] = {}
+# 以 TraceConfig 統計非同步連線的建立與重用次數
+_async_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _count(platform: str, key: str):
+    with _lock:
+        stats = _async_stats.setdefault(platform, {"requests": 0, "new_connections": 0, "reused_connections": 0})
+        stats[key] += 1
+
+
+def _trace_config(platform: str) -> aiohttp.TraceConfig:
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, context, params):
+        _count(platform, "requests")
+
+    async def on_connection_create_end(session, context, params):
+        _count(platform, "new_connections")
+
+    async def on_connection_reuseconn(session, context, params):
+        _count(platform, "reused_connections")
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    return trace_config
+
+
+def get_async_session(platform: str = "default") -> aiohttp.ClientSession:
+    """取得目前事件迴圈中指定平台共用的 aiohttp ClientSession，必須在事件迴圈中呼叫"""
+    loop = asyncio.get_running_loop()
+    key = (loop, platform)
+    session = _sessions.get(key)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=POOL_SIZE,
+            limit_per_host=POOL_SIZE,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT, connect=CONNECT_TIMEOUT),
+            trace_configs=[_trace_config(platform)]
+        )
+        _sessions[key] = session
+    return session
+
+
+async def close_async_session():
+    """關閉目前事件迴圈的所有共用 session（事件迴圈結束前呼叫）"""
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _sessions if key[0] is loop]:
+        session = _sessions.pop(key)
+        if not session.closed:
+            await session.close()
+
+
+def run_standalone(coro: Coroutine) -> Any:
+    """在新的事件迴圈執行協程（命令列測試用），結束前關閉該迴圈的共用 session"""
+    async def run():
+        try:
+            return await coro
+        finally:
+            await close_async_session()
+
+    return asyncio.run(run())
+
+
+# ---------- 統計 ----------
+
+def pool_stats() -> Dict[str, Dict[str, Dict[str, int]]]:
+    """各平台的請求數、新建連線數與重用連線數"""
+    with _lock:
+        async_stats = {platform: dict(stats) for platform, stats in _async_stats.items()}
+    return {"async": async_stats}
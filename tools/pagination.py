@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Tuple, Type, Union
+
+logger = logging.getLogger(__name__)
+
+# 同一關鍵字同時抓取的頁數上限（實際速率另由各主機的令牌桶控制）
+PAGE_CONCURRENCY = int(os.environ.get("CRAWL_PAGE_CONCURRENCY", 3))
+
+PageResult = Union[List[Dict], Exception]
+
+
+def pages_needed(max_products: int, page_size: int) -> int:
+    return max(1, -(-max_products // page_size))
+
+
+def _is_last(result: PageResult, page_size: int) -> bool:
+    return isinstance(result, Exception) or len(result) < page_size
+
+
+async def fetch_pages_async(fetch_page: Callable[[int], Awaitable[List[Dict]]], num_pages: int, page_size: int,
+                            errors: Tuple[Type[Exception], ...], concurrency: int = PAGE_CONCURRENCY) -> List[PageResult]:
+    """同時抓取第 1..num_pages 頁，依頁碼順序回傳結果或例外
+
+    每次同時送出 concurrency 頁；某一波出現失敗或不滿一頁時，不再送出後續頁面。
+    """
+    async def run(page: int) -> PageResult:
+        try:
+            return await fetch_page(page)
+        except errors as e:
+            return e
+
+    results: List[PageResult] = []
+    for start in range(1, num_pages + 1, concurrency):
+        wave = await asyncio.gather(*(run(page) for page in range(start, min(start + concurrency, num_pages + 1))))
+        results.extend(wave)
+        if any(_is_last(result, page_size) for result in wave):
+            break
+    return results
+
+
+def collect_pages(results: List[PageResult], page_size: int) -> List[Dict]:
+    """依頁碼順序合併商品；遇到失敗、空白或不滿一頁時停止（之後的頁面不採用）
+
+    第 1 頁失敗時直接拋出該例外，讓呼叫端的重試、退避與斷路器處理；
+    之後的頁面失敗只保留先前頁面的結果。
+    """
+    products = []
+    for page, result in enumerate(results, 1):
+        if isinstance(result, Exception):
+            if page == 1:
+                raise result
+            logger.warning(f"請求第 {page} 頁失敗: {result}")
+            break
+        if not result:
+            logger.info(f"第 {page} 頁無數據，停止爬取")
+            break
+        products.extend(result)
+        if len(result) < page_size:
+            logger.info(f"第 {page} 頁僅有 {len(result)} 個商品，無更多數據")
+            break
+    return products
+
+
+def merge_batches(results: List[PageResult]) -> List[Dict]:
+    """依順序合併彼此獨立的批次（例如商品詳情）；部分失敗時略過，全部失敗時拋出第一個例外"""
+    if results and all(isinstance(result, Exception) for result in results):
+        raise results[0]
+    return [item for result in results if not isinstance(result, Exception) for item in result]
@@ -1,11 +1,26 @@
-import requests
+import logging
+import aiohttp
+import asyncio
 import json
+import os
 import time
 from typing import List, Dict
 import uuid
 from urllib.parse import quote
 from datetime import datetime
 
+from http_client import get_async_session, run_standalone
+from pagination import collect_pages, fetch_pages_async, pages_needed
+from platform_health import CircuitOpenError, guard
+from rate_limiter import get_limiter
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# 可用環境變數覆寫（例如指向 loadtest 的模擬伺服器）
+BASE_URL = os.environ.get("PCHOME_SEARCH_URL", "https://ecshweb.pchome.com.tw/search/v3.3/all/results")
+PAGE_SIZE = 20  # PChome每頁通常顯示20個商品
+
 def get_headers() -> Dict:
     """生成模擬的請求頭"""
     return {
@@ -18,61 +33,48 @@ def get_headers() -> Dict:
         "sec-ch-ua-platform": '"Windows"'
     }
 
-def fetch_products(keyword: str, max_products: int = 100) -> List[Dict]:
-    """發送請求獲取商品清單，處理分頁"""
-    encoded_keyword = quote(keyword)
-    base_url = f"https://ecshweb.pchome.com.tw/search/v3.3/all/results"
-    headers = get_headers()
-    products = []
-    page = 1
-    
-    while True:
-        params = {
-            'q': keyword,
-            'page': page,
-            'sort': 'sale/dc',  # 依銷售量排序
-            'price': '0-999999'  # 價格範圍
+def build_params(keyword: str, page: int) -> Dict:
+    """建立指定頁數的查詢參數"""
+    return {
+        'q': keyword,
+        'page': str(page),
+        'sort': 'sale/dc',  # 依銷售量排序
+        'price': '0-999999'  # 價格範圍
+    }
+
+def parse_products(data: Dict) -> List[Dict]:
+    """將 API 回應轉換為統一的商品格式"""
+    return [
+        {
+            "title": item.get("name", ""),
+            "price": float(item.get("price", 0)),
+            "image_url": f"https://cs-a.ecimg.tw{item.get('picB', '')}",
+            "url": f"https://24h.pchome.com.tw/prod/{item.get('Id', '')}",
+            "platform": "PChome"
         }
-        
-        try:
-            response = requests.get(base_url, params=params, headers=headers, timeout=10)
+        for item in data.get('prods') or []
+    ]
+
+async def fetch_page_async(keyword: str, page: int, headers: Dict) -> List[Dict]:
+    """抓取單一頁商品（先向主機的令牌桶取得配額）"""
+    await get_limiter(BASE_URL).acquire_async()
+    with guard("pchome"), span("platform_page", platform="pchome") as attrs:
+        attrs["page"] = page
+        async with get_async_session("pchome").get(BASE_URL, params=build_params(keyword, page), headers=headers) as response:
             response.raise_for_status()
-            data = response.json()
-            
-            if not data.get('prods'):
-                print(f"第 {page} 頁無數據，停止爬取")
-                break
-            
-            for item in data['prods']:
-                product_info = {
-                    "title": item.get("name", ""),
-                    "price": float(item.get("price", 0)),
-                    "image_url": f"https://cs-a.ecimg.tw{item.get('picB', '')}",
-                    "url": f"https://24h.pchome.com.tw/prod/{item.get('Id', '')}",
-                    "platform": "PChome"
-                }
-                products.append(product_info)
-            
-            # 檢查是否達到最大商品數量
-            if len(products) >= max_products:
-                # print(f"已獲取 {len(products)} 個商品，達到最大數量限制")
-                break
-            
-            # 檢查是否還有下一頁
-            if len(data['prods']) < 20:  # PChome每頁通常顯示20個商品
-                print(f"第 {page} 頁僅有 {len(data['prods'])} 個商品，無更多數據")
-                break
-            
-            page += 1
-            time.sleep(1)  # 延遲1秒，防止反爬
-            
-        except requests.RequestException as e:
-            print(f"請求第 {page} 頁失敗: {e}")
-            break
-        except json.JSONDecodeError as e:
-            print(f"解析第 {page} 頁JSON失敗: {e}")
-            break
-    print(f"獲取到 {len(products)} 個PChome商品")
+            return parse_products(await response.json(content_type=None))
+
+async def fetch_products_async(keyword: str, max_products: int = 100) -> List[Dict]:
+    """發送請求獲取商品清單，所需頁面同時抓取（共用的 aiohttp session，速率由主機的令牌桶控制）"""
+    headers = get_headers()
+    results = await fetch_pages_async(
+        lambda page: fetch_page_async(keyword, page, headers),
+        pages_needed(max_products, PAGE_SIZE),
+        PAGE_SIZE,
+        errors=(aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError, CircuitOpenError)
+    )
+    products = collect_pages(results, PAGE_SIZE)
+    logger.info(f"獲取到 {len(products)} 個PChome商品")
     return products[:max_products]
 
 def crawl_pchome_products(keyword: str, output_file: str = None, max_products: int = 100) -> None:
@@ -80,7 +82,7 @@ def crawl_pchome_products(keyword: str, output_file: str = None, max_products: i
     print(f"開始爬取關鍵字: {keyword}")
     
     # 獲取商品詳情
-    products = fetch_products(keyword, max_products)
+    products = run_standalone(fetch_products_async(keyword, max_products))
     print(f"獲取到 {len(products)} 個商品")
     
     if not products:
@@ -0,0 +1,258 @@
+import asyncio
+import atexit
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from tracing import metrics, span
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_LOG_DIR = os.path.join(PROJECT_ROOT, "data", "crawl_log")
+DEFAULT_PRODUCT_DB_PATH = os.path.join(PROJECT_ROOT, "data", "products.db")
+
+PRODUCT_DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    platform TEXT NOT NULL,
+    title TEXT NOT NULL,
+    price TEXT NOT NULL,
+    link TEXT NOT NULL,
+    query TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_products_query_created ON products (query, created_at);
+CREATE INDEX IF NOT EXISTS idx_products_platform_link ON products (platform, link);
+"""
+
+# WAL 讓讀取不阻塞寫入；WAL 下 synchronous=NORMAL 只在 checkpoint 時 fsync
+PRODUCT_DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",  # 約 16 MB 頁快取
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+def _to_json(value: Any) -> Any:
+    """商品批次（ProductBatch）等物件在寫入執行緒中才轉成 JSON 可序列化的形式"""
+    if hasattr(value, "to_dicts"):
+        return value.to_dicts()
+    raise TypeError(f"無法序列化 {type(value).__name__}")
+
+
+class CrawlLogSink:
+    """追加寫入的壓縮爬蟲紀錄（JSON Lines + gzip），超過大小即輪替
+
+    每批寫入一個 gzip member；gzip 允許多個 member 串接，`gzip.open` 可直接讀回整個檔案。
+    """
+
+    def __init__(self, log_dir: str = None, max_bytes: int = 16 * 1024 * 1024, backup_count: int = 10):
+        self.log_dir = log_dir or os.environ.get("CRAWL_LOG_DIR", DEFAULT_LOG_DIR)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.path = os.path.join(self.log_dir, "crawl.jsonl.gz")
+
+    def write_batch(self, records: List[Dict[str, Any]]):
+        os.makedirs(self.log_dir, exist_ok=True)
+        lines = "".join(json.dumps(record, ensure_ascii=False, default=_to_json) + "\n" for record in records)
+        with gzip.open(self.path, "ab") as f:
+            f.write(lines.encode("utf-8"))
+        if os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        os.replace(self.path, os.path.join(self.log_dir, f"crawl-{stamp}.jsonl.gz"))
+        backups = sorted(glob.glob(os.path.join(self.log_dir, "crawl-*.jsonl.gz")))
+        for old in backups[:-self.backup_count] if self.backup_count else backups:
+            os.remove(old)
+
+    def close(self):
+        pass
+
+
+class ProductDbSink:
+    """把商品寫入 SQLite 商品表；連線只在寫入執行緒中建立並重複使用
+
+    第一次寫入時才建立資料表與索引、設定 WAL 等 pragma；每批以 executemany 在單一交易內寫入。
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or os.environ.get("PRODUCT_DB_PATH", DEFAULT_PRODUCT_DB_PATH)
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        for pragma in PRODUCT_DB_PRAGMAS:
+            conn.execute(pragma)
+        conn.executescript(PRODUCT_DB_SCHEMA)
+        return conn
+
+    def write_batch(self, records: List[Dict[str, Any]]):
+        if self._conn is None:
+            self._conn = self._connect()
+        rows = [
+            (product["platform"], product["title"], product["price"], product["link"], record["query"])
+            for record in records
+            for product in record["products"]
+        ]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO products (platform, title, price, link, query) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class WriteBehindQueue:
+    """背景寫入佇列：請求端只負責放入佇列，由單一寫入執行緒批次寫入 sink
+
+    - 佇列有上限；滿了之後 submit 最多等待 put_timeout 秒（背壓），仍滿則丟棄並計數；
+      在事件迴圈中呼叫時不等待，立即丟棄並計數，避免卡住同一迴圈上的其他請求
+    - 寫入執行緒每次最多取 batch_size 筆，或等待 flush_interval 秒後寫出目前累積的資料
+    - flush() 等待佇列清空；close() 於程式結束時寫出剩餘資料並停止執行緒
+    """
+
+    def __init__(self, sink, name: str = "crawl_log", max_queue: int = 1024, batch_size: int = 64,
+                 flush_interval: float = 1.0, put_timeout: float = 0.05):
+        self.sink = sink
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stop = object()
+        self._closed = False
+        self._stopping = False  # 佇列滿而放不進停止標記時，由寫入執行緒在清空後自行結束
+        self._thread = threading.Thread(target=self._drain, name=f"{name}-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """放入一筆待寫入資料；回傳 False 表示佇列已滿而被丟棄"""
+        if self._closed:
+            return False
+        try:
+            if _in_event_loop():
+                self._queue.put_nowait(record)
+            else:
+                self._queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            metrics.inc("persistence_dropped_total", queue=self.name)
+            logger.warning(f"{self.name} 寫入佇列已滿，丟棄一筆資料")
+            return False
+        metrics.set_gauge("persistence_queue_depth", self._queue.qsize(), queue=self.name)
+        return True
+
+    def _drain(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                if self._stopping:
+                    self.sink.close()
+                    return
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not self._stop:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is self._stop
+            records = [record for record in batch if record is not self._stop]
+            if records:
+                try:
+                    with span("persistence_write", queue=self.name):
+                        self.sink.write_batch(records)
+                    metrics.inc("persistence_records_total", len(records), queue=self.name)
+                except Exception as e:
+                    metrics.inc("persistence_errors_total", queue=self.name)
+                    logger.error(f"{self.name} 寫入失敗（{len(records)} 筆）：{e}")
+            for _ in batch:
+                self._queue.task_done()
+            metrics.set_gauge("persistence_queue_depth", self._queue.qsize(), queue=self.name)
+            if stopping:
+                self.sink.close()
+                return
+
+    def flush(self):
+        """阻塞直到目前佇列中的資料都已寫出"""
+        self._queue.join()
+
+    def close(self, timeout: float = 10.0):
+        """寫出剩餘資料並停止寫入執行緒（可重複呼叫）"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(self._stop, timeout=self.put_timeout)
+        except queue.Full:
+            self._stopping = True
+        self._thread.join(timeout)
+
+
+_crawl_log: Optional[WriteBehindQueue] = None
+_product_db: Optional[WriteBehindQueue] = None
+_crawl_log_lock = threading.Lock()
+
+
+def get_crawl_log() -> WriteBehindQueue:
+    """行程內共用的爬蟲紀錄佇列"""
+    global _crawl_log
+    with _crawl_log_lock:
+        if _crawl_log is None:
+            _crawl_log = WriteBehindQueue(
+                CrawlLogSink(max_bytes=int(os.environ.get("CRAWL_LOG_MAX_BYTES", 16 * 1024 * 1024))),
+                name="crawl_log",
+                max_queue=int(os.environ.get("CRAWL_LOG_QUEUE_SIZE", 1024))
+            )
+        return _crawl_log
+
+
+def close_crawl_log():
+    """關閉時的 flush 掛鉤（ASGI lifespan shutdown / atexit）"""
+    if _crawl_log is not None:
+        _crawl_log.close()
+
+
+def get_product_db() -> WriteBehindQueue:
+    """行程內共用的商品資料庫寫入佇列（第一次寫入時才開啟資料庫）"""
+    global _product_db
+    with _crawl_log_lock:
+        if _product_db is None:
+            _product_db = WriteBehindQueue(
+                ProductDbSink(),
+                name="product_db",
+                max_queue=int(os.environ.get("PRODUCT_DB_QUEUE_SIZE", 1024)),
+                batch_size=256
+            )
+        return _product_db
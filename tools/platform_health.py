@@ -0,0 +1,159 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from tracing import metrics
+
+# 斷路器設定（可用環境變數調整）
+WINDOW_SECONDS = float(os.environ.get("HEALTH_WINDOW_SECONDS", 30))  # 錯誤率與延遲的滾動視窗
+MIN_REQUESTS = int(os.environ.get("HEALTH_MIN_REQUESTS", 5))  # 視窗內至少幾個請求才判斷
+ERROR_THRESHOLD = float(os.environ.get("HEALTH_ERROR_THRESHOLD", 0.5))  # 錯誤率達此值即斷路
+COOLDOWN_SECONDS = float(os.environ.get("HEALTH_COOLDOWN_SECONDS", 5))  # 斷路後首次探測前的等待
+MAX_COOLDOWN_SECONDS = float(os.environ.get("HEALTH_MAX_COOLDOWN_SECONDS", 120))
+BACKOFF_BASE = float(os.environ.get("RETRY_BACKOFF_BASE", 0.25))  # 重試退避的起始秒數
+BACKOFF_CAP = float(os.environ.get("RETRY_BACKOFF_CAP", 4))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """平台處於斷路狀態，請求未送出"""
+
+    def __init__(self, platform: str):
+        super().__init__(f"{platform} 平台暫時停用（斷路中）")
+        self.platform = platform
+
+
+class PlatformHealth:
+    """單一平台的健康狀態：滾動視窗內的錯誤率與延遲，驅動斷路器
+
+    closed：正常放行；錯誤率超過門檻即轉為 open。
+    open：直接拒絕，冷卻時間到後轉為 half_open。
+    half_open：只放行一個探測請求，成功則回到 closed，失敗則以加倍（含抖動）的冷卻時間重新 open。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self._window: deque = deque()  # (時間, 是否成功, 延遲)
+        self._open_until = 0.0
+        self._trips = 0  # 連續斷路次數，決定冷卻時間
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        while self._window and now - self._window[0][0] > WINDOW_SECONDS:
+            self._window.popleft()
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.set_gauge("platform_circuit_state", _STATE_VALUES[state], platform=self.name)
+
+    def _trip(self, now: float):
+        cooldown = min(MAX_COOLDOWN_SECONDS, COOLDOWN_SECONDS * 2 ** self._trips)
+        self._open_until = now + cooldown * random.uniform(0.8, 1.2)
+        self._trips += 1
+        self._window.clear()
+        self._set_state(OPEN)
+        metrics.inc("platform_circuit_trips_total", platform=self.name)
+
+    def available(self) -> bool:
+        """是否值得送出請求（不佔用探測名額）"""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() >= self._open_until
+            return self.state == CLOSED or not self._probing
+
+    def allow(self) -> bool:
+        """送出請求前呼叫；half_open 時只有取得探測名額的請求會被放行"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() >= self._open_until:
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok: bool, latency: float):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN and self._probing:
+                self._probing = False
+                if ok:
+                    self._trips = 0
+                    self._set_state(CLOSED)
+                else:
+                    self._trip(now)
+                return
+            if self.state != CLOSED:
+                return  # 斷路前已送出的請求，結果不影響新的狀態
+            self._window.append((now, ok, latency))
+            self._prune(now)
+            failures = sum(1 for _, success, _ in self._window if not success)
+            if len(self._window) >= MIN_REQUESTS and failures / len(self._window) >= ERROR_THRESHOLD:
+                self._trip(now)
+
+    def release(self):
+        """請求被取消、沒有結果時釋放探測名額"""
+        with self._lock:
+            self._probing = False
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次重試前的等待秒數（指數退避 + full jitter）"""
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            self._prune(time.monotonic())
+            latencies = sorted(latency for _, _, latency in self._window)
+            failures = sum(1 for _, success, _ in self._window if not success)
+            return {
+                "state": self.state,
+                "requests": len(self._window),
+                "error_rate": round(failures / len(self._window), 4) if self._window else 0.0,
+                "p90_latency": round(latencies[int(0.9 * (len(latencies) - 1))], 4) if latencies else 0.0,
+            }
+
+
+_platforms: Dict[str, PlatformHealth] = {}
+_platforms_lock = threading.Lock()
+
+
+def get_health(platform: str) -> PlatformHealth:
+    """取得平台共用的健康狀態（行程內唯一）"""
+    health = _platforms.get(platform)
+    if health is None:
+        with _platforms_lock:
+            health = _platforms.setdefault(platform, PlatformHealth(platform))
+    return health
+
+
+@contextmanager
+def guard(platform: str) -> Iterator[None]:
+    """包住一次對平台的請求：斷路中直接拋出 CircuitOpenError，否則記錄成敗與延遲"""
+    health = get_health(platform)
+    if not health.allow():
+        metrics.inc("platform_circuit_rejected_total", platform=platform)
+        raise CircuitOpenError(platform)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        health.record(False, time.perf_counter() - start)
+        raise
+    except BaseException:
+        health.release()
+        raise
+    else:
+        health.record(True, time.perf_counter() - start)
+
+
+def health_stats() -> Dict[str, Dict]:
+    return {name: health.snapshot() for name, health in list(_platforms.items())}
@@ -0,0 +1,252 @@
+import sys
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from unit_price import parse_quantity
+
+
+class _InternTable:
+    """行程內共用的字串表（平台名稱），每列只存一個小整數代碼"""
+
+    def __init__(self):
+        self._values: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(value)
+                if code is None:
+                    code = len(self._values)
+                    self._values.append(value)
+                    self._codes[value] = code
+        return code
+
+    def value(self, code: int) -> str:
+        return self._values[code]
+
+
+_platforms = _InternTable()
+
+
+class _Strings:
+    """字串欄位：所有字串串接成一個共用緩衝區，各列只記錄起訖位置
+
+    take() 只重排起訖陣列，新舊批次共用同一個緩衝區。
+    """
+
+    def __init__(self, buffer: str, starts: np.ndarray, ends: np.ndarray):
+        self.buffer = buffer
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def from_list(cls, values: Sequence[str]) -> "_Strings":
+        lengths = np.fromiter((len(v) for v in values), dtype=np.int64, count=len(values))
+        ends = np.cumsum(lengths)
+        return cls("".join(values), ends - lengths, ends)
+
+    def __getitem__(self, i: int) -> str:
+        return self.buffer[self.starts[i]:self.ends[i]]
+
+    def take(self, indices: np.ndarray) -> "_Strings":
+        return _Strings(self.buffer, self.starts[indices], self.ends[indices])
+
+    def tolist(self) -> List[str]:
+        buffer = self.buffer
+        return [buffer[s:e] for s, e in zip(self.starts.tolist(), self.ends.tolist())]
+
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self.buffer) + self.starts.nbytes + self.ends.nbytes
+
+
+def _split_url(url: str) -> Tuple[str, str]:
+    """把網址拆成 scheme+host（例如 https://cs-a.ecimg.tw）與其後的路徑"""
+    start = url.find("://")
+    if start < 0:
+        return "", url
+    cut = url.find("/", start + 3)
+    if cut < 0:
+        return url, ""
+    return url[:cut], url[cut:]
+
+
+class _Urls:
+    """網址欄位：scheme+host 存成批次內的小表並以代碼參照，路徑放入共用緩衝區
+
+    路徑（商品代碼、圖片目錄）幾乎每個商品都不同，只有主機會大量重複；
+    主機表屬於批次本身，不會隨搜尋次數在行程中累積。
+    """
+
+    def __init__(self, hosts: List[str], codes: np.ndarray, paths: _Strings):
+        self.hosts = hosts
+        self.codes = codes
+        self.paths = paths
+
+    @classmethod
+    def from_list(cls, urls: Sequence[str]) -> "_Urls":
+        table: Dict[str, int] = {}
+        codes, paths = [], []
+        for url in urls:
+            host, path = _split_url(url)
+            codes.append(table.setdefault(host, len(table)))
+            paths.append(path)
+        dtype = np.uint16 if len(table) <= np.iinfo(np.uint16).max else np.uint32
+        return cls(list(table), np.array(codes, dtype=dtype), _Strings.from_list(paths))
+
+    def __getitem__(self, i: int) -> str:
+        return self.hosts[self.codes[i]] + self.paths[i]
+
+    def take(self, indices: np.ndarray) -> "_Urls":
+        return _Urls(self.hosts, self.codes[indices], self.paths.take(indices))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(sys.getsizeof(host) for host in self.hosts) + self.codes.nbytes + self.paths.nbytes
+
+
+class ProductBatch:
+    """欄式（columnar）的商品批次，取代一個商品一個 dict 的列表
+
+    - 價格、數量、單價為 NumPy 陣列；平台為共用字串表的代碼
+    - 標題與網址路徑存成共用緩衝區中的起訖位置，網址的 scheme+host 另以批次內的代碼儲存
+    - 排序、篩選皆為向量化運算，回傳共用緩衝區的新批次（不修改原批次）
+    - 只有在輸出給前端或寫入紀錄時，才以 to_dicts() / 迭代轉成 dict；
+      轉出的 dict 帶有依目前順序編號的 id（P1、P2...）
+
+    批次建立後不再修改，可安全地在執行緒與 session 之間共用。
+    """
+
+    def __init__(self, price: np.ndarray = None, quantity: np.ndarray = None, unit_price: np.ndarray = None,
+                 platform: np.ndarray = None, title: _Strings = None, url: _Urls = None, image_url: _Urls = None,
+                 offers: Optional[Dict[int, List[Dict]]] = None):
+        if price is None:
+            price = np.empty(0, dtype=np.float64)
+            quantity = np.empty(0, dtype=np.int32)
+            unit_price = np.empty(0, dtype=np.float64)
+            platform = np.empty(0, dtype=np.uint16)
+            title = _Strings.from_list([])
+            url = image_url = _Urls.from_list([])
+        self.price = price
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.platform = platform
+        self.title = title
+        self.url = url
+        self.image_url = image_url
+        self.offers = offers or {}  # 只有合併了近似重複商品的列才有（稀疏）
+
+    @classmethod
+    def from_dicts(cls, products: Iterable[Dict]) -> "ProductBatch":
+        """由爬蟲回傳的 dict 列表建立批次（爬蟲邊界只轉換一次）"""
+        products = list(products)
+        n = len(products)
+        price = np.fromiter((p.get("price", 0) or 0 for p in products), dtype=np.float64, count=n)
+        quantity = np.fromiter((p.get("quantity", 1) for p in products), dtype=np.int32, count=n)
+        unit_price = np.fromiter((p.get("unit_price", p.get("price", 0)) or 0 for p in products), dtype=np.float64, count=n)
+        offers = {i: p["offers"] for i, p in enumerate(products) if p.get("offers")}
+        return cls(
+            price=price,
+            quantity=quantity,
+            unit_price=unit_price,
+            platform=np.fromiter((_platforms.code(p.get("platform", "")) for p in products), dtype=np.uint16, count=n),
+            title=_Strings.from_list([p.get("title", "") for p in products]),
+            url=_Urls.from_list([p.get("url", "") for p in products]),
+            image_url=_Urls.from_list([p.get("image_url", "") for p in products]),
+            offers=offers,
+        )
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        if i < 0:
+            i += len(self)
+        product = {
+            "id": f"P{i + 1}",
+            "title": self.title[i],
+            "price": float(self.price[i]),
+            "image_url": self.image_url[i],
+            "url": self.url[i],
+            "platform": _platforms.value(int(self.platform[i])),
+            "quantity": int(self.quantity[i]),
+            "unit_price": float(self.unit_price[i]),
+        }
+        if i in self.offers:
+            product["offers"] = self.offers[i]
+        return product
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def offer(self, i: int) -> Dict[str, Any]:
+        """第 i 列作為其他賣場時的精簡資訊（平台、價格、網址）"""
+        return {"platform": _platforms.value(int(self.platform[i])), "price": float(self.price[i]), "url": self.url[i]}
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return list(self)
+
+    @property
+    def titles(self) -> List[str]:
+        return self.title.tolist()
+
+    @property
+    def nbytes(self) -> int:
+        """批次佔用的大約位元組數（用於 session 記憶體估算）"""
+        arrays = self.price.nbytes + self.quantity.nbytes + self.unit_price.nbytes + self.platform.nbytes
+        offers = sum(len(v) for v in self.offers.values()) * 64
+        return arrays + self.title.nbytes + self.url.nbytes + self.image_url.nbytes + offers
+
+    # ---------- 向量化運算（皆回傳新批次） ----------
+
+    def take(self, indices: Sequence[int]) -> "ProductBatch":
+        indices = np.asarray(indices, dtype=np.int64)
+        offers = {}
+        if self.offers:
+            offers = {new: self.offers[old] for new, old in enumerate(indices.tolist()) if old in self.offers}
+        return ProductBatch(
+            price=self.price[indices],
+            quantity=self.quantity[indices],
+            unit_price=self.unit_price[indices],
+            platform=self.platform[indices],
+            title=self.title.take(indices),
+            url=self.url.take(indices),
+            image_url=self.image_url.take(indices),
+            offers=offers,
+        )
+
+    def filter(self, mask: np.ndarray) -> "ProductBatch":
+        return self.take(np.flatnonzero(mask))
+
+    def sort(self, keys: Sequence[str] = ("unit_price", "price")) -> "ProductBatch":
+        """依欄位排序（第一個為主鍵），穩定排序"""
+        # lexsort 以最後一個鍵為主鍵
+        return self.take(np.lexsort([getattr(self, key) for key in reversed(keys)]))
+
+    def with_offers(self, offers: Dict[int, List[Dict]]) -> "ProductBatch":
+        """回傳附上其他賣場資訊的新批次（欄位陣列共用）"""
+        return ProductBatch(self.price, self.quantity, self.unit_price, self.platform,
+                            self.title, self.url, self.image_url, {**self.offers, **offers})
+
+    def rank_by_unit_price(self, max_unit_price: Optional[float] = None) -> "ProductBatch":
+        """計算數量與單價、移除價格異常的商品，並依單價（其次總價）排序
+
+        這裡刻意做完整排序而不是只取前 k 筆：cluster_batch 以每群的第一筆（最便宜者）
+        為代表、其餘併為 offers，需要整個批次依序排好；每次搜尋最多約 150 筆，
+        完整 lexsort 只需數微秒。
+        """
+        if not len(self):
+            return self
+        quantity = np.fromiter((parse_quantity(t) for t in self.title.tolist()), dtype=np.int32, count=len(self))
+        unit_price = np.round(self.price / quantity, 2)
+        mask = self.price > 0
+        if max_unit_price is not None:
+            mask &= unit_price <= max_unit_price
+        batch = ProductBatch(self.price, quantity, unit_price, self.platform, self.title, self.url, self.image_url, self.offers)
+        return batch.filter(mask).sort()
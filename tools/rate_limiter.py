@@ -0,0 +1,59 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlparse
+
+from tracing import metrics
+
+# 每個主機的預設速率（每秒請求數）與可累積的突發量，由行程內所有 session 共用
+DEFAULT_RATE = float(os.environ.get("CRAWL_RATE_PER_HOST", 5))
+DEFAULT_BURST = float(os.environ.get("CRAWL_BURST_PER_HOST", 5))
+
+
+class TokenBucket:
+    """執行緒安全的令牌桶；不同執行緒的事件迴圈（例如瀏覽器池與 agent）共用同一個桶
+
+    取令牌時先預約一個時段（令牌可暫時為負），再於鎖外等待，
+    因此同時到達的請求會依序排開，而不是在鎖上互相阻塞。
+    """
+
+    def __init__(self, rate: float, burst: float, name: str = ""):
+        self.rate = rate
+        self.burst = burst
+        self.name = name
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """取一個令牌，回傳需要等待的秒數"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            metrics.observe("rate_limit_wait_seconds", wait, host=self.name)
+        return wait
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_limiter(url: str) -> TokenBucket:
+    """取得網址所屬主機的共用令牌桶"""
+    host = urlparse(url).netloc
+    bucket = _buckets.get(host)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.setdefault(host, TokenBucket(DEFAULT_RATE, DEFAULT_BURST, host))
+    return bucket
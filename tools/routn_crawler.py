@@ -1,10 +1,27 @@
-import requests
+import logging
+import aiohttp
+import asyncio
 import json
+import os
 import time
-from typing import List, Dict
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Set
 import uuid
 from urllib.parse import quote  # 新增：用於URL編碼
 
+from http_client import get_async_session, run_standalone
+from pagination import PageResult, merge_batches
+from platform_health import CircuitOpenError, guard
+from rate_limiter import get_limiter
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# 可用環境變數覆寫（例如指向 loadtest 的模擬伺服器）
+SEARCH_URL = os.environ.get("RUTEN_SEARCH_URL", "https://rtapi.ruten.com.tw/api/search/v3/index.php/core/prod")
+DETAIL_URL = os.environ.get("RUTEN_DETAIL_URL", "https://rtapi.ruten.com.tw/api/prod/v2/index.php/prod")
+DETAIL_CONCURRENCY = int(os.environ.get("RUTEN_DETAIL_CONCURRENCY", 3))  # 同時進行的詳情批次數
+
 def get_headers(keyword: str) -> Dict:
     """生成模擬的請求頭，動態設置referer並對關鍵字進行URL編碼"""
     encoded_keyword = quote(keyword)  # 將關鍵字進行URL編碼，例如「天使」變為「%E5%A4%A9%E4%BD%BF」
@@ -18,94 +35,142 @@ def get_headers(keyword: str) -> Dict:
         "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36"
     }
 
-def fetch_product_ids(keyword: str, max_products: int = 60) -> List[str]:
-    """發送第一個fetch請求，獲取商品ID清單，處理分頁"""
-    url = "https://rtapi.ruten.com.tw/api/search/v3/index.php/core/prod"
-    headers = get_headers(keyword)
-    all_ids = []
+def build_search_params(keyword: str, offset: int, limit: int) -> Dict:
+    """建立商品ID搜尋的查詢參數"""
+    return {
+        "q": keyword,
+        "type": "direct",
+        "sort": "rnk/dc",
+        "limit": str(limit),
+        "offset": str(offset)
+    }
+
+def parse_product_details(data: List[Dict]) -> List[Dict]:
+    """解析商品詳情"""
+    return [
+        {
+            "title": item.get("ProdName", ""),
+            "price": float(item.get("PriceRange", [0, 0])[0]),  # 使用價格範圍的最低價
+            "image_url": f"https://a.rimg.com.tw{item.get('Image', '')}",
+            "url": f"https://www.ruten.com.tw/item/show?{item.get('ProdId', '')}",
+            "platform": "露天拍賣"
+        }
+        for item in data
+    ]
+
+def order_by_ids(data: List[Dict], product_ids: List[str]) -> List[Dict]:
+    """依請求的 ID 順序（即搜尋排名）排列詳情 API 的回應"""
+    rank = {product_id: i for i, product_id in enumerate(product_ids)}
+    return sorted(data, key=lambda item: rank.get(str(item.get("ProdId", "")), len(rank)))
+
+def take_new_ids(ids: List[str], seen: Set[str], limit: int) -> List[str]:
+    """依原順序去除重複 ID，最多再收 limit - len(seen) 個"""
+    new_ids = []
+    for product_id in ids:
+        if len(seen) >= limit:
+            break
+        if product_id not in seen:
+            seen.add(product_id)
+            new_ids.append(product_id)
+    return new_ids
+
+async def iter_product_ids_async(keyword: str, headers: Dict, limit: int = 60) -> AsyncIterator[List[str]]:
+    """逐頁產生搜尋結果的商品 ID（依排名）；呼叫端取得足夠的 ID 後即可停止迭代"""
+    session = get_async_session("ruten")
     offset = 1
-    limit = 60
-    
     while True:
-        params = {
-            "q": keyword,
-            "type": "direct",
-            "sort": "rnk/dc",
-            "limit": limit,
-            "offset": offset
-        }
         try:
-            response = requests.get(url, params=params, headers=headers, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            # 提取商品ID
-            ids = [item["Id"] for item in data.get("Rows", [])]
-            all_ids.extend(ids)
-            
-            # 檢查是否達到最大商品數量
-            if len(all_ids) >= max_products:
-                # print(f"已獲取 {len(all_ids)} 個商品ID，停止請求")
-                break 
-            total_rows = data.get("TotalRows", 0)
-            
-            # 檢查是否還有更多數據
-            if offset + limit > total_rows or not ids:
+            await get_limiter(SEARCH_URL).acquire_async()
+            with guard("ruten"), span("platform_page", platform="ruten", endpoint="search") as attrs:
+                attrs["offset"] = offset
+                async with session.get(SEARCH_URL, params=build_search_params(keyword, offset, limit), headers=headers) as response:
+                    response.raise_for_status()
+                    data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError, CircuitOpenError) as e:
+            if offset == 1:
+                raise  # 第一頁就失敗時交給呼叫端重試
+            logger.warning(f"第一個請求失敗: {e}")
+            return
+
+        ids = [item["Id"] for item in data.get("Rows", [])]
+        if ids:
+            yield ids
+        if offset + limit > data.get("TotalRows", 0) or not ids:
+            return
+        offset += len(ids)
+
+async def fetch_detail_batch_async(batch_ids: List[str], batch_no: int, headers: Dict) -> PageResult:
+    """取得一批商品詳情，失敗時記錄並回傳該例外（由 merge_batches 決定是否拋出）"""
+    try:
+        await get_limiter(DETAIL_URL).acquire_async()
+        with guard("ruten"), span("platform_page", platform="ruten", endpoint="detail") as attrs:
+            attrs["batch"] = batch_no
+            async with get_async_session("ruten").get(DETAIL_URL, params={"id": ",".join(batch_ids)}, headers=headers) as response:
+                response.raise_for_status()
+                return parse_product_details(order_by_ids(await response.json(content_type=None), batch_ids))
+    except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError, CircuitOpenError) as e:
+        logger.warning(f"第二個請求失敗 (批次 {batch_no}): {e}")
+        return e
+
+async def fetch_product_ids_async(keyword: str, max_products: int = 60) -> List[str]:
+    """發送第一個fetch請求，獲取商品ID清單（依排名、去重），處理分頁"""
+    seen: Set[str] = set()
+    all_ids = []
+    async with aclosing(iter_product_ids_async(keyword, get_headers(keyword))) as pages:
+        async for ids in pages:
+            all_ids.extend(take_new_ids(ids, seen, max_products))
+            if len(seen) >= max_products:
                 break
-                
-            offset += len(ids)
-            # time.sleep(1)  # 延遲1秒，防止反爬
-        except requests.RequestException as e:
-            print(f"第一個請求失敗: {e}")
-            break
-    
-    return list(set(all_ids))  # 去重
+    return all_ids
 
-def fetch_product_details(product_ids: List[str], keyword: str, batch_size: int = 50) -> List[Dict]:
-    """發送第二個fetch請求，批量獲取商品詳情"""
-    url = "https://rtapi.ruten.com.tw/api/prod/v2/index.php/prod"
+async def fetch_product_details_async(product_ids: List[str], keyword: str, batch_size: int = 50) -> List[Dict]:
+    """發送第二個fetch請求，各批次同時取得商品詳情，結果維持 ID 順序"""
     headers = get_headers(keyword)
-    products = []
-    
-    for i in range(0, len(product_ids), batch_size):
-        batch_ids = product_ids[i:i + batch_size]
-        id_string = ",".join(batch_ids)
-        params = {"id": id_string}
-        
-        try:
-            response = requests.get(url, params=params, headers=headers, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            # 解析商品詳情
-            for item in data:
-                product_info = {
-                    "title": item.get("ProdName", ""),
-                    "price": float(item.get("PriceRange", [0, 0])[0]),  # 使用價格範圍的最低價
-                    "image_url": f"https://a.rimg.com.tw{item.get('Image', '')}",
-                    "url": f"https://www.ruten.com.tw/item/show?{item.get('ProdId', '')}",
-                    "platform": "露天拍賣"
-                }
-                products.append(product_info)
-            
-            # time.sleep(1)  # 延遲1秒
-        except requests.RequestException as e:
-            print(f"第二個請求失敗 (批次 {i//batch_size + 1}): {e}")
-    
-    return products
+    semaphore = asyncio.Semaphore(DETAIL_CONCURRENCY)
 
-def fetch_products(keyword: str, max_products: int = 100) -> List[Dict]:
-    """主函數：爬取露天商品資訊並保存為JSON"""
-    print(f"開始爬取關鍵字: {keyword}")
-    
-    # 第一步：獲取商品ID
-    product_ids = fetch_product_ids(keyword, max_products)
-    # print(f"獲取到 {len(product_ids)} 個商品ID")
+    async def run(batch_ids: List[str], batch_no: int) -> PageResult:
+        async with semaphore:
+            return await fetch_detail_batch_async(batch_ids, batch_no, headers)
 
-    # 第二步：獲取商品詳情
-    products = fetch_product_details(product_ids, keyword)
-    # print(f"獲取到 {len(products)} 個商品詳情")
-    print(f"獲取到 {len(products)} 個露天商品")
+    results = await asyncio.gather(*(
+        run(product_ids[i:i + batch_size], i // batch_size + 1) for i in range(0, len(product_ids), batch_size)
+    ))
+    return merge_batches(results)
+
+async def fetch_products_async(keyword: str, max_products: int = 100, batch_size: int = 50) -> List[Dict]:
+    """爬取露天商品：搜尋頁陸續產生 ID，每湊滿一批就立即送出詳情請求，與後續搜尋頁同時進行"""
+    logger.info(f"開始爬取關鍵字: {keyword}")
+    headers = get_headers(keyword)
+    semaphore = asyncio.Semaphore(DETAIL_CONCURRENCY)
+    seen: Set[str] = set()
+    pending: List[str] = []
+    tasks: List[asyncio.Task] = []
+
+    async def run(batch_ids: List[str], batch_no: int) -> PageResult:
+        async with semaphore:
+            return await fetch_detail_batch_async(batch_ids, batch_no, headers)
+
+    def dispatch(batch_ids: List[str]):
+        tasks.append(asyncio.create_task(run(batch_ids, len(tasks) + 1)))
+
+    try:
+        async with aclosing(iter_product_ids_async(keyword, headers)) as pages:
+            async for ids in pages:
+                pending.extend(take_new_ids(ids, seen, max_products))
+                while len(pending) >= batch_size:
+                    dispatch(pending[:batch_size])
+                    pending = pending[batch_size:]
+                if len(seen) >= max_products:
+                    break
+        if pending:
+            dispatch(pending)
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    products = merge_batches(results)
+    logger.info(f"獲取到 {len(products)} 個露天商品")
     return products[:max_products]
 
 
@@ -114,7 +179,7 @@ def crawl_ruten_products(keyword: str, output_file: str = None, max_products: in
     print(f"開始爬取關鍵字: {keyword}")
     
     # 第一步：獲取商品ID
-    product_ids = fetch_product_ids(keyword,max_products)
+    product_ids = run_standalone(fetch_product_ids_async(keyword, max_products))
     print(f"獲取到 {len(product_ids)} 個商品ID")
     
     if not product_ids:
@@ -122,7 +187,7 @@ def crawl_ruten_products(keyword: str, output_file: str = None, max_products: in
         return
     
     # 第二步：獲取商品詳情
-    products = fetch_product_details(product_ids, keyword)
+    products = run_standalone(fetch_product_details_async(product_ids, keyword))
     print(f"獲取到 {len(products)} 個商品詳情")
     
     # 第三步：整理輸出數據
@@ -1,17 +1,25 @@
-from playwright.async_api import async_playwright, Browser, BrowserContext
+from playwright.async_api import Error as PlaywrightError
 from bs4 import BeautifulSoup
 import asyncio
 import json
 from langchain.tools import Tool
 from abc import ABC, abstractmethod
-import urllib
-import requests
-import sqlite3
+import os
+import urllib.parse
+import aiohttp
 from datetime import datetime
 import re
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 import logging
 
+from browser_pool import BrowserPool, browser_pool
+from html_backend import make_soup, resolve_backend
+from http_client import get_async_session
+from pagination import collect_pages, fetch_pages_async, pages_needed
+from persistence import get_product_db
+from rate_limiter import get_limiter
+from tracing import span
+
 # 設定日誌
 logging.basicConfig(
     level=logging.INFO,
@@ -43,68 +51,36 @@ def retry_async(max_retries: int = 3, delay: float = 1.0):
         return wrapper
     return decorator
 
-def init_db():
-    """初始化 SQLite 資料庫"""
-    conn = sqlite3.connect('products.db')
-    cursor = conn.cursor()
-    
-    # 建立商品表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS products (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        platform TEXT NOT NULL,
-        title TEXT NOT NULL,
-        price TEXT NOT NULL,
-        link TEXT NOT NULL,
-        query TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
 def save_to_db(products: list, query: str):
-    """將商品資料儲存到資料庫"""
-    conn = sqlite3.connect('products.db')
-    cursor = conn.cursor()
-    
-    for product in products:
-        cursor.execute('''
-        INSERT INTO products (platform, title, price, link, query)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (
-            product['platform'],
-            product['title'],
-            product['price'],
-            product['link'],
-            query
-        ))
-    
-    conn.commit()
-    conn.close()
-
-# 初始化資料庫
-init_db()
+    """將商品資料排入背景寫入佇列（由單一寫入執行緒批次寫入 PRODUCT_DB_PATH）"""
+    get_product_db().submit({"query": query, "products": products})
 
 class BaseScraper(ABC):
     """抽象基類，定義電子商務平台爬蟲的通用介面和行為。"""
-    def __init__(self, browser: Browser, context: BrowserContext):
-        self.browser = browser
-        self.context = context
+    # strainer 後端只保留這些 class 的節點；空的話一律建立完整 DOM
+    PARSE_CLASSES: Tuple[str, ...] = ()
+
+    def __init__(self, pool: BrowserPool, html_backend: str = None):
+        self.pool = pool
+        self.html_backend = resolve_backend(html_backend)
         self.platform_name = self.__class__.__name__.replace("Scraper", "")
 
+    def _parse(self, html: str) -> BeautifulSoup:
+        """以設定的後端解析頁面（見 html_backend.BACKENDS）"""
+        return make_soup(html, self.html_backend, self.PARSE_CLASSES)
+
     @retry_async(max_retries=3)
-    async def _get_page_content(self, url: str, selector: str, timeout: int = 30000) -> BeautifulSoup:
-        """通用的頁面內容獲取方法，帶重試機制"""
-        page = await self.context.new_page()
-        try:
-            await page.goto(url, wait_until=selector, timeout=timeout)
-            # await page.wait_for_selector(selector, timeout=10000)
-            content = await page.content()
-            return BeautifulSoup(content, "html.parser")
-        finally:
-            await page.close()
+    async def _get_page_content(self, url: str, ready_selector: str, timeout: int = 30000) -> str:
+        """通用的頁面內容獲取方法，帶重試機制
+
+        向瀏覽器池借用常駐的分頁（圖片、字型與追蹤腳本已被攔截），
+        DOM 載入後只等到 ready_selector 出現，不必等待 networkidle。
+        """
+        async with self.pool.page() as page:
+            with span("browser_page", platform=self.platform_name.lower()):
+                await page.goto(url, wait_until="domcontentloaded", timeout=timeout)
+                await page.wait_for_selector(ready_selector, timeout=timeout)
+                return await page.content()
             
     @abstractmethod
     async def scrape(self, query: str, max_results: int = 5) -> list:
@@ -122,122 +98,117 @@ class BaseScraper(ABC):
 
 # Momo 平台爬蟲
 class MomoScraper(BaseScraper):
-    @retry_async(max_retries=3)
-    async def scrape(self, query: str, max_results: int = 5) -> list:
+    PAGE_SIZE = 20  # Momo 搜尋頁每頁約 20 個商品
+    # 商品列表、查無結果或超出頁數，任一出現即可解析
+    READY_SELECTOR = ".listAreaLi, .noSearchResultWrapper, .adjustmentTextArea"
+    PARSE_CLASSES = ("listAreaLi", "noSearchResultWrapper", "adjustmentTextArea")
+
+    async def _scrape_page(self, base_url: str, page_num: int) -> list:
+        """爬取單一搜尋頁；查無結果或超出最後一頁時回傳空列表"""
+        html = await self._get_page_content(f"{base_url}&curPage={page_num}", self.READY_SELECTOR)
+        return self.parse_page(html)
+
+    def parse_page(self, html: str) -> list:
+        """解析搜尋頁 HTML 為商品列表"""
+        soup = self._parse(html)
+        # 判斷是否有搜尋結果或頁面不存在
+        if soup.select(".noSearchResultWrapper"):
+            logger.info("沒有搜尋結果。請檢查關鍵字是否正確")
+            return []
+        if soup.select(".adjustmentTextArea"):
+            logger.info("商品不足。可能已經到達最後一頁")
+            return []
         results = []
-        page_num = 1
+        for item in soup.select(".listAreaLi"):
+            product = {
+                "title": item.select_one(".prdName").text.strip(),
+                "price": item.select_one(".price b").text.strip(),
+                "link": f"https://www.momoshop.com.tw/goods/GoodsDetail.jsp?i_code={item.select_one('a.goods-img-url')['href'].split('i_code=')[1].split('&')[0]}"
+            }
+            results.append(self._clean_product_data(product))
+        return results
+
+    async def scrape(self, query: str, max_results: int = 5) -> list:
+        """所需頁面以瀏覽器池的分頁同時載入；某頁失敗時保留之前頁面的結果"""
         base_url = f"https://www.momoshop.com.tw/search/searchShop.jsp?keyword={query}"
-        
-        while len(results) < max_results:
-            page_url = f"{base_url}&curPage={page_num}"
-            # print(f"正在爬取 {self.platform_name} 第 {page_num} 頁")
-            try:
-                soup = await self._get_page_content(page_url, "networkidle")
-                # 判斷是否有搜尋結果或頁面不存在
-                noSearch = soup.select(".noSearchResultWrapper")
-                noPage = soup.select(".adjustmentTextArea")
-                if noSearch: 
-                    logger.info("沒有搜尋結果。請檢查關鍵字是否正確")
-                    break
-                if noPage:
-                    logger.info("商品不足。可能已經到達最後一頁")
-                    break
-                items = soup.select(".listAreaLi")
-                for item in items:
-                    product = {
-                        "title": item.select_one(".prdName").text.strip(),
-                        "price": item.select_one(".price b").text.strip(),
-                        "link": f"https://www.momoshop.com.tw/goods/GoodsDetail.jsp?i_code={item.select_one('a.goods-img-url')['href'].split('i_code=')[1].split('&')[0]}"
-                    }
-                    results.append(self._clean_product_data(product))
-                page_num += 1 # 換頁
-            except Exception as e:
-                logger.error(f"爬取 {self.platform_name} 時發生錯誤: {e}")
-                return []
-            
-        # with open("momo.json", "w", encoding="utf-8") as f:
-        #     json.dump(results[:max_results], f, ensure_ascii=False, indent=2)
-        # print(f"{self.platform_name}資料已儲存到{self.platform_name}.json")
-        return results[:max_results]
+        pages = await fetch_pages_async(
+            lambda page_num: self._scrape_page(base_url, page_num),
+            pages_needed(max_results, self.PAGE_SIZE),
+            self.PAGE_SIZE,
+            errors=(PlaywrightError, AttributeError, IndexError, KeyError, TypeError)
+        )
+        return collect_pages(pages, self.PAGE_SIZE)[:max_results]
 
 # PChome 平台爬蟲
 class PChomeScraper(BaseScraper):
-    @retry_async(max_retries=3)
+    PAGE_SIZE = 20  # PChome 搜尋 API 每頁 20 個商品
+    SEARCH_URL = os.environ.get("PCHOME_SEARCH_URL", "https://ecshweb.pchome.com.tw/search/v3.3/all/results")
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0',
+        'Referer': 'https://shopping.pchome.com.tw/'
+    }
+
+    async def _scrape_page(self, query: str, page: int) -> list:
+        """抓取單一頁（共用的 aiohttp session，逾時見 http_client）"""
+        await get_limiter(self.SEARCH_URL).acquire_async()
+        params = {"q": query, "page": str(page), "sort": "rnk/dc"}
+        async with get_async_session("pchome").get(self.SEARCH_URL, params=params, headers=self.HEADERS) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        return [
+            self._clean_product_data({
+                "title": item.get("name", ""),
+                "price": str(item.get("price", "")),
+                "link": f"https://24h.pchome.com.tw/prod/{item.get('Id')}"
+            })
+            for item in data.get('prods') or []
+        ]
+
     async def scrape(self, query: str, max_results: int = 5) -> list:
-        keyword_encoded = urllib.parse.quote(query)
-        headers = {
-            'User-Agent': 'Mozilla/5.0',
-            'Referer': 'https://shopping.pchome.com.tw/'
-        }
+        """所需頁面同時抓取（每波最多 PAGE_CONCURRENCY 頁）；某頁失敗時保留之前頁面的結果"""
+        pages = await fetch_pages_async(
+            lambda page: self._scrape_page(query, page),
+            pages_needed(max_results, self.PAGE_SIZE),
+            self.PAGE_SIZE,
+            errors=(aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError)
+        )
+        return collect_pages(pages, self.PAGE_SIZE)[:max_results]
 
-        results = []
-        page = 1
-
-        while len(results) < max_results:
-            url = f'https://ecshweb.pchome.com.tw/search/v3.3/all/results?q={keyword_encoded}&page={page}&sort=rnk/dc'
-            try:
-                response = requests.get(url, headers=headers)
-                data = response.json()
-                items = data.get('prods', [])
-
-                if not items:
-                    break
-
-                for item in items:
-                    product = {
-                        "title": item.get("name", ""),
-                        "price": str(item.get("price", "")),
-                        "link": f"https://24h.pchome.com.tw/prod/{item.get('Id')}"
-                    }
-                    results.append(self._clean_product_data(product))
-
-                # print(f"已抓取第 {page} 頁，累計 {len(results)} 筆")
-                page += 1
-            except Exception as e:
-                logger.error(f"爬取 {self.platform_name} 時發生錯誤: {e}")
-                break
-
-        # # 儲存 JSON
-        # with open("pchome.json", 'w', encoding='utf-8') as f:
-        #     json.dump(results[:max_results], f, ensure_ascii=False, indent=2)
-        # print(f"{self.platform_name}資料已儲存到{self.platform_name}.json")
-        return results[:max_results]
-        
 # Yahoo 平台爬蟲
 class YahooScraper(BaseScraper):
-    # 使用 requests 來處理 Yahoo 的 GraphQL API
-    @retry_async(max_retries=3)
-    async def scrape(self, query: str, max_results: int = 5) -> list:
-        results = []
-        page_num = 1
-        encoded_keyword = urllib.parse.quote(query)
-        url = "https://graphql.ec.yahoo.com/graphql"
+    # 使用共用的 aiohttp session 呼叫 Yahoo 的 GraphQL API
+    PAGE_SIZE = 60
+    GRAPHQL_URL = os.environ.get("YAHOO_GRAPHQL_URL", "https://graphql.ec.yahoo.com/graphql")
 
-        headers = {
+    @staticmethod
+    def _headers(query: str) -> Dict[str, str]:
+        return {
             "accept": "*/*",
             "content-type": "application/json",
             "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
-            "referer": f"https://tw.buy.yahoo.com/search/product?p={encoded_keyword}",
+            "referer": f"https://tw.buy.yahoo.com/search/product?p={urllib.parse.quote(query)}",
             "origin": "https://tw.buy.yahoo.com",
         }
-        
-        payload = {
+
+    @staticmethod
+    def _payload(query: str, page: int, page_size: int) -> Dict[str, Any]:
+        return {
             "variables": {
-            "property": "sas",
-            "p": f"{query}",
-            "cid": "0",
-            "pg": "1",
-            "psz": f"{max_results}",
-            "qt": "product",
-            "sort": "rel",
-            "isTestStoreIncluded": "0",
-            "spaceId": 152989812,
-            "source": "pc",
-            "showMoreCluster": "0",
-            "searchTarget": "ecItem",
-            "isStoreSearch": 0,
-            "isShoppingStoreSearch": 0
-        },
+                "property": "sas",
+                "p": f"{query}",
+                "cid": "0",
+                "pg": str(page),
+                "psz": str(page_size),
+                "qt": "product",
+                "sort": "rel",
+                "isTestStoreIncluded": "0",
+                "spaceId": 152989812,
+                "source": "pc",
+                "showMoreCluster": "0",
+                "searchTarget": "ecItem",
+                "isStoreSearch": 0,
+                "isShoppingStoreSearch": 0
+            },
             "extensions": {
                 "persistedQuery": {
                     "version": 1,
@@ -245,27 +216,36 @@ class YahooScraper(BaseScraper):
                 }
             }
         }
-        
-        try:
-            session = requests.Session()
-            res = session.post(url, headers=headers, json=payload)
-            data = res.json()
-            for item in data["data"]["getUther"]["hits"]:
-                product = {
-                    "title": item.get("ec_title", "N/A"),
-                    "price": item.get("ec_price", "N/A"),
-                    "link": item.get("ec_item_url", "N/A")
-                }
-                results.append(self._clean_product_data(product))
-        except Exception as e:
-            logger.error(f"爬取 {self.platform_name} 時發生錯誤: {e}")
-            
-        # with open("yahoo.json", 'w', encoding='utf-8') as f:
-        #     json.dump(results, f, ensure_ascii=False, indent=2)
-        # print(f"{self.platform_name}資料已儲存到{self.platform_name}.json")
-        return results[:max_results]
 
-async def create_scraper(platform: str, browser: Browser, context: BrowserContext) -> BaseScraper:
+    async def _scrape_page(self, query: str, page: int, page_size: int) -> list:
+        """抓取單一頁（共用的 aiohttp session，逾時見 http_client）"""
+        await get_limiter(self.GRAPHQL_URL).acquire_async()
+        async with get_async_session("yahoo").post(
+            self.GRAPHQL_URL, json=self._payload(query, page, page_size), headers=self._headers(query)
+        ) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        return [
+            self._clean_product_data({
+                "title": item.get("ec_title", "N/A"),
+                "price": str(item.get("ec_price", "N/A")),
+                "link": item.get("ec_item_url", "N/A")
+            })
+            for item in data["data"]["getUther"]["hits"]
+        ]
+
+    async def scrape(self, query: str, max_results: int = 5) -> list:
+        """結果不多時一次取回；超過一頁時所需頁面同時抓取"""
+        page_size = min(max_results, self.PAGE_SIZE)
+        pages = await fetch_pages_async(
+            lambda page: self._scrape_page(query, page, page_size),
+            pages_needed(max_results, page_size),
+            page_size,
+            errors=(aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError, KeyError, TypeError)
+        )
+        return collect_pages(pages, page_size)[:max_results]
+
+async def create_scraper(platform: str, pool: BrowserPool, html_backend: str = None) -> BaseScraper:
     """工廠方法，根據平台名稱創建對應的爬蟲實例。"""
     scrapers = {
         "momo": MomoScraper,
@@ -275,50 +255,49 @@ async def create_scraper(platform: str, browser: Browser, context: BrowserContex
     scraper_class = scrapers.get(platform.lower())
     if not scraper_class:
         raise ValueError(f"不支援的平台: {platform}")
-    return scraper_class(browser, context)
+    return scraper_class(pool, html_backend)
+
+async def scrape_ecommerce(query: str, platforms: list = None, max_results: int = 30, pool: BrowserPool = None) -> str:
+    """爬取多個電子商務平台的產品資料，並返回合併的 JSON 結果。
 
-async def scrape_ecommerce(query: str, platforms: list = None, max_results: int = 30) -> str:
-    """爬取多個電子商務平台的產品資料，並返回合併的 JSON 結果。"""
+    必須在瀏覽器池的事件迴圈中執行（browser_pool.run / browser_pool.arun）；
+    瀏覽器常駐於池中，查詢之間不再重新啟動。
+    """
     logger.info(f"開始爬取關鍵字：{query}")
     if platforms is None:
         platforms = ["momo", "pchome", "yahoo"]
-    user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(user_agent=user_agent)
-        try:
-            # 並行執行所有平台的爬蟲
-            scrapers = [await create_scraper(platform, browser, context) for platform in platforms]
-            tasks = [scraper.scrape(query, max_results) for scraper in scrapers]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # 合併結果
-            combined_results = []
-            for platform, result in zip(platforms, results):
-                if isinstance(result, Exception):
-                    logger.error(f"爬取 {platform} 時發生錯誤: {result}")
-                    continue
-                combined_results.extend(result)
-            
-            # 儲存到資料庫
-            save_to_db(combined_results, query)
-            logger.info(f"已將 {len(combined_results)} 筆商品資料儲存到資料庫")
-            
-            # 轉換為 JSON
-            return json.dumps({"query": query, "results": combined_results}, ensure_ascii=False, indent=2)
-        finally:
-            await browser.close()
+    pool = pool or browser_pool
+    # 並行執行所有平台的爬蟲
+    scrapers = [await create_scraper(platform, pool) for platform in platforms]
+    tasks = [scraper.scrape(query, max_results) for scraper in scrapers]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    # 合併結果
+    combined_results = []
+    for platform, result in zip(platforms, results):
+        if isinstance(result, Exception):
+            logger.error(f"爬取 {platform} 時發生錯誤: {result}")
+            continue
+        combined_results.extend(result)
+
+    # 儲存到資料庫（背景寫入）
+    save_to_db(combined_results, query)
+    logger.info(f"已將 {len(combined_results)} 筆商品資料排入資料庫寫入佇列")
+
+    # 轉換為 JSON
+    return json.dumps({"query": query, "results": combined_results}, ensure_ascii=False, indent=2)
 
-# LangChain Tool
+# LangChain Tool（協程交給瀏覽器池常駐的事件迴圈執行）
 ecommerce_tool = Tool(
     name="EcommerceScraper",
-    func=lambda query: asyncio.run(scrape_ecommerce(query)),
+    func=lambda query: browser_pool.run(scrape_ecommerce(query)),
+    coroutine=lambda query: browser_pool.arun(scrape_ecommerce(query)),
     description="從台灣電商平台（Momo、PChome、Yahoo）爬取產品資料。輸入：產品查詢字串（例如「無線滑鼠」）。輸出：包含產品名稱、價格、連結和平台的 JSON 字串。"
 )
 
 if __name__ == "__main__":
     query = "洗衣機"
-    result = asyncio.run(scrape_ecommerce(query))
+    result = browser_pool.run(scrape_ecommerce(query))
     with open("ecommerce_results.json", "w", encoding="utf-8") as f:
         f.write(result)
     print("測試已完成。")
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from tracing import metrics
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_PATH = os.path.join(PROJECT_ROOT, "data", "search_cache.db")
+
+# 各平台的 (軟 TTL, 硬 TTL)（秒）：超過軟 TTL 仍直接回傳並於背景更新，超過硬 TTL 視為未命中
+DEFAULT_TTLS: Dict[str, Tuple[float, float]] = {
+    "pchome": (600, 6 * 3600),
+    "yahoo": (600, 6 * 3600),
+    "ruten": (300, 3 * 3600),
+}
+
+FRESH, STALE, MISS = "fresh", "stale", "miss"
+
+
+def normalize_keyword(keyword: str) -> str:
+    """全形轉半形、忽略大小寫與多餘空白，讓相同的搜尋共用快取"""
+    return " ".join(unicodedata.normalize("NFKC", keyword).lower().split())
+
+
+class SearchCache:
+    """關鍵字層級的搜尋結果快取：記憶體 LRU + SQLite，支援 stale-while-revalidate
+
+    以 (平台, 正規化關鍵字) 為鍵。每個平台可設定軟/硬 TTL
+    （環境變數 SEARCH_CACHE_TTL_PCHOME=600,21600 這類格式）。
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_memory_entries: int = 512,
+                 ttls: Dict[str, Tuple[float, float]] = None):
+        self.db_path = db_path or os.environ.get("SEARCH_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_memory_entries = max_memory_entries
+        self.ttls = dict(ttls or DEFAULT_TTLS)
+        for platform in list(self.ttls):
+            override = os.environ.get(f"SEARCH_CACHE_TTL_{platform.upper()}")
+            if override:
+                soft, _, hard = override.partition(",")
+                self.ttls[platform] = (float(soft), float(hard or soft))
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[List[Dict], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._tasks = set()
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_cache (
+            platform TEXT NOT NULL,
+            keyword TEXT NOT NULL,
+            products TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (platform, keyword)
+        )
+        ''')
+        self._conn.commit()
+
+    def _ttl(self, platform: str) -> Tuple[float, float]:
+        return self.ttls.get(platform, (600, 6 * 3600))
+
+    def _remember(self, key: Tuple[str, str], products: List[Dict], fetched_at: float):
+        self._memory[key] = (products, fetched_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, platform: str, keyword: str) -> Tuple[List[Dict], str]:
+        """回傳 (商品列表的複本, 狀態)；狀態為 fresh / stale / miss"""
+        key = (platform, normalize_keyword(keyword))
+        soft_ttl, hard_ttl = self._ttl(platform)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self._conn.execute(
+                    "SELECT products, fetched_at FROM search_cache WHERE platform = ? AND keyword = ?", key
+                ).fetchone()
+                if row is not None:
+                    entry = (json.loads(row[0]), row[1])
+                    self._remember(key, *entry)
+            else:
+                self._memory.move_to_end(key)
+        if entry is None or now - entry[1] > hard_ttl:
+            state, products = MISS, []
+        else:
+            state = FRESH if now - entry[1] <= soft_ttl else STALE
+            # 呼叫端會替商品加上編號等欄位，回傳複本避免不同 session 互相影響
+            products = [dict(product) for product in entry[0]]
+        metrics.inc("search_cache_lookups_total", platform=platform, state=state)
+        return products, state
+
+    def set(self, platform: str, keyword: str, products: List[Dict]):
+        key = (platform, normalize_keyword(keyword))
+        now = time.time()
+        stored = [dict(product) for product in products]
+        with self._lock:
+            self._remember(key, stored, now)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (platform, keyword, products, fetched_at) VALUES (?, ?, ?, ?)",
+                (key[0], key[1], json.dumps(stored, ensure_ascii=False), now)
+            )
+            self._conn.execute(
+                "DELETE FROM search_cache WHERE platform = ? AND fetched_at < ?", (platform, now - self._ttl(platform)[1])
+            )
+            self._conn.commit()
+
+    async def aget(self, platform: str, keyword: str) -> Tuple[List[Dict], str]:
+        """get 的非同步版本（記憶體未命中時的 SQLite 讀取在執行緒中進行，不阻塞事件迴圈）"""
+        return await asyncio.to_thread(self.get, platform, keyword)
+
+    async def aset(self, platform: str, keyword: str, products: List[Dict]):
+        """set 的非同步版本"""
+        await asyncio.to_thread(self.set, platform, keyword, products)
+
+    def _claim(self, key: Tuple[str, str]) -> bool:
+        """同一個鍵同時只進行一個背景更新"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _release(self, key: Tuple[str, str]):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def arefresh(self, platform: str, keyword: str, fetch: Callable[[], Awaitable[object]]):
+        """在目前事件迴圈排程背景更新；fetch 負責把結果寫入快取"""
+        key = (platform, normalize_keyword(keyword))
+        if not self._claim(key):
+            return
+
+        async def run():
+            try:
+                await fetch()
+            except Exception as e:
+                logger.warning(f"背景更新 {platform}「{keyword}」失敗：{e}")
+            finally:
+                self._release(key)
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM search_cache")
+            self._conn.commit()
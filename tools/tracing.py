@@ -0,0 +1,196 @@
+import bisect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# 延遲直方圖的桶界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """固定桶界的延遲直方圖，另保留最近的樣本以估算百分位數"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, reservoir: int = 2048):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.samples: deque = deque(maxlen=reservoir)
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": round(self.percentile(0.50), 6),
+            "p95": round(self.percentile(0.95), 6),
+            "p99": round(self.percentile(0.99), 6),
+        }
+
+
+class MetricsRegistry:
+    """行程內共用的指標登錄表（直方圖、計數器、量測值）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+
+    @staticmethod
+    def _key(labels: Dict[str, Any]) -> LabelKey:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = self._key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = self._key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[self._key(labels)] = value
+
+    def percentile(self, name: str, q: float, min_count: int = 1, **labels) -> Optional[float]:
+        """查詢某個直方圖的百分位數；樣本數不足 min_count 時回傳 None"""
+        with self._lock:
+            hist = self._histograms.get(name, {}).get(self._key(labels))
+            if hist is None or len(hist.samples) < min_count:
+                return None
+            return hist.percentile(q)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """以 JSON 友善的格式回傳所有指標（含 p50/p95/p99）"""
+        with self._lock:
+            return {
+                "histograms": {
+                    name: [{"labels": dict(key), **hist.snapshot()} for key, hist in series.items()]
+                    for name, series in self._histograms.items()
+                },
+                "counters": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "gauges": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._gauges.items()
+                },
+            }
+
+    def render_prometheus(self) -> str:
+        """輸出 Prometheus 文字格式"""
+        def fmt(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = key + extra
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines: List[str] = []
+        with self._lock:
+            for name, series in self._histograms.items():
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.bucket_counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{fmt(key, (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{fmt(key, (('le', '+Inf'),))} {hist.count}")
+                    lines.append(f"{name}_sum{fmt(key)} {hist.sum}")
+                    lines.append(f"{name}_count{fmt(key)} {hist.count}")
+            for name, series in self._counters.items():
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{name}{fmt(key)} {value}" for key, value in series.items())
+            for name, series in self._gauges.items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{fmt(key)} {value}" for key, value in series.items())
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+
+class Trace:
+    """單一請求的追蹤紀錄，收集該請求內所有 span"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return sorted(self.spans, key=lambda s: s["start_ms"])
+
+
+metrics = MetricsRegistry()
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def start_trace() -> Iterator[Trace]:
+    """開始一個請求層級的追蹤；範圍內（含建立的子任務）的 span 都會被記錄"""
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **labels) -> Iterator[Dict[str, Any]]:
+    """計時一段程式，結果寫入 `{name}_seconds` 直方圖與目前的請求追蹤
+
+    labels 作為指標標籤；yield 出的 dict 可再補充屬性（例如 token 數、重試次數），
+    這些屬性只記錄在追蹤中，不會成為指標標籤。
+    """
+    attrs: Dict[str, Any] = {}
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attrs
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe(f"{name}_seconds", duration, **labels)
+        if error:
+            metrics.inc(f"{name}_errors_total", **labels)
+        trace = _current_trace.get()
+        if trace is not None:
+            record = {
+                "name": name,
+                **labels,
+                "start_ms": round((start - trace.start) * 1000, 2),
+                "duration_ms": round(duration * 1000, 2),
+                **attrs,
+            }
+            if error:
+                record["error"] = error
+            trace.spans.append(record)
@@ -0,0 +1,61 @@
+import re
+from functools import lru_cache
+from typing import Dict
+
+# 中文數字（標題中常見「三入」「兩盒」「十二包」）
+_CN_DIGITS = {"零": 0, "一": 1, "二": 2, "兩": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_NUMBER = r"(\d+|[一二兩三四五六七八九十]+)"
+
+# 包裝數量單位：「12入」「10包」「3入組」「24罐」「6瓶」...
+_PACK_UNITS = "入|包|袋|罐|瓶|盒|捲|卷|串|件|支|片|顆|個|組|箱|雙|條"
+_PACK_PATTERN = re.compile(_NUMBER + r"\s*(" + _PACK_UNITS + r")")
+# 乘數：「6入x3」「*6」「X 2」「×4」（後面緊接包裝單位者已由 _PACK_PATTERN 計入）；
+# 前面緊接英數字的是型號或尺寸（「M3x10」「30x40」），不是乘數
+_MULTIPLIER_PATTERN = re.compile(r"(?<![0-9A-Za-z])[xX*×]\s*(\d+)(?![\dA-Za-z]|\s*(" + _PACK_UNITS + r"))")
+# 「共24入」直接標示總數
+_TOTAL_PATTERN = re.compile(r"共\s*" + _NUMBER + r"\s*(" + _PACK_UNITS + r")")
+# 不是數量的規格，先移除避免誤判（例如「100抽」「500ml」「3入」前的容量）
+_SPEC_PATTERN = re.compile(r"\d+(\.\d+)?\s*(抽|ml|ML|mL|g|G|kg|KG|公斤|公克|克|L|公升|吋|寸|cm|mm|W|mAh|GB|TB|G)(?![A-Za-z])")
+
+# 超過這個數量多半是規格或型號，而非包裝數
+MAX_QUANTITY = 500
+
+
+def _parse_number(text: str) -> int:
+    if text.isdigit():
+        return int(text)
+    # 支援「十」「十二」「二十」「二十四」
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        return (_CN_DIGITS.get(tens, 1) if tens else 1) * 10 + (_CN_DIGITS.get(ones, 0) if ones else 0)
+    return _CN_DIGITS.get(text, 0)
+
+
+@lru_cache(maxsize=8192)
+def parse_quantity(title: str) -> int:
+    """從商品標題解析包裝數量，無法判斷時回傳 1
+
+    規則：
+    - 「共24入」直接視為總數
+    - 否則取最大的包裝數量；重複出現的同一數字（「6入組 (6入)」「10包/串」）只算一次
+    - 第二大的數量單位不同時視為巢狀包裝再相乘（「12包x6串」為 72）
+    - 乘上緊接在包裝數或空白後的「x3」這類乘數；「100抽」「500ml」等規格不計入數量
+    """
+    text = _SPEC_PATTERN.sub(" ", title)
+    total = _TOTAL_PATTERN.search(text)
+    if total and 1 <= _parse_number(total.group(1)) <= MAX_QUANTITY * 10:
+        return _parse_number(total.group(1))
+    units: Dict[int, str] = {}  # 數量 -> 第一次出現的單位
+    for m in _PACK_PATTERN.finditer(text):
+        count = _parse_number(m.group(1))
+        if 1 <= count <= MAX_QUANTITY:
+            units.setdefault(count, m.group(2))
+    counts = sorted(units, reverse=True)
+    quantity = counts[0] if counts else 1
+    if len(counts) >= 2 and counts[1] > 1 and units[counts[1]] != units[counts[0]]:
+        quantity *= counts[1]
+    for m in _MULTIPLIER_PATTERN.finditer(text):
+        multiplier = int(m.group(1))
+        if 1 < multiplier <= MAX_QUANTITY:
+            quantity *= multiplier
+    return max(1, min(quantity, MAX_QUANTITY * 10))
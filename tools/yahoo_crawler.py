@@ -1,11 +1,25 @@
-import requests
+import logging
+import aiohttp
+import asyncio
 import json
+import os
 import time
 from typing import List, Dict
 import uuid
 from urllib.parse import quote
 from datetime import datetime
 
+from http_client import get_async_session, run_standalone
+from pagination import collect_pages, fetch_pages_async, pages_needed
+from platform_health import CircuitOpenError, guard
+from rate_limiter import get_limiter
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# 可用環境變數覆寫（例如指向 loadtest 的模擬伺服器）
+GRAPHQL_URL = os.environ.get("YAHOO_GRAPHQL_URL", "https://graphql.ec.yahoo.com/graphql")
+
 def get_headers(keyword: str) -> Dict:
     """生成模擬的請求頭，動態設置referrer並對關鍵字進行URL編碼"""
     encoded_keyword = quote(keyword)
@@ -23,85 +37,75 @@ def get_headers(keyword: str) -> Dict:
         "referrer": f"https://tw.buy.yahoo.com/search/product?p={encoded_keyword}"
     }
 
-def fetch_products(keyword: str, max_products: int = 100, page_size: int = 60) -> List[Dict]:
-    """發送GraphQL請求，獲取商品清單，處理分頁"""
-    url = "https://graphql.ec.yahoo.com/graphql"
-    headers = get_headers(keyword)
-    products = []
-    page = 1
-    
-    while True:
-        # 構建GraphQL請求體
-        payload = {
-            "variables": {
-                "property": "sas",
-                "p": keyword,
-                "cid": "0",
-                "pg": str(page),
-                "psz": str(page_size),
-                "qt": "product",
-                "sort": "rel",
-                "isTestStoreIncluded": "0",
-                "spaceId": 152989812,
-                "source": "pc",
-                "showMoreCluster": "0",
-                "searchTarget": "ecItem",
-                "isStoreSearch": 0,
-                "isShoppingStoreSearch": 0
-            },
-            "extensions": {
-                "persistedQuery": {
-                    "version": 1,
-                    "sha256Hash": "9e8c95a7bd216439855a6dcb580387b180713a20260a89c26096fbe4dd30133f"
-                }
+def build_payload(keyword: str, page: int, page_size: int) -> Dict:
+    """構建指定頁數的GraphQL請求體"""
+    return {
+        "variables": {
+            "property": "sas",
+            "p": keyword,
+            "cid": "0",
+            "pg": str(page),
+            "psz": str(page_size),
+            "qt": "product",
+            "sort": "rel",
+            "isTestStoreIncluded": "0",
+            "spaceId": 152989812,
+            "source": "pc",
+            "showMoreCluster": "0",
+            "searchTarget": "ecItem",
+            "isStoreSearch": 0,
+            "isShoppingStoreSearch": 0
+        },
+        "extensions": {
+            "persistedQuery": {
+                "version": 1,
+                "sha256Hash": "9e8c95a7bd216439855a6dcb580387b180713a20260a89c26096fbe4dd30133f"
             }
         }
-        
-        try:
-            response = requests.post(url, json=payload, headers=headers, timeout=10)
+    }
+
+def parse_products(data: Dict) -> List[Dict]:
+    """從GraphQL回應提取商品數據"""
+    hits = data.get("data", {}).get("getUther", {}).get("hits", [])
+    return [
+        {
+            "title": item.get("ec_title", ""),
+            "price": float(item.get("ec_price", 0)),
+            "image_url": item.get("ec_image", ""),
+            "url": item.get("ec_item_url", ""),
+            "platform": "Yahoo購物"
+        }
+        for item in hits
+    ]
+
+async def fetch_page_async(keyword: str, page: int, page_size: int, headers: Dict) -> List[Dict]:
+    """抓取單一頁商品（先向主機的令牌桶取得配額）"""
+    await get_limiter(GRAPHQL_URL).acquire_async()
+    with guard("yahoo"), span("platform_page", platform="yahoo") as attrs:
+        attrs["page"] = page
+        async with get_async_session("yahoo").post(GRAPHQL_URL, json=build_payload(keyword, page, page_size), headers=headers) as response:
             response.raise_for_status()
-            data = response.json()
-            
-            # 提取商品數據
-            hits = data.get("data", {}).get("getUther", {}).get("hits", [])
-            if not hits:
-                print(f"第 {page} 頁無數據，停止爬取")
-                break
-                
-            for item in hits:
-                product_info = {
-                    "title": item.get("ec_title", ""),
-                    "price": float(item.get("ec_price", 0)),
-                    "image_url": item.get("ec_image", ""),
-                    "url": item.get("ec_item_url", ""),
-                    "platform": "Yahoo購物"
-                }
-                products.append(product_info)
-            
-            # 檢查是否達到最大商品數量
-            if len(products) >= max_products:
-                # print(f"已獲取 {len(products)} 個商品，達到最大數量限制")
-                break
-                
-            # 若當前頁商品數少於page_size，無更多數據
-            if len(hits) < page_size:
-                print(f"第 {page} 頁僅 {len(hits)} 個商品，無更多數據")
-                break
-                
-            page += 1
-            time.sleep(1)  # 延遲1秒，防止反爬
-        except requests.RequestException as e:
-            print(f"請求第 {page} 頁失敗: {e}")
-            break
-    print(f"獲取到 {len(products)} 個Yahoo商品")
-    return products[:max_products]  # 確保不超過最大數量
+            return parse_products(await response.json(content_type=None))
+
+async def fetch_products_async(keyword: str, max_products: int = 100, page_size: int = 60) -> List[Dict]:
+    """發送請求獲取商品清單，所需頁面同時抓取（共用的 aiohttp session，速率由主機的令牌桶控制）"""
+    headers = get_headers(keyword)
+    results = await fetch_pages_async(
+        lambda page: fetch_page_async(keyword, page, page_size, headers),
+        pages_needed(max_products, page_size),
+        page_size,
+        errors=(aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError, CircuitOpenError)
+    )
+    products = collect_pages(results, page_size)
+    logger.info(f"獲取到 {len(products)} 個Yahoo商品")
+    return products[:max_products]
 
 def crawl_yahoo_products(keyword: str, output_file: str = None, max_products: int = 100) -> None:
     """主函數：爬取Yahoo商品資訊並保存為JSON"""
     print(f"開始爬取關鍵字: {keyword}")
     
     # 獲取商品詳情
-    products = fetch_products(keyword, max_products)
+    products = run_standalone(fetch_products_async(keyword, max_products))
     print(f"獲取到 {len(products)} 個商品")
     
     if not products: